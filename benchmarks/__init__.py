@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The library lives under src/ and is not installed as a package, so make it importable for the runner
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
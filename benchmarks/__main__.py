@@ -0,0 +1,59 @@
+"""
+Runs the adapter and builder benchmarks and writes the results as JSON.
+
+    python -m benchmarks --target fake --output bench_fake.json
+    python -m benchmarks --target mongo --uri mongodb://localhost:27017 --output bench_mongo.json
+    python -m benchmarks.compare bench_old.json bench_new.json
+
+The fake target swaps the adapter's spawner for in-process collections, so it measures library overhead only.
+Unset MONGO_REPLICA_SET for the fake target; begin_transaction needs a real server to open sessions.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import sys
+from mongo_helper import __version__
+from .suite import BenchmarkSuite
+
+
+def parse_list(value, cast=int):
+    return tuple(cast(item) for item in value.split(',') if item)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('--target', choices=('fake', 'mongo'), default='fake')
+    parser.add_argument('--uri', default=None, help='MongoDB uri for the mongo target, localhost when omitted')
+    parser.add_argument('--benchmarks', default=','.join(BenchmarkSuite.BENCHMARKS))
+    parser.add_argument('--sizes', default='100,1000,10000', help='Payload bytes per document')
+    parser.add_argument('--concurrency', default='1,16')
+    parser.add_argument('--ops', type=int, default=1000)
+    parser.add_argument('--seed-documents', type=int, default=1000)
+    parser.add_argument('--output', default='bench_output.json')
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(args.target, args.uri, args.ops, args.seed_documents)
+    results = asyncio.run(suite.run(parse_list(args.benchmarks, str), parse_list(args.sizes),
+                                    parse_list(args.concurrency)))
+    report = {
+        'meta': {
+            'version': __version__,
+            'target': args.target,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'argv': sys.argv[1:],
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for result in results:
+        print(f"{result['benchmark']:<22} size={result['doc_size']:<6} c={result['concurrency']:<3} "
+              f"{result['ops_per_sec']:>10.1f} ops/s  p99={result['p99_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Compares two benchmark result files and exits non-zero when throughput or p99 regressed past the threshold.
+
+    python -m benchmarks.compare bench_old.json bench_new.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as file:
+        report = json.load(file)
+    return {(result['benchmark'], result['target'], result['doc_size'], result['concurrency']): result
+            for result in report['results']}
+
+
+def compare(old, new, threshold) -> list[dict]:
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        throughput = after['ops_per_sec'] / before['ops_per_sec'] if before['ops_per_sec'] else None
+        p99 = after['p99_ms'] / before['p99_ms'] if before['p99_ms'] else None
+        regressed = (throughput is not None and throughput < 1 - threshold) or (p99 is not None and
+                                                                                 p99 > 1 + threshold)
+        rows.append({'key': key, 'throughput_ratio': throughput, 'p99_ratio': p99, 'regressed': regressed})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    rows = compare(load(args.old), load(args.new), args.threshold)
+    for row in rows:
+        benchmark, target, doc_size, concurrency = row['key']
+        flag = 'REGRESSION' if row['regressed'] else ''
+        print(f"{benchmark:<22} {target:<5} size={doc_size:<6} c={concurrency:<3} "
+              f"throughput x{row['throughput_ratio']:.2f}  p99 x{row['p99_ratio']:.2f}  {flag}")
+    return 1 if any(row['regressed'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import contextlib
+import copy
+import itertools
+import bson
+from bson import ObjectId
+from pymongo.results import InsertOneResult, InsertManyResult, UpdateResult, DeleteResult, BulkWriteResult
+
+
+# In-process stand-ins for the motor objects the library touches, so a run measures only library overhead
+
+
+def matches(document, query):
+    for key, condition in (query or {}).items():
+        value = document.get(key)
+        if isinstance(condition, dict) and any(operator.startswith('$') for operator in condition):
+            for operator, operand in condition.items():
+                if operator == '$eq' and value != operand:
+                    return False
+                if operator == '$in' and value not in operand:
+                    return False
+                if operator == '$gt' and not (value is not None and value > operand):
+                    return False
+                if operator == '$exists' and (key in document) != operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(document, projection):
+    if not projection:
+        return copy.deepcopy(document)
+    if any(value for key, value in projection.items() if key != '_id'):
+        result = {key: copy.deepcopy(document[key]) for key in projection if key in document and projection[key]}
+        if projection.get('_id', 1) and '_id' in document:
+            result['_id'] = document['_id']
+        return result
+    return {key: copy.deepcopy(value) for key, value in document.items() if projection.get(key, 1)}
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def limit(self, count):
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents if length is None else self.documents[:length]
+
+    def __aiter__(self):
+        self.iterator = iter(self.documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.documents = {}
+        self.read_concern = type('ReadConcern', (), {'document': {}})()
+        self.codec_options = None
+
+    def with_options(self, codec_options=None, **kwargs):
+        # Shares the stored documents, only the class reads decode into changes
+        view = copy.copy(self)
+        view.codec_options = codec_options
+        return view
+
+    def decode(self, document):
+        if self.codec_options is None:
+            return document
+        return bson.decode(bson.encode(document), codec_options=self.codec_options)
+
+    def store(self, document):
+        document.setdefault('_id', ObjectId())
+        self.documents[document['_id']] = copy.deepcopy(document)
+        return document['_id']
+
+    def matching(self, query):
+        return [document for document in self.documents.values() if matches(document, query)]
+
+    @staticmethod
+    def apply_update(document, update):
+        for key, value in update.get('$set', {}).items():
+            document[key] = value
+        for key, value in update.get('$inc', {}).items():
+            document[key] = document.get(key, 0) + value
+
+    async def insert_one(self, document, session=None):
+        return InsertOneResult(self.store(document), True)
+
+    async def insert_many(self, documents, session=None, **kwargs):
+        return InsertManyResult([self.store(document) for document in documents], True)
+
+    async def find_one(self, query=None, projection=None, session=None, **kwargs):
+        for document in self.documents.values():
+            if matches(document, query):
+                return self.decode(project(document, projection))
+        return None
+
+    def find(self, query=None, projection=None, session=None, limit=0, **kwargs):
+        documents = [self.decode(project(document, projection)) for document in self.matching(query)]
+        return FakeCursor(documents[:limit] if limit else documents)
+
+    async def update_one(self, query, update, upsert=False, session=None):
+        for document in self.documents.values():
+            if matches(document, query):
+                self.apply_update(document, update)
+                return UpdateResult({'n': 1, 'nModified': 1}, True)
+        if upsert:
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            self.apply_update(document, update)
+            return UpdateResult({'n': 0, 'nModified': 0, 'upserted': self.store(document)}, True)
+        return UpdateResult({'n': 0, 'nModified': 0}, True)
+
+    async def update_many(self, query, update, upsert=False, session=None):
+        documents = self.matching(query)
+        for document in documents:
+            self.apply_update(document, update)
+        return UpdateResult({'n': len(documents), 'nModified': len(documents)}, True)
+
+    async def delete_one(self, query, session=None):
+        for document_id, document in self.documents.items():
+            if matches(document, query):
+                del self.documents[document_id]
+                return DeleteResult({'n': 1}, True)
+        return DeleteResult({'n': 0}, True)
+
+    async def delete_many(self, query, session=None):
+        documents = self.matching(query)
+        for document in documents:
+            del self.documents[document['_id']]
+        return DeleteResult({'n': len(documents)}, True)
+
+    async def count_documents(self, query, session=None, skip=0, limit=0, **kwargs):
+        count = max(len(self.matching(query)) - skip, 0)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self):
+        return len(self.documents)
+
+    async def index_information(self):
+        return {'_id_': {'v': 2, 'key': [('_id', 1)]}}
+
+    async def bulk_write(self, requests, ordered=True, session=None):
+        counts = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'nUpserted': 0, 'upserted': [],
+                  'writeErrors': [], 'writeConcernErrors': []}
+        for index, request in enumerate(requests):
+            name = type(request).__name__
+            if name == 'InsertOne':
+                self.store(request._doc)
+                counts['nInserted'] += 1
+            elif name in ('UpdateOne', 'UpdateMany'):
+                result = await (self.update_one if name == 'UpdateOne' else self.update_many)(
+                    request._filter, request._doc, upsert=request._upsert)
+                counts['nMatched'] += result.matched_count
+                counts['nModified'] += result.modified_count
+                if result.upserted_id is not None:
+                    counts['nUpserted'] += 1
+                    counts['upserted'].append({'index': index, '_id': result.upserted_id})
+            elif name in ('DeleteOne', 'DeleteMany'):
+                result = await (self.delete_one if name == 'DeleteOne' else self.delete_many)(request._filter)
+                counts['nRemoved'] += result.deleted_count
+        return BulkWriteResult(counts, True)
+
+    def aggregate(self, pipeline, **kwargs):
+        # Covers the $group / $match shapes used by Mongoom.get_dublicates and remove_dublicates
+        documents = list(self.documents.values())
+        for stage in pipeline:
+            if '$match' in stage:
+                documents = [document for document in documents if matches(document, stage['$match'])]
+            elif '$group' in stage:
+                documents = group(documents, stage['$group'])
+        return FakeCursor(documents)
+
+
+def group_key(document, expression):
+    if isinstance(expression, dict):
+        return tuple((key, group_key(document, value)) for key, value in expression.items())
+    return document.get(expression[1:]) if isinstance(expression, str) else expression
+
+
+def group(documents, spec):
+    groups = {}
+    for document in documents:
+        key = group_key(document, spec['_id'])
+        output = groups.setdefault(key, {'_id': dict(key) if isinstance(key, tuple) else key})
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            operator, operand = next(iter(accumulator.items()))
+            if operator == '$sum':
+                output[field] = output.get(field, 0) + (operand if isinstance(operand, int) else 0)
+            elif operator == '$push':
+                output.setdefault(field, []).append(document.get(operand[1:]))
+    return list(groups.values())
+
+
+class FakeDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+
+class FakeClient:
+    def __init__(self):
+        self.databases = {}
+
+    def get_database(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase(self, name)
+        return self.databases[name]
+
+    __getitem__ = get_database
+
+    def close(self):
+        pass
+
+
+class FakeConsumer:
+    ids = itertools.count()
+
+    def __init__(self, client, selected_database):
+        self.id = next(self.ids)
+        self.async_motor_object = client
+        self.selected_database = selected_database
+        self.pool_key = ('fake', ())
+
+    def get_id(self):
+        return self.id
+
+    def get_async_motor_object(self):
+        return self.async_motor_object
+
+    def consume(self):
+        return self.async_motor_object.get_database(self.selected_database)
+
+    def touch(self):
+        pass
+
+    def in_use(self):
+        return contextlib.nullcontext(self)
+
+
+# Replaces MongoClientSpawner on the adapter so builders get fake consumers
+class FakeSpawner:
+    def __init__(self):
+        self.client = FakeClient()
+        self.clients = {}
+
+    def spawn_consumer(self, db_name, *args, **kwargs):
+        consumer = FakeConsumer(self.client, db_name)
+        self.clients[consumer.get_id()] = consumer
+        return consumer
+
+    def remove_spawned_client(self, consumer):
+        self.clients.pop(consumer.get_id(), None)
+
+    def remove_all_spawned_clients(self):
+        self.clients.clear()
@@ -0,0 +1,44 @@
+"""
+Replays a workload log written by MongoClientAdapter.enable_workload_recorder against a target.
+
+    python -m benchmarks.replay workload.jsonl.gz --uri mongodb://localhost:27017 --speed 2 --concurrency 32
+
+--speed 1 keeps the recorded pacing, --speed N compresses it N times and --speed 0 replays as fast as possible.
+Deletes and update_many calls recorded without capture_values are skipped, since their filters would be rebuilt from
+placeholders; --allow-destructive replays them anyway.
+"""
+import argparse
+import asyncio
+import json
+from mongo_helper.client_adapter import MongoClientAdapter
+from mongo_helper.workload import replay_workload
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replay')
+    parser.add_argument('log')
+    parser.add_argument('--uri', default=None, help='MongoDB uri of the target, localhost when omitted')
+    parser.add_argument('--db', default=None, help='Replay every namespace into this database')
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--allow-destructive', action='store_true',
+                        help='Replay deletes and update_many calls whose filters were not captured')
+    args = parser.parse_args(argv)
+
+    adapter = MongoClientAdapter(is_remote_mode=args.uri is not None, mongo_uri=args.uri)
+    report = asyncio.run(replay_workload(adapter, args.log, args.speed or None, args.concurrency, args.db,
+                                         args.allow_destructive))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    print(f"{report['operations']} operations in {report['elapsed_s']:.1f} s, errors {report['errors']}, "
+          f"skipped {report['skipped']}")
+    for name, replayed in sorted(report['replayed'].items()):
+        recorded = report['recorded'].get(name, {})
+        print(f"{name:<26} n={replayed['count']:<7} p50={replayed['p50_ms']:.2f} p95={replayed['p95_ms']:.2f} "
+              f"p99={replayed['p99_ms']:.2f} ms  (recorded p99={recorded.get('p99_ms', float('nan')):.2f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from pydantic import BaseModel
+from mongo_helper.client_adapter import MongoClientAdapter, Operations
+from mongo_helper.query_builder import AsyncQueryBuilder
+from mongo_helper.query_builder_pydantic import AsyncPydanticQueryBuilder
+from mongohelper.mongom import mongoo_instance
+from .fake import FakeSpawner
+
+
+DATABASE_NAME = 'mongo_helper_bench'
+
+
+class BenchDocument(BaseModel):
+    k: int
+    bucket: int
+    dup: int
+    payload: str
+
+
+def make_document(index, doc_size, duplicates=None):
+    return {'k': index, 'bucket': index % 100, 'dup': index % duplicates if duplicates else index,
+            'payload': 'x' * doc_size}
+
+
+def percentile(latencies, q):
+    if not latencies:
+        return None
+    return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+async def run_concurrently(operation, ops, concurrency) -> tuple[float, list[float]]:
+    # Workers pull indexes from a shared counter so every run issues exactly ops calls
+    latencies = []
+    counter = iter(range(ops))
+
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, sorted(latencies)
+
+
+class BenchmarkSuite:
+    def __init__(self, target='fake', mongo_uri=None, ops=1000, seed_documents=1000):
+        self.target = target
+        self.ops = ops
+        self.seed_documents = seed_documents
+        if target == 'fake':
+            self.adapter = MongoClientAdapter()
+            self.adapter.client_spawner = FakeSpawner()
+            self.adapter.collection_cache.clear()
+        else:
+            self.adapter = MongoClientAdapter(is_remote_mode=mongo_uri is not None, mongo_uri=mongo_uri)
+
+    async def fresh_collection(self, name, doc_size, count=0, duplicates=None):
+        consumer = self.adapter.create_consumer(DATABASE_NAME)
+        collection = consumer.consume()[name]
+        if self.target == 'fake':
+            collection.documents.clear()
+        else:
+            await collection.drop()
+            await collection.create_index('k')
+        self.adapter.close_consumer(consumer)
+        self.adapter.collection_cache.clear()
+        if count:
+            async with AsyncQueryBuilder(self.adapter, DATABASE_NAME, name) as builder:
+                for start in range(0, count, 1000):
+                    await builder.insert_many([make_document(index, doc_size, duplicates)
+                                               for index in range(start, min(start + 1000, count))])
+        return collection
+
+    async def bench_insert_one(self, doc_size, concurrency):
+        await self.fresh_collection('insert_one', doc_size)
+        async with AsyncQueryBuilder(self.adapter, DATABASE_NAME, 'insert_one') as builder:
+            return await run_concurrently(lambda index: builder.insert_one(make_document(index, doc_size)), self.ops,
+                                          concurrency)
+
+    async def bench_insert_many(self, doc_size, concurrency):
+        await self.fresh_collection('insert_many', doc_size)
+        async with AsyncQueryBuilder(self.adapter, DATABASE_NAME, 'insert_many') as builder:
+            return await run_concurrently(
+                lambda index: builder.insert_many([make_document(index * 100 + offset, doc_size)
+                                                   for offset in range(100)]),
+                max(self.ops // 100, 1), concurrency)
+
+    async def bench_find_one(self, doc_size, concurrency):
+        await self.fresh_collection('find_one', doc_size, self.seed_documents)
+        async with AsyncQueryBuilder(self.adapter, DATABASE_NAME, 'find_one') as builder:
+            return await run_concurrently(
+                lambda index: builder.find_one({'k': index % self.seed_documents}, use_cache=False), self.ops,
+                concurrency)
+
+    async def bench_find(self, doc_size, concurrency):
+        await self.fresh_collection('find', doc_size, self.seed_documents)
+        async with AsyncQueryBuilder(self.adapter, DATABASE_NAME, 'find') as builder:
+            return await run_concurrently(
+                lambda index: builder.find({'bucket': index % 100}, use_cache=False), max(self.ops // 10, 1),
+                concurrency)
+
+    async def bench_pydantic_find(self, doc_size, concurrency):
+        await self.fresh_collection('pydantic_find', doc_size, self.seed_documents)
+        async with AsyncPydanticQueryBuilder(self.adapter, DATABASE_NAME, 'pydantic_find', BenchDocument) as builder:
+            return await run_concurrently(lambda index: builder.find({'bucket': index % 100}),
+                                          max(self.ops // 10, 1), concurrency)
+
+    async def bench_pydantic_find_trusted(self, doc_size, concurrency):
+        await self.fresh_collection('pydantic_find', doc_size, self.seed_documents)
+        async with AsyncPydanticQueryBuilder(self.adapter, DATABASE_NAME, 'pydantic_find', BenchDocument,
+                                             trusted=True) as builder:
+            return await run_concurrently(lambda index: builder.find({'bucket': index % 100}),
+                                          max(self.ops // 10, 1), concurrency)
+
+    async def bench_begin_transaction(self, doc_size, concurrency):
+        await self.fresh_collection('transaction', doc_size)
+        consumer = self.adapter.create_consumer(DATABASE_NAME)
+
+        async def transaction(index):
+            operations = [self.adapter.get_transaction_object(consumer, 'transaction', Operations.INSERT_ONE,
+                                                              documents=make_document(index * 10 + offset, doc_size))
+                          for offset in range(10)]
+            return await self.adapter.begin_transaction(consumer, 'transaction', operations)
+
+        try:
+            return await run_concurrently(transaction, max(self.ops // 10, 1), concurrency)
+        finally:
+            self.adapter.close_consumer(consumer)
+
+    async def bench_remove_dublicates(self, doc_size, concurrency):
+        # One pass over a collection where every value of dup appears twice
+        collection = await self.fresh_collection('dublicates', doc_size, self.seed_documents,
+                                                 duplicates=max(self.seed_documents // 2, 1))
+        return await run_concurrently(lambda index: mongoo_instance.remove_dublicates(collection, 'dup'), 1, 1)
+
+    BENCHMARKS = ('insert_one', 'insert_many', 'find_one', 'find', 'pydantic_find', 'pydantic_find_trusted',
+                  'begin_transaction', 'remove_dublicates')
+
+    async def run(self, benchmarks=BENCHMARKS, doc_sizes=(100, 1000, 10000), concurrency_levels=(1, 16)) -> list:
+        results = []
+        for name in benchmarks:
+            for doc_size in doc_sizes:
+                for concurrency in concurrency_levels:
+                    elapsed, latencies = await getattr(self, f'bench_{name}')(doc_size, concurrency)
+                    results.append({
+                        'benchmark': name,
+                        'target': self.target,
+                        'doc_size': doc_size,
+                        'concurrency': concurrency,
+                        'ops': len(latencies),
+                        'seconds': elapsed,
+                        'ops_per_sec': len(latencies) / elapsed if elapsed else None,
+                        'p50_ms': percentile(latencies, 0.5) * 1000,
+                        'p95_ms': percentile(latencies, 0.95) * 1000,
+                        'p99_ms': percentile(latencies, 0.99) * 1000,
+                    })
+        return results
@@ -1,5 +1,7 @@
 from loguru import logger
 from os import getenv
+import asyncio
+import time
 from motor.motor_asyncio import (
     AsyncIOMotorClient,
     AsyncIOMotorDatabase,
@@ -9,6 +11,7 @@ from motor.motor_asyncio import (
 from motor.core import AgnosticCursor
 from functools import wraps
 from typing import Dict, Self
+from mongohelper.parallel_scan import scan_partitions, parallel_scan
 
 
 def singleton(cls):
@@ -99,7 +102,45 @@ class Mongoom:
             logger.error(f"Failed to connect to the database with {str(e)}")
             return False
 
-    async def init_mongoo(self, connection_string: str = None):
+    async def warmup(
+        self, n_connections: int = 10, collections: list[tuple[str, str]] = None
+    ) -> dict:
+        """
+        Opens n_connections pooled connections concurrently and touches the given
+        (db_name, collection_name) pairs. Returns a timing report in milliseconds.
+        """
+        client = self.motor_client
+        report = {"connections": n_connections, "collections": {}}
+        started = time.perf_counter()
+        await client.admin.command("ping")
+        report["server_selection_ms"] = (time.perf_counter() - started) * 1000
+
+        pool_started = time.perf_counter()
+        await asyncio.gather(
+            *(client.admin.command("ping") for _ in range(n_connections))
+        )
+        report["pool_ms"] = (time.perf_counter() - pool_started) * 1000
+
+        for db_name, collection_name in collections or []:
+            coll_started = time.perf_counter()
+            collection = client[db_name][collection_name]
+            await asyncio.gather(
+                collection.find_one({}), collection.index_information()
+            )
+            report["collections"][f"{db_name}.{collection_name}"] = (
+                time.perf_counter() - coll_started
+            ) * 1000
+
+        report["total_ms"] = (time.perf_counter() - started) * 1000
+        logger.info(f"MongoDB pool warmed up in {report['total_ms']:.1f} ms")
+        return report
+
+    async def init_mongoo(
+        self,
+        connection_string: str = None,
+        warmup: int = 0,
+        warmup_collections: list[tuple[str, str]] = None,
+    ):
         if hasattr(self, "mongo_client"):
             logger.warning("There is already an instance of motor client object !")
             return False
@@ -129,6 +170,8 @@ class Mongoom:
             self.initialized = True
             self.motor_client = dbclient
             logger.success(f"self.initialized :{self.initialized}")
+            if warmup:
+                self.warmup_report = await self.warmup(warmup, warmup_collections)
             return True
         raise Exception("Failed to connect to the database!")
 
@@ -169,13 +212,21 @@ class Mongoom:
         return [db[coll_name] for coll_name in coll_names]
 
     @staticmethod
-    async def getTotalDocumentsInDb(mongoo_instance: Self, db_name: str):
+    async def getTotalDocumentsInDb(
+        mongoo_instance: Self, db_name: str, estimate: bool = False
+    ):
         """
         This function will return the total number of documents in the given MongoDB database.
+        With estimate=True the counts come from collection metadata instead of a scan.
         """
         collections = await mongoo_instance.get_all_collections(
             mongoo_instance.get_db(db_name)
         )
+        if estimate:
+            counts = await asyncio.gather(
+                *(coll.estimated_document_count() for coll in collections)
+            )
+            return sum(counts)
         total = 0
         for coll in collections:
             total += await coll.count_documents({})
@@ -197,6 +248,10 @@ class Mongoom:
             return [document async for document in cursor]
         return cursor
 
+    # One implementation shared with AsyncQueryBuilder, see mongohelper.parallel_scan
+    scan_partitions = staticmethod(scan_partitions)
+    parallel_scan = staticmethod(parallel_scan)
+
     @staticmethod
     async def query_with_projection(
         collection: AsyncIOMotorCollection,
@@ -0,0 +1,170 @@
+import asyncio
+import datetime
+import inspect
+from bson import ObjectId
+
+
+def type_alias(value):
+    # The $type alias of a value split points can hold; int, long and double share the number bracket
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    if isinstance(value, datetime.datetime):
+        return "date"
+    return None
+
+
+def comparable_points(values) -> list:
+    # Values of different BSON types do not order against each other, so only the most common type is split on
+    by_type = {}
+    for value in values:
+        alias = type_alias(value)
+        if alias is not None:
+            by_type.setdefault(alias, set()).add(value)
+    if not by_type:
+        return []
+    return sorted(max(by_type.values(), key=len))
+
+
+async def split_points(
+    collection,
+    query: dict,
+    field: str = "_id",
+    partitions: int = 4,
+    method: str = "sample",
+    samples_per_partition: int = 20,
+) -> list:
+    if partitions <= 1:
+        return []
+    if method == "bucket_auto":
+        pipeline = [
+            {"$match": query},
+            {"$bucketAuto": {"groupBy": f"${field}", "buckets": partitions}},
+        ]
+        buckets = await collection.aggregate(pipeline).to_list(length=None)
+        return comparable_points(bucket["_id"]["min"] for bucket in buckets[1:])
+    if method != "sample":
+        raise ValueError("Split method must be 'sample' or 'bucket_auto'.")
+
+    pipeline = [
+        {"$match": query},
+        {"$sample": {"size": partitions * samples_per_partition}},
+        {"$project": {"_id": 0, "value": f"${field}"}},
+    ]
+    samples = await collection.aggregate(pipeline).to_list(length=None)
+    values = comparable_points(
+        sample["value"] for sample in samples if "value" in sample
+    )
+    if len(values) < partitions:
+        return values[1:]
+    step = len(values) / partitions
+    return sorted({values[int(step * index)] for index in range(1, partitions)})
+
+
+def partition_queries(query: dict, field: str, points: list) -> list[dict]:
+    """
+    Half open ranges between the points, so every document lands in exactly one
+    partition, plus a last partition for null, missing and differently typed
+    values, which range operators never match.
+    """
+    if not points:
+        return [query]
+    bounds = [None, *points, None]
+    conditions = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        condition = {}
+        if lower is not None:
+            condition["$gte"] = lower
+        if upper is not None:
+            condition["$lt"] = upper
+        conditions.append(condition)
+    conditions.append({"$not": {"$type": type_alias(points[0])}})
+
+    queries = []
+    for condition in conditions:
+        if query:
+            queries.append({"$and": [query, {field: condition}]})
+        else:
+            queries.append({field: condition})
+    return queries
+
+
+async def scan_partitions(
+    collection,
+    callback,
+    query: dict = None,
+    partitions: int = 4,
+    field: str = "_id",
+    projection: dict = None,
+    batch_size: int = None,
+    method: str = "sample",
+) -> list[int]:
+    """
+    Splits field into ranges (sampled or $bucketAuto) and scans them concurrently,
+    calling callback(partition, document) for every document; the callback may be
+    a coroutine function. Returns the per partition counts.
+    """
+    query = query or {}
+    points = await split_points(collection, query, field, partitions, method)
+    options = {"batch_size": batch_size} if batch_size else {}
+
+    async def scan(partition: int, range_query: dict) -> int:
+        count = 0
+        async for document in collection.find(range_query, projection, **options):
+            result = callback(partition, document)
+            if inspect.isawaitable(result):
+                await result
+            count += 1
+        return count
+
+    queries = partition_queries(query, field, points)
+    return await asyncio.gather(
+        *(scan(partition, range_query) for partition, range_query in enumerate(queries))
+    )
+
+
+async def parallel_scan(
+    collection,
+    query: dict = None,
+    partitions: int = 4,
+    field: str = "_id",
+    projection: dict = None,
+    batch_size: int = None,
+    method: str = "sample",
+    queue_size: int = 1000,
+):
+    """
+    Merges the concurrent partition cursors of scan_partitions into one async
+    stream. The bounded queue keeps fast partitions from buffering everything.
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    finished = object()
+
+    async def forward(partition: int, document: dict):
+        await queue.put(document)
+
+    async def produce():
+        try:
+            await scan_partitions(
+                collection, forward, query, partitions, field, projection, batch_size, method
+            )
+            await queue.put(finished)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
@@ -5,11 +5,13 @@ __version__ = "0.0.2"
 from .client_adapter import MongoClientAdapter, Operations
 from .query_builder import AsyncQueryBuilder
 from .query_builder_pydantic import AsyncPydanticQueryBuilder
+from .pipeline_builder import Pipeline
 
 __all__ = [
     "MongoClientAdapter",
     "Operations",
     "AsyncQueryBuilder",
+    "Pipeline",
 ]
 
 
@@ -0,0 +1,281 @@
+import asyncio
+import bson
+from bson.errors import InvalidDocument
+from pymongo import InsertOne, UpdateOne, ReplaceOne
+from pymongo.common import validate_is_document_type, validate_is_mapping, validate_ok_for_update
+from pymongo.errors import BulkWriteError, WriteError
+from loguru import logger
+
+
+# Result of one operation that was sent as part of a bulk_write batch
+class BulkOperationResult:
+    def __init__(self, bulk_result=None, inserted_ids=None, upserted_id=None, matched_count=None,
+                 modified_count=None, deleted_count=None):
+        self.bulk_result = bulk_result
+        self.acknowledged = bulk_result.acknowledged if bulk_result is not None else True
+        self.inserted_ids = inserted_ids or []
+        self.inserted_id = self.inserted_ids[0] if len(self.inserted_ids) == 1 else None
+        self.upserted_id = upserted_id
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.deleted_count = deleted_count
+
+
+# Buffers single inserts and upserts and flushes them as one unordered bulk_write
+class WriteCoalescer:
+    def __init__(self, collection, max_batch_size=500, max_delay_ms=5):
+        self.collection = collection
+        self.max_batch_size = max_batch_size
+        self.max_delay_ms = max_delay_ms
+        self.pending = []
+        self.flush_handle = None
+        self.flush_scheduled = False
+        self.flush_tasks = set()
+        self.stats = {'operations': 0, 'batches': 0, 'errors': 0}
+
+    # Requests are validated before they join a batch, so a bad one fails its own caller and not the whole flush
+    async def insert_one(self, document):
+        validate_is_document_type('document', document)
+        return await self.submit(InsertOne(document), document)
+
+    async def upsert_one(self, filter, update):
+        validate_is_mapping('filter', filter)
+        validate_ok_for_update(update)
+        return await self.submit(UpdateOne(filter, update, upsert=True))
+
+    async def submit(self, request, document=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((request, document, future))
+        self.stats['operations'] += 1
+
+        if len(self.pending) >= self.max_batch_size:
+            if not self.flush_scheduled:
+                self.schedule_flush(loop)
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_delay_ms / 1000, self.schedule_flush, loop)
+        return await future
+
+    def schedule_flush(self, loop):
+        self.flush_scheduled = True
+        task = loop.create_task(self.flush())
+        self.flush_tasks.add(task)
+        task.add_done_callback(self.flush_tasks.discard)
+
+    async def flush(self):
+        self.flush_scheduled = False
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        # A flush sends at most max_batch_size requests and leaves the rest to the next one
+        batch, self.pending = self.pending[:self.max_batch_size], self.pending[self.max_batch_size:]
+        if self.pending:
+            loop = asyncio.get_running_loop()
+            if len(self.pending) >= self.max_batch_size:
+                self.schedule_flush(loop)
+            else:
+                self.flush_handle = loop.call_later(self.max_delay_ms / 1000, self.schedule_flush, loop)
+        if not batch:
+            return
+        self.stats['batches'] += 1
+        try:
+            await self.write_batch(batch)
+        except Exception as e:
+            # Nothing awaits the flush task, so an unexpected error still has to reach the callers
+            logger.info(e)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def reject_unencodable(self, batch) -> list:
+        # Values BSON can not encode only show up when the whole message is encoded, so find the requests here
+        valid = []
+        for request, document, future in batch:
+            try:
+                bson.encode(document if document is not None else request._filter)
+                if document is None:
+                    bson.encode(request._doc)
+            except (InvalidDocument, TypeError, ValueError) as e:
+                self.stats['errors'] += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                valid.append((request, document, future))
+        return valid
+
+    async def write_batch(self, batch, retry=True):
+        bulk_result = None
+        errors = {}
+        try:
+            bulk_result = await self.collection.bulk_write([request for request, _, _ in batch], ordered=False)
+            upserted_ids = bulk_result.upserted_ids or {}
+            modified_count = bulk_result.modified_count
+        except InvalidDocument as e:
+            valid = self.reject_unencodable(batch) if retry else batch
+            if len(valid) < len(batch):
+                if valid:
+                    await self.write_batch(valid, retry=False)
+                return
+            logger.info(e)
+            self.stats['errors'] += len(valid)
+            for _, _, future in valid:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except BulkWriteError as e:
+            errors = {error['index']: error for error in e.details.get('writeErrors', [])}
+            upserted_ids = {upserted['index']: upserted['_id'] for upserted in e.details.get('upserted', [])}
+            modified_count = e.details.get('nModified')
+        except Exception as e:
+            logger.info(e)
+            self.stats['errors'] += len(batch)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # The server reports nModified for the whole batch, so it only splits exactly when it is 0 or when every
+        # upsert that matched a document also modified it; otherwise the per upsert count is unknown (None)
+        matched = [index for index, (request, document, future) in enumerate(batch)
+                   if document is None and not future.done() and index not in errors and index not in upserted_ids]
+        if modified_count == 0 or modified_count == len(matched):
+            matched_modified_count = 1 if modified_count else 0
+        else:
+            matched_modified_count = None
+        for index, (request, document, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in errors:
+                self.stats['errors'] += 1
+                error = errors[index]
+                future.set_exception(WriteError(error.get('errmsg'), error.get('code'), error))
+            elif document is not None:
+                future.set_result(BulkOperationResult(bulk_result, inserted_ids=[document.get('_id')]))
+            elif index in upserted_ids:
+                future.set_result(BulkOperationResult(bulk_result, upserted_id=upserted_ids[index],
+                                                      matched_count=0, modified_count=0))
+            else:
+                # An upsert that did not insert matched exactly one document
+                future.set_result(BulkOperationResult(bulk_result, matched_count=1,
+                                                      modified_count=matched_modified_count))
+
+    async def close(self):
+        await self.flush()
+        while self.pending:
+            await self.flush()
+        if self.flush_tasks:
+            await asyncio.gather(*self.flush_tasks, return_exceptions=True)
+
+
+# Combined outcome of a chunked bulk write; indexes in upserted_ids and errors refer to the original request list
+class BulkSummary:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.deleted_count = 0
+        self.upserted_count = 0
+        self.upserted_ids = {}
+        self.errors = []
+        self.chunks = 0
+
+    def add(self, details, offset):
+        self.chunks += 1
+        self.inserted_count += details.get('nInserted', 0)
+        self.matched_count += details.get('nMatched', 0)
+        self.modified_count += details.get('nModified', 0)
+        self.deleted_count += details.get('nRemoved', 0)
+        self.upserted_count += details.get('nUpserted', 0)
+        for upserted in details.get('upserted', []):
+            self.upserted_ids[offset + upserted['index']] = upserted['_id']
+        for error in details.get('writeErrors', []):
+            self.errors.append({**error, 'index': offset + error['index']})
+
+
+def estimate_request_size(request) -> int:
+    # pymongo keeps the operation payload on private attributes; the fixed overhead covers the op envelope
+    size = 32
+    for attribute in ('_doc', '_filter'):
+        value = getattr(request, attribute, None)
+        if isinstance(value, dict):
+            size += len(bson.encode(value))
+        elif isinstance(value, list):
+            size += sum(len(bson.encode(stage)) for stage in value)
+    return size
+
+
+def chunk_requests(requests, max_count=1000, max_bytes=8 * 1024 * 1024) -> list[tuple[int, list]]:
+    chunks = []
+    chunk, chunk_bytes, offset = [], 0, 0
+    for index, request in enumerate(requests):
+        size = estimate_request_size(request)
+        if chunk and (len(chunk) >= max_count or chunk_bytes + size > max_bytes):
+            chunks.append((offset, chunk))
+            chunk, chunk_bytes, offset = [], 0, index
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        chunks.append((offset, chunk))
+    return chunks
+
+
+def build_upserts(documents, key_fields, replace=False) -> list:
+    if isinstance(key_fields, str):
+        key_fields = [key_fields]
+    requests = []
+    for document in documents:
+        missing = [field for field in key_fields if field not in document]
+        if missing:
+            raise ValueError(f'Document is missing key fields: {missing}')
+        filter = {field: document[field] for field in key_fields}
+        if replace:
+            requests.append(ReplaceOne(filter, document, upsert=True))
+        else:
+            fields = {key: value for key, value in document.items() if key != '_id'}
+            requests.append(UpdateOne(filter, {'$set': fields}, upsert=True))
+    return requests
+
+
+# A chunk failed with something other than per-document write errors; summary covers the chunks that were written
+class ChunkedBulkWriteError(Exception):
+    def __init__(self, summary, error):
+        super().__init__(f'Chunked bulk write failed after {summary.chunks} chunks: {error}')
+        self.summary = summary
+        self.error = error
+
+
+async def chunked_bulk_write(collection, requests, max_count=1000, max_bytes=8 * 1024 * 1024, concurrency=4,
+                             ordered=False) -> BulkSummary:
+    summary = BulkSummary()
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = []
+
+    async def write(offset, chunk):
+        try:
+            result = await collection.bulk_write(chunk, ordered=ordered)
+            summary.add(result.bulk_api_result, offset)
+        except BulkWriteError as e:
+            summary.add(e.details, offset)
+            if ordered:
+                raise
+        except Exception as e:
+            failures.append(e)
+
+    async def write_bounded(offset, chunk):
+        async with semaphore:
+            # Chunks still waiting are not sent once one has failed; those already running finish
+            if not failures:
+                await write(offset, chunk)
+
+    chunks = chunk_requests(requests, max_count, max_bytes)
+    if ordered:
+        # Later chunks must not run once an ordered chunk has failed
+        for offset, chunk in chunks:
+            await write(offset, chunk)
+            if failures:
+                break
+    else:
+        await asyncio.gather(*(write_bounded(offset, chunk) for offset, chunk in chunks))
+    if failures:
+        raise ChunkedBulkWriteError(summary, failures[0]) from failures[0]
+    return summary
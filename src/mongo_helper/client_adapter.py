@@ -1,9 +1,22 @@
 from __future__ import annotations
 from .client_spawner import MongoClientSpawner, MongoClientConsumer
+from .bulk import BulkOperationResult, WriteCoalescer
+from .single_flight import SingleFlight, canonical_key
+from .result_cache import ResultCache
+from .metrics import MetricsRegistry, result_size
+from .slow_query import SlowQueryLog
+from .index_manager import IndexAdvisor, ensure_indexes
+from .raw_bson import RAW_CODEC_OPTIONS
+from .local_mirror import LocalMirror
+from .workload import WorkloadRecorder
+from collections import Counter
 from enum import Enum
 import os
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
 import uuid
+import asyncio
+import time
 from .helper import singleton
 from loguru import logger
 
@@ -19,41 +32,204 @@ class Operations(Enum):
     FIND_ONE = 7
     FIND_MANY = 8
 
+
+WRITE_OPERATIONS = {
+    Operations.INSERT_ONE,
+    Operations.UPDATE_ONE,
+    Operations.DELETE_ONE,
+    Operations.INSERT_MANY,
+    Operations.UPDATE_MANY,
+    Operations.DELETE_MANY,
+}
+
+
+def count_kind(operation):
+    # Which per batch count of a bulk_write result belongs to the operation
+    if operation.operation in (Operations.UPDATE_ONE, Operations.UPDATE_MANY):
+        return 'update'
+    if operation.operation in (Operations.DELETE_ONE, Operations.DELETE_MANY):
+        return 'delete'
+    return None
+
+
 @singleton
 class MongoClientAdapter:
     class Collection:
         def __init__(self, collection: AsyncIOMotorCollection):
             self.collection = collection
-
-        async def update_one(self, filter=None, update=None, upsert=False, session=None):
-            return await self.collection.update_one(filter, update, upsert=upsert, session=session)
+            self.coalescer = None
+            self.single_flight = None
+            self.result_cache = None
+            self.metrics = None
+            self.slow_query_log = None
+            self.index_advisor = None
+            self.raw_view = None
+            self.recorder = None
+
+        def enable_write_coalescing(self, max_batch_size=500, max_delay_ms=5):
+            # Single inserts and upserts outside a session are buffered and flushed as one unordered bulk_write.
+            # A coalesced upsert that matched a document gets modified_count None when the batch total can not be
+            # split between its upserts; pass coalesce=False to update_one when the count matters
+            self.coalescer = WriteCoalescer(self.collection, max_batch_size, max_delay_ms)
+            return self.coalescer
+
+        async def disable_write_coalescing(self):
+            if self.coalescer is not None:
+                coalescer, self.coalescer = self.coalescer, None
+                await coalescer.close()
+
+        def enable_single_flight(self):
+            # Identical find_one / count_documents calls running at the same time share one server request
+            if self.single_flight is None:
+                self.single_flight = SingleFlight()
+            return self.single_flight
+
+        def single_flight_stats(self) -> dict:
+            return self.single_flight.get_stats() if self.single_flight is not None else {}
+
+        def read_key(self, operation, query, projection=None):
+            return canonical_key(self.collection.database.name, self.collection.name, operation, query, projection,
+                                 self.collection.read_concern.document)
+
+        @property
+        def namespace(self):
+            return f'{self.collection.database.name}.{self.collection.name}'
+
+        def attach_result_cache(self, result_cache: ResultCache):
+            self.result_cache = result_cache
+
+        def invalidate_cache(self):
+            if self.result_cache is not None:
+                self.result_cache.invalidate(self.namespace)
+
+        def attach_metrics(self, metrics: MetricsRegistry):
+            self.metrics = metrics
+
+        def attach_slow_query_log(self, slow_query_log: SlowQueryLog):
+            self.slow_query_log = slow_query_log
+
+        def raw(self):
+            # A view of the same collection that returns RawBSONDocument; it skips the result cache and coalescing
+            if self.raw_view is None:
+                self.raw_view = type(self)(self.collection.with_options(codec_options=RAW_CODEC_OPTIONS))
+            self.raw_view.attach_metrics(self.metrics)
+            self.raw_view.attach_slow_query_log(self.slow_query_log)
+            self.raw_view.attach_index_advisor(self.index_advisor)
+            self.raw_view.attach_recorder(self.recorder)
+            return self.raw_view
+
+        def attach_index_advisor(self, index_advisor: IndexAdvisor):
+            self.index_advisor = index_advisor
+
+        def attach_recorder(self, recorder: WorkloadRecorder):
+            self.recorder = recorder
+
+        def record_shape(self, query, sort=None):
+            if self.index_advisor is not None and query is not None:
+                self.index_advisor.record(self.namespace, query, sort)
+
+        async def observe(self, name, operation, query=None, projection=None, payload=None):
+            if self.metrics is None and self.slow_query_log is None and self.recorder is None:
+                return await operation
+            started_at = time.time()
+            started = time.perf_counter()
+            try:
+                result = await operation
+            except Exception:
+                duration = time.perf_counter() - started
+                if self.metrics is not None:
+                    self.metrics.observe_operation(name, self.namespace, duration, error=True)
+                if self.recorder is not None:
+                    self.recorder.record(name, self.namespace, started_at, duration, query, payload, error=True)
+                raise
+            duration = time.perf_counter() - started
+            if self.recorder is not None:
+                self.recorder.record(name, self.namespace, started_at, duration, query, payload)
+            if self.metrics is not None:
+                documents, size = result_size(name, result, self.metrics.measure_bytes)
+                self.metrics.observe_operation(name, self.namespace, duration, documents, size)
+            if self.slow_query_log is not None:
+                self.slow_query_log.check(self.collection, name, duration, query, projection)
+            return result
+
+        async def write(self, name, operation, query=None, payload=None):
+            # Writes through the wrapper invalidate cached reads of this collection, even when they fail part way
+            try:
+                return await self.observe(name, operation, query, payload=payload)
+            finally:
+                self.invalidate_cache()
+
+        async def cached_read(self, operation, query, projection, loader):
+            if self.result_cache is None:
+                return await loader()
+            key = self.read_key(operation, query, projection)
+            found, value = self.result_cache.get(key)
+            if found:
+                return value
+            generation = self.result_cache.generation(self.namespace)
+            value = await loader()
+            self.result_cache.put(self.namespace, key, value, generation)
+            return value
+
+        async def update_one(self, filter=None, update=None, upsert=False, session=None, coalesce=True):
+            if upsert and coalesce and session is None and self.coalescer is not None:
+                return await self.write('update_one', self.coalescer.upsert_one(filter, update), filter, update)
+            return await self.write('update_one',
+                                    self.collection.update_one(filter, update, upsert=upsert, session=session), filter,
+                                    update)
 
         async def insert_one(self, document, session=None):
-            return await self.collection.insert_one(document, session=session)
+            if session is None and self.coalescer is not None:
+                return await self.write('insert_one', self.coalescer.insert_one(document), payload=document)
+            return await self.write('insert_one', self.collection.insert_one(document, session=session),
+                                    payload=document)
 
         async def delete_one(self, filter, session=None):
-            return await self.collection.delete_one(filter, session=session)
+            return await self.write('delete_one', self.collection.delete_one(filter, session=session), filter)
 
         async def insert_many(self, documents, session=None):
-            return await self.collection.insert_many(documents, session=session)
+            return await self.write('insert_many', self.collection.insert_many(documents, session=session),
+                                    payload=documents)
 
         async def find_one(self, query, projection=None, session=None):
-            return await self.collection.find_one(query, projection, session=session)
-
-        async def find(self, query, projection=None, session=None):
-            return self.collection.find(query, projection, session=session)
+            self.record_shape(query)
+            if session is None and self.single_flight is not None:
+                return await self.single_flight.do(self.read_key('find_one', query, projection),
+                                                   lambda: self.observe('find_one',
+                                                                        self.collection.find_one(query, projection),
+                                                                        query, projection))
+            return await self.observe('find_one', self.collection.find_one(query, projection, session=session),
+                                      query, projection)
+
+        async def find(self, query, projection=None, session=None, **kwargs):
+            self.record_shape(query, kwargs.get('sort'))
+            return self.collection.find(query, projection, session=session, **kwargs)
 
         # Add the update_many method
         async def update_many(self, query, update, upsert=False, session=None):
-            return await self.collection.update_many(query, update, upsert=upsert, session=session)
+            return await self.write('update_many',
+                                    self.collection.update_many(query, update, upsert=upsert, session=session), query,
+                                    update)
 
         # Add the delete_many method
         async def delete_many(self, query, session=None):
-            return await self.collection.delete_many(query, session=session)
+            return await self.write('delete_many', self.collection.delete_many(query, session=session), query)
 
         # Add the count_documents method
-        async def count_documents(self, query, session=None):
-            return await self.collection.count_documents(query, session=session)
+        async def count_documents(self, query, session=None, **kwargs):
+            self.record_shape(query)
+            if session is None and self.single_flight is not None:
+                return await self.single_flight.do(self.read_key('count_documents', query, kwargs or None),
+                                                   lambda: self.observe('count_documents',
+                                                                        self.collection.count_documents(query,
+                                                                                                        **kwargs),
+                                                                        query))
+            return await self.observe('count_documents',
+                                      self.collection.count_documents(query, session=session, **kwargs), query)
+
+        async def estimated_document_count(self):
+            # Reads the collection metadata instead of scanning, so it ignores filters and may lag after a crash
+            return await self.observe('estimated_document_count', self.collection.estimated_document_count())
 
         # Add the create_index method
         async def create_index(self, keys, options=None, session=None):
@@ -61,12 +237,19 @@ class MongoClientAdapter:
                 options = {}
             return await self.collection.create_index(keys, **options, session=session)
 
+        async def bulk_write(self, requests, ordered=True, session=None):
+            return await self.write('bulk_write',
+                                    self.collection.bulk_write(requests, ordered=ordered, session=session),
+                                    payload=requests)
+
     class TransactionResult:
         def __init__(self, operation, result, id):
             self.operation = operation
             self.result = result
             self.id = id
 
+    BulkOperationResult = BulkOperationResult
+
     class TransactionObject:
         def __init__(self,
                      collection_name: str,
@@ -75,7 +258,9 @@ class MongoClientAdapter:
                      query=None,
                      update=None,
                      documents=None,
-                     projection=None):
+                     projection=None,
+                     upsert=False,
+                     depends_on=None):
 
             self.collection_name = collection_name
             self.collection = collection
@@ -84,23 +269,44 @@ class MongoClientAdapter:
             self.update = update
             self.documents = documents
             self.projection = projection
+            self.upsert = upsert
+            # Operations (or their ids) that must finish before this one runs in concurrent mode
+            self.depends_on = [getattr(dependency, 'id', dependency) for dependency in depends_on or []]
             self.id = uuid.uuid4().hex
 
         def get_operation_type(self):
             return self.operation
 
+        def is_write(self):
+            return self.operation in WRITE_OPERATIONS
+
+        def to_write_models(self):
+            if self.operation == Operations.INSERT_ONE:
+                return [InsertOne(self.documents)]
+            elif self.operation == Operations.UPDATE_ONE:
+                return [UpdateOne(self.query, self.update, upsert=self.upsert)]
+            elif self.operation == Operations.DELETE_ONE:
+                return [DeleteOne(self.query)]
+            elif self.operation == Operations.INSERT_MANY:
+                return [InsertOne(document) for document in self.documents]
+            elif self.operation == Operations.UPDATE_MANY:
+                return [UpdateMany(self.query, self.update, upsert=self.upsert)]
+            elif self.operation == Operations.DELETE_MANY:
+                return [DeleteMany(self.query)]
+            raise ValueError('Operation can not be sent as a bulk write.')
+
         async def commit(self, session=None):
             if session is None:
                 if self.operation == Operations.INSERT_ONE:
                     return await self.collection.insert_one(self.documents)
                 elif self.operation == Operations.UPDATE_ONE:
-                    return await self.collection.update_one(self.query, self.update)
+                    return await self.collection.update_one(self.query, self.update, upsert=self.upsert)
                 elif self.operation == Operations.DELETE_ONE:
                     return await self.collection.delete_one(self.query)
                 elif self.operation == Operations.INSERT_MANY:
                     return await self.collection.insert_many(self.documents)
                 elif self.operation == Operations.UPDATE_MANY:
-                    return await self.collection.update_many(self.query, self.update)
+                    return await self.collection.update_many(self.query, self.update, upsert=self.upsert)
                 elif self.operation == Operations.DELETE_MANY:
                     return await self.collection.delete_many(self.query)
                 elif self.operation == Operations.FIND_ONE:
@@ -114,13 +320,15 @@ class MongoClientAdapter:
                 if self.operation == Operations.INSERT_ONE:
                     return await self.collection.insert_one(self.documents, session=session)
                 elif self.operation == Operations.UPDATE_ONE:
-                    return await self.collection.update_one(self.query, self.update, session=session)
+                    return await self.collection.update_one(self.query, self.update, upsert=self.upsert,
+                                                            session=session)
                 elif self.operation == Operations.DELETE_ONE:
                     return await self.collection.delete_one(self.query, session=session)
                 elif self.operation == Operations.INSERT_MANY:
                     return await self.collection.insert_many(self.documents, session=session)
                 elif self.operation == Operations.UPDATE_MANY:
-                    return await self.collection.update_many(self.query, self.update, session=session)
+                    return await self.collection.update_many(self.query, self.update, upsert=self.upsert,
+                                                             session=session)
                 elif self.operation == Operations.DELETE_MANY:
                     return await self.collection.delete_many(self.query, session=session)
                 elif self.operation == Operations.FIND_ONE:
@@ -136,6 +344,13 @@ class MongoClientAdapter:
         logger.info('Initializing MongoClientSpawner.')
         self.client_spawner = MongoClientSpawner(*args, **kwargs)
         self.collection_cache = {}
+        self.result_cache = None
+        self.metrics = None
+        self.slow_query_log = None
+        self.index_advisor = None
+        self.recorder = None
+        self.write_coalescing = None
+        self.single_flight = False
 
     def __call__(self, *args, **kwargs):
         raise TypeError('Singletons must be accessed through `get_instance()`.')
@@ -154,43 +369,271 @@ class MongoClientAdapter:
     def close_consumer(self, consumer):
         self.client_spawner.remove_spawned_client(consumer)
 
+    def close_all_consumers(self):
+        self.client_spawner.remove_all_spawned_clients()
+        self.collection_cache.clear()
+
+    async def warmup(self, n_connections=10, collections=None, db_name=None) -> dict:
+        # Run server selection, fill the pool with concurrent pings and touch the hot collections and their indexes
+        consumer = self.create_consumer(db_name)
+        client = consumer.get_async_motor_object()
+        report = {'connections': n_connections, 'collections': {}}
+        started = time.perf_counter()
+        try:
+            await client.admin.command('ping')
+            report['server_selection_ms'] = (time.perf_counter() - started) * 1000
+
+            pool_started = time.perf_counter()
+            await asyncio.gather(*(client.admin.command('ping') for _ in range(n_connections)))
+            report['pool_ms'] = (time.perf_counter() - pool_started) * 1000
+
+            for collection_name in collections or []:
+                collection_started = time.perf_counter()
+                collection = self.get_collection(consumer, collection_name).collection
+                await asyncio.gather(collection.find_one({}), collection.index_information())
+                report['collections'][collection_name] = (time.perf_counter() - collection_started) * 1000
+        finally:
+            self.close_consumer(consumer)
+        report['total_ms'] = (time.perf_counter() - started) * 1000
+        logger.info(f"Mongo pool warmed up in {report['total_ms']:.1f} ms.")
+        return report
+
     def get_collection(self, consumer, collection_name):
-        db = consumer.consume()
-        if collection_name not in self.collection_cache:
-            self.collection_cache[collection_name] = self.Collection(db[collection_name])
-        return self.collection_cache[collection_name]
+        # Consumers share pooled clients, so wrappers can be reused per database and collection
+        cache_key = (consumer.pool_key, consumer.selected_database, collection_name)
+        cached = self.collection_cache.get(cache_key)
+        if cached is None or cached.collection.database.client is not consumer.async_motor_object:
+            db = consumer.consume()
+            self.collection_cache[cache_key] = self.Collection(db[collection_name])
+            self.collection_cache[cache_key].attach_result_cache(self.result_cache)
+            self.collection_cache[cache_key].attach_metrics(self.metrics)
+            self.collection_cache[cache_key].attach_slow_query_log(self.slow_query_log)
+            self.collection_cache[cache_key].attach_index_advisor(self.index_advisor)
+            self.collection_cache[cache_key].attach_recorder(self.recorder)
+            if self.write_coalescing is not None:
+                self.collection_cache[cache_key].enable_write_coalescing(**self.write_coalescing)
+            if self.single_flight:
+                self.collection_cache[cache_key].enable_single_flight()
+        return self.collection_cache[cache_key]
+
+    def enable_write_coalescing(self, max_batch_size=500, max_delay_ms=5):
+        # Kept on the adapter so wrappers rebuilt for a new pooled client coalesce as well
+        self.write_coalescing = {'max_batch_size': max_batch_size, 'max_delay_ms': max_delay_ms}
+        for collection in self.collection_cache.values():
+            collection.enable_write_coalescing(max_batch_size, max_delay_ms)
+
+    async def disable_write_coalescing(self):
+        self.write_coalescing = None
+        for collection in self.collection_cache.values():
+            await collection.disable_write_coalescing()
+
+    def enable_single_flight(self):
+        # Like write coalescing, re-applied to every wrapper get_collection builds
+        self.single_flight = True
+        for collection in self.collection_cache.values():
+            collection.enable_single_flight()
+
+    def single_flight_stats(self) -> dict:
+        return {collection.namespace: collection.single_flight_stats() for collection in self.collection_cache.values()
+                if collection.single_flight is not None}
+
+    def enable_result_cache(self, max_entries=10000, max_bytes=64 * 1024 * 1024, default_ttl=60,
+                            ttls=None) -> ResultCache:
+        # ttls maps 'db.collection' namespaces to their own time to live in seconds
+        self.result_cache = ResultCache(max_entries, max_bytes, default_ttl, ttls)
+        for collection in self.collection_cache.values():
+            collection.attach_result_cache(self.result_cache)
+        return self.result_cache
+
+    def enable_metrics(self, metrics: MetricsRegistry = None) -> MetricsRegistry:
+        # Command and pool metrics also need metrics.listeners() passed as event_listeners when the adapter is created
+        self.metrics = metrics or MetricsRegistry()
+        for collection in self.collection_cache.values():
+            collection.attach_metrics(self.metrics)
+        return self.metrics
+
+    def enable_slow_query_log(self, slow_query_log: SlowQueryLog = None, **kwargs) -> SlowQueryLog:
+        self.slow_query_log = slow_query_log or SlowQueryLog(**kwargs)
+        for collection in self.collection_cache.values():
+            collection.attach_slow_query_log(self.slow_query_log)
+        return self.slow_query_log
+
+    def enable_index_advisor(self, index_advisor: IndexAdvisor = None) -> IndexAdvisor:
+        self.index_advisor = index_advisor or IndexAdvisor()
+        for collection in self.collection_cache.values():
+            collection.attach_index_advisor(self.index_advisor)
+        return self.index_advisor
+
+    def enable_workload_recorder(self, path, capture_values=False, **kwargs) -> WorkloadRecorder:
+        # Replay the log with mongo_helper.workload.replay_workload or python -m benchmarks.replay
+        self.recorder = WorkloadRecorder(path, capture_values, **kwargs)
+        for collection in self.collection_cache.values():
+            collection.attach_recorder(self.recorder)
+        return self.recorder
+
+    def disable_workload_recorder(self):
+        if self.recorder is not None:
+            recorder, self.recorder = self.recorder, None
+            for collection in self.collection_cache.values():
+                collection.attach_recorder(None)
+            recorder.close()
+
+    async def ensure_indexes(self, spec, db_name=None, drop_unknown=False, dry_run=False) -> dict:
+        # spec maps collection names to IndexModel objects or (keys, options) tuples
+        consumer = self.create_consumer(db_name)
+        try:
+            return await ensure_indexes(consumer.consume(), spec, drop_unknown, dry_run)
+        finally:
+            self.close_consumer(consumer)
+
+    async def create_local_mirror(self, collection_name, index_fields=(), db_name=None, **kwargs):
+        # Loads the collection into memory and keeps it current from a change stream (needs a replica set)
+        return await LocalMirror(self, collection_name, index_fields, db_name, **kwargs).start()
+
+    def metrics_snapshot(self) -> dict:
+        return self.metrics.snapshot() if self.metrics is not None else {}
+
+    def result_cache_stats(self) -> dict:
+        return self.result_cache.get_stats() if self.result_cache is not None else {}
+
+    @staticmethod
+    def group_operations(operation_list, batch_writes=True, exact_counts=True):
+        # Consecutive writes against the same collection are grouped so they can share one bulk_write.
+        # The server only reports matched, modified and deleted counts per bulk_write, so with exact_counts a batch
+        # holds at most one update and one delete; without it every run of writes is one batch
+        batches = []
+        for operation in operation_list:
+            previous = batches[-1][-1] if batches else None
+            kind = count_kind(operation)
+            if (batch_writes and previous is not None and operation.is_write() and previous.is_write()
+                    and operation.collection_name == previous.collection_name
+                    and (not exact_counts or kind is None
+                         or all(count_kind(other) != kind for other in batches[-1]))):
+                batches[-1].append(operation)
+            else:
+                batches.append([operation])
+        return batches
+
+    async def commit_batch(self, consumer, batch, session=None, ordered=True) -> list[TransactionResult]:
+        if len(batch) == 1:
+            operation = batch[0]
+            result = await operation.commit(session)
+            return [self.TransactionResult(operation, result, operation.id)]
+
+        requests = []
+        offsets = []
+        for operation in batch:
+            offsets.append(len(requests))
+            requests.extend(operation.to_write_models())
+
+        collection = self.get_collection(consumer, batch[0].collection_name)
+        bulk_result = await collection.bulk_write(requests, ordered=ordered, session=session)
+        return self.split_bulk_result(batch, offsets, bulk_result)
+
+    def split_bulk_result(self, batch, offsets, bulk_result) -> list[TransactionResult]:
+        # An update or delete owns the counts of its kind when it is the only one in the batch. Otherwise
+        # (exact_counts=False) its counts are None and the batch totals are on result.bulk_result
+        upserted_ids = bulk_result.upserted_ids or {}
+        kinds = Counter(count_kind(operation) for operation in batch)
+
+        results = []
+        for operation, offset in zip(batch, offsets):
+            if operation.operation == Operations.INSERT_ONE:
+                result = self.BulkOperationResult(bulk_result, inserted_ids=[operation.documents.get('_id')])
+            elif operation.operation == Operations.INSERT_MANY:
+                inserted_ids = [document.get('_id') for document in operation.documents]
+                result = self.BulkOperationResult(bulk_result, inserted_ids=inserted_ids)
+            elif count_kind(operation) == 'update':
+                exact = kinds['update'] == 1
+                result = self.BulkOperationResult(bulk_result, upserted_id=upserted_ids.get(offset),
+                                                  matched_count=bulk_result.matched_count if exact else None,
+                                                  modified_count=bulk_result.modified_count if exact else None)
+            else:
+                exact = kinds['delete'] == 1
+                result = self.BulkOperationResult(bulk_result,
+                                                  deleted_count=bulk_result.deleted_count if exact else None)
+            results.append(self.TransactionResult(operation, result, operation.id))
+        return results
 
-    async def begin_transaction(self, consumer, collection_name, operation_list) -> list[TransactionResult]:
+    async def commit_concurrently(self, consumer, batches, concurrency, ordered=True,
+                                  keep_collection_order=True) -> list[TransactionResult]:
+        semaphore = asyncio.Semaphore(concurrency)
+        batch_of_operation = {operation.id: index for index, batch in enumerate(batches) for operation in batch}
+        last_batch_of_collection = {}
+        tasks = []
+
+        async def run(batch, dependencies):
+            if dependencies:
+                await asyncio.gather(*dependencies)
+            async with semaphore:
+                return await self.commit_batch(consumer, batch, ordered=ordered)
+
+        # Every dependency is checked before anything is scheduled, so a bad one can not leave writes running
+        batch_dependencies = []
+        for index, batch in enumerate(batches):
+            dependency_indexes = set()
+            for operation in batch:
+                for dependency_id in operation.depends_on:
+                    dependency_index = batch_of_operation.get(dependency_id)
+                    if dependency_index is None or dependency_index > index:
+                        raise ValueError('Operations can only depend on earlier operations in the list.')
+                    if dependency_index < index:
+                        dependency_indexes.add(dependency_index)
+            collection_name = batch[0].collection_name
+            if keep_collection_order and collection_name in last_batch_of_collection:
+                dependency_indexes.add(last_batch_of_collection[collection_name])
+            last_batch_of_collection[collection_name] = index
+            batch_dependencies.append(sorted(dependency_indexes))
+
+        for batch, dependency_indexes in zip(batches, batch_dependencies):
+            dependencies = [tasks[dependency_index] for dependency_index in dependency_indexes]
+            tasks.append(asyncio.ensure_future(run(batch, dependencies)))
+
+        try:
+            batch_results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return [result for results in batch_results for result in results]
+
+    async def begin_transaction(self, consumer, collection_name, operation_list, batch_writes=True,
+                                ordered=True, concurrency=None,
+                                keep_collection_order=True, exact_counts=True) -> list[TransactionResult]:
         is_replica_set = os.getenv('MONGO_REPLICA_SET')
+        batches = self.group_operations(operation_list, batch_writes, exact_counts)
 
         results = []
         if is_replica_set is None or is_replica_set.lower() == 'false':
-            for operation in operation_list:
-                collection = self.get_collection(consumer, operation.collection_name)
-                result = await operation.commit(collection.collection)
-                results.append(self.TransactionResult(operation, result, operation.id))
+            if concurrency and concurrency > 1:
+                return await self.commit_concurrently(consumer, batches, concurrency, ordered,
+                                                      keep_collection_order)
+            for batch in batches:
+                results.extend(await self.commit_batch(consumer, batch, ordered=ordered))
         else:
+            if concurrency and concurrency > 1:
+                logger.warning('Concurrent execution is ignored inside a replica set transaction.')
             async_client = consumer.get_async_motor_object()
             async with await async_client.start_session() as session:
                 async with session.start_transaction():
-                    for operation in operation_list:
-                        collection = self.get_collection(consumer, operation.collection_name)
-                        result = await operation.commit(collection.collection, session)
-                        results.append(self.TransactionResult(operation, result, operation.id))
+                    for batch in batches:
+                        results.extend(await self.commit_batch(consumer, batch, session, ordered))
                 # Commit the transaction
                 await session.commit_transaction()
 
         return results
 
-    def get_transaction_object(self, consumer, collection_name, operation, query=None, update=None, documents=None, projection=None):
-        return MongoClientAdapter.TransactionObject(
+    def get_transaction_object(self, consumer, collection_name, operation, query=None, update=None, documents=None,
+                               projection=None, upsert=False, depends_on=None):
+        return self.TransactionObject(
             collection_name,
             operation,
             self.get_collection(consumer, collection_name),
             query=query,
             update=update,
             documents=documents,
-            projection=projection
+            projection=projection,
+            upsert=upsert,
+            depends_on=depends_on
         )
 
 
@@ -1,32 +1,92 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import contextlib
+import time
+import traceback
 import uuid
+import weakref
 from .helper import singleton
 from loguru import logger
 
 
 # Abstract class for mongo client consumers
 class MongoClientConsumer:
-    def __init__(self, id, async_motor_object, selected_database):
+    def __init__(self, id, async_motor_object, selected_database, pool_key=None, creation_stack=None):
         self.id = id
         self.async_motor_object = async_motor_object
         self.metadata = {}
         self.selected_database = selected_database
+        self.pool_key = pool_key
+        self.creation_stack = creation_stack
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.active = 0
+        self.closed = False
 
     def get_id(self):
         return self.id
 
     def get_async_motor_object(self):
+        self.touch()
         return self.async_motor_object
 
     def consume(self):
+        self.touch()
         return self.async_motor_object.get_database(self.selected_database)
 
+    def touch(self):
+        self.last_used_at = time.monotonic()
+
+    @contextlib.contextmanager
+    def in_use(self):
+        # Streams and other long operations keep the consumer from looking idle until they finish
+        self.active += 1
+        try:
+            yield self
+        finally:
+            self.active -= 1
+            self.touch()
+
+    def idle_time(self, now=None):
+        if self.active:
+            return 0.0
+        return (now or time.monotonic()) - self.last_used_at
+
+
+# A motor client shared by every consumer spawned with the same uri and options
+class PooledClient:
+    def __init__(self, key, client):
+        self.key = key
+        self.client = client
+        self.ref_count = 0
+        self.released_at = time.monotonic()
+        # Reaped consumers drop their reference but may still be held by a live builder
+        self.consumers = weakref.WeakSet()
+
+    def acquire(self):
+        self.ref_count += 1
+        return self.client
+
+    def release(self):
+        if self.ref_count > 0:
+            self.ref_count -= 1
+        if self.ref_count == 0:
+            self.released_at = time.monotonic()
+        return self.ref_count
+
+    def in_use(self):
+        return self.ref_count > 0 or len(self.consumers) > 0
+
+    def close(self):
+        self.client.close()
+
 
 # Create async mongo clients and manage them
 @singleton
 class MongoClientSpawner:
 
-    def __init__(self, is_remote_mode=False, mongo_uri=None):
+    def __init__(self, is_remote_mode=False, mongo_uri=None, max_pool_size=100, min_pool_size=0,
+                 max_idle_time_ms=None, consumer_ttl=None, pool_ttl=None, track_leaks=False, **client_options):
         if not is_remote_mode:
             self.mongo_uri = 'mongodb://localhost:27017'
         else:
@@ -35,35 +95,144 @@ class MongoClientSpawner:
             logger.info("Using remote mongo uri.")
             self.mongo_uri = mongo_uri
 
+        self.client_options = {
+            'maxPoolSize': max_pool_size,
+            'minPoolSize': min_pool_size,
+            'maxIdleTimeMS': max_idle_time_ms,
+            **client_options,
+        }
+        self.client_options = {key: value for key, value in self.client_options.items() if value is not None}
+
+        # Seconds a consumer may stay unused before it is reaped, and an unreferenced pool before it is closed
+        self.consumer_ttl = consumer_ttl
+        self.pool_ttl = pool_ttl
+        self.track_leaks = track_leaks
+
         self.clients = {}
+        self.pooled_clients = {}
+        self.reaper_task = None
 
     def create_id(self):
         return uuid.uuid4().hex
 
-    def spawn_consumer(self, db_name) -> MongoClientConsumer:
-        logger.info("Connecting to mongo...")
-        try:
-            client = AsyncIOMotorClient(self.mongo_uri)
-            consumer = MongoClientConsumer(len(self.clients), client, db_name)
-        except Exception as e:
-            logger.info(e)
-            raise ValueError('Could not connect to mongo.')
-        logger.info("Connected to mongo.")
+    @staticmethod
+    def create_pool_key(mongo_uri, options):
+        return mongo_uri, tuple(sorted((key, repr(value)) for key, value in options.items()))
+
+    def get_pooled_client(self, mongo_uri=None, **client_options) -> PooledClient:
+        mongo_uri = mongo_uri or self.mongo_uri
+        options = {**self.client_options, **client_options}
+        key = self.create_pool_key(mongo_uri, options)
+
+        pooled_client = self.pooled_clients.get(key)
+        if pooled_client is None:
+            logger.info("Connecting to mongo...")
+            try:
+                client = AsyncIOMotorClient(mongo_uri, **options)
+            except Exception as e:
+                logger.info(e)
+                raise ValueError('Could not connect to mongo.')
+            logger.info("Connected to mongo.")
+            pooled_client = PooledClient(key, client)
+            self.pooled_clients[key] = pooled_client
+        return pooled_client
+
+    def spawn_consumer(self, db_name, mongo_uri=None, **client_options) -> MongoClientConsumer:
+        pooled_client = self.get_pooled_client(mongo_uri, **client_options)
+        creation_stack = ''.join(traceback.format_stack()[:-1]) if self.track_leaks else None
+        consumer = MongoClientConsumer(self.create_id(), pooled_client.acquire(), db_name, pooled_client.key,
+                                       creation_stack)
         self.clients[consumer.get_id()] = consumer
+        pooled_client.consumers.add(consumer)
         return consumer
 
+    def release_consumer(self, consumer):
+        if consumer.closed:
+            return False
+        consumer.closed = True
+        pooled_client = self.pooled_clients.get(consumer.pool_key)
+        if pooled_client is not None:
+            pooled_client.release()
+        self.clients.pop(consumer.get_id(), None)
+        return True
+
     def remove_spawned_client(self, consumer):
-        consumer.get_async_motor_object().close
-        self.clients.pop(consumer.get_id())
+        self.release_consumer(consumer)
+        pooled_client = self.pooled_clients.get(consumer.pool_key)
+        if pooled_client is not None:
+            pooled_client.consumers.discard(consumer)
+
+    def close_pooled_client(self, pool_key):
+        pooled_client = self.pooled_clients.pop(pool_key, None)
+        if pooled_client is None:
+            return False
+        for consumer in [c for c in self.clients.values() if c.pool_key == pool_key]:
+            consumer.closed = True
+            self.clients.pop(consumer.get_id())
+        pooled_client.close()
+        return True
 
     def remove_all_spawned_clients(self):
         for consumer in self.clients.values():
-            consumer.get_async_motor_object().close
+            consumer.closed = True
+        for pooled_client in self.pooled_clients.values():
+            pooled_client.close()
+        self.pooled_clients.clear()
         self.clients.clear()
 
+    def reap_idle_consumers(self, now=None) -> list:
+        now = now or time.monotonic()
+        reaped = []
+        if self.consumer_ttl is not None:
+            for consumer in list(self.clients.values()):
+                if consumer.idle_time(now) > self.consumer_ttl:
+                    logger.warning(f"Reaping consumer {consumer.get_id()} idle for {consumer.idle_time(now):.1f}s.")
+                    if consumer.creation_stack:
+                        logger.warning(f"Consumer {consumer.get_id()} was created at:\n{consumer.creation_stack}")
+                    self.release_consumer(consumer)
+                    reaped.append(consumer.get_id())
+
+        if self.pool_ttl is not None:
+            for key, pooled_client in list(self.pooled_clients.items()):
+                # A reaped consumer whose builder is still alive keeps the client open until it is garbage collected
+                if not pooled_client.in_use() and now - pooled_client.released_at > self.pool_ttl:
+                    logger.info("Closing idle pooled mongo client.")
+                    self.close_pooled_client(key)
+        return reaped
+
+    def leak_report(self, min_age=0) -> list[dict]:
+        now = time.monotonic()
+        report = []
+        for consumer in self.clients.values():
+            age = now - consumer.created_at
+            if age < min_age:
+                continue
+            report.append({
+                'id': consumer.get_id(),
+                'database': consumer.selected_database,
+                'age': age,
+                'idle': consumer.idle_time(now),
+                'creation_stack': consumer.creation_stack,
+            })
+        return report
+
+    async def _reap_forever(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.reap_idle_consumers()
+
+    def start_reaper(self, interval=30):
+        if self.reaper_task is None or self.reaper_task.done():
+            self.reaper_task = asyncio.get_running_loop().create_task(self._reap_forever(interval))
+        return self.reaper_task
+
+    def stop_reaper(self):
+        if self.reaper_task is not None:
+            self.reaper_task.cancel()
+            self.reaper_task = None
+
     def client_count(self):
         return len(self.clients)
 
-
-
-
+    def pool_count(self):
+        return len(self.pooled_clients)
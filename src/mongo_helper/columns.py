@@ -0,0 +1,62 @@
+from .pagination import get_field
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def round_trips(stored, value) -> bool:
+    # numpy truncates silently (1.9 into int64 is 1, 'abcd' into U3 is 'abc'), so a value is kept only if it comes back
+    if isinstance(stored, np.datetime64):
+        return bool(stored == np.datetime64(value))
+    if isinstance(stored, np.floating) and isinstance(value, (float, np.floating)):
+        # Rounding to the column precision is expected, overflowing to inf is not
+        return bool(np.isfinite(stored) or not np.isfinite(value))
+    return bool(stored.item() == value)
+
+
+# A preallocated column that doubles its capacity when full; mask marks missing or unconvertible values
+class ColumnBuilder:
+    def __init__(self, dtype, capacity=1024):
+        self.dtype = np.dtype(dtype)
+        self.values = np.zeros(capacity, dtype=self.dtype)
+        self.mask = np.zeros(capacity, dtype=bool)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.values):
+            self.grow()
+        if value is None:
+            self.mask[self.size] = True
+        else:
+            try:
+                with np.errstate(over='ignore', invalid='ignore'):
+                    self.values[self.size] = value
+                if self.dtype != object and not round_trips(self.values[self.size], value):
+                    self.mask[self.size] = True
+            except (TypeError, ValueError, OverflowError):
+                self.mask[self.size] = True
+        self.size += 1
+
+    def grow(self):
+        capacity = max(len(self.values) * 2, 1)
+        self.values = np.resize(self.values, capacity)
+        self.mask = np.resize(self.mask, capacity)
+        self.values[self.size:] = np.zeros(1, dtype=self.dtype)[0]
+        self.mask[self.size:] = False
+
+    def finish(self):
+        return np.ma.MaskedArray(self.values[:self.size], mask=self.mask[:self.size])
+
+
+async def collect_columns(cursor, fields, dtypes=None, capacity=1024) -> dict:
+    # Fields without a dtype are kept as object columns
+    if np is None:
+        raise ImportError('find_columns requires numpy, install it with `pip install numpy`.')
+    dtypes = dtypes or {}
+    builders = {field: ColumnBuilder(dtypes.get(field, object), capacity) for field in fields}
+    async for document in cursor:
+        for field, builder in builders.items():
+            builder.append(get_field(document, field))
+    return {field: builder.finish() for field, builder in builders.items()}
@@ -0,0 +1,65 @@
+class QueryNotIndexedError(AssertionError):
+    pass
+
+
+def plan_stages(plan, stages=None):
+    # Flattens a winning plan (classic or slot based) into its stage documents, root first
+    stages = [] if stages is None else stages
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan)
+        for key in ('inputStage', 'queryPlan'):
+            plan_stages(plan.get(key), stages)
+        for child in plan.get('inputStages', []):
+            plan_stages(child, stages)
+    return stages
+
+
+def summarize_explain(explain) -> dict:
+    planner = explain.get('queryPlanner', {})
+    winning_plan = planner.get('winningPlan', {})
+    stats = explain.get('executionStats', {})
+    stages = plan_stages(winning_plan)
+    stage_names = [stage['stage'] for stage in stages]
+    return {
+        'winning_plan': winning_plan,
+        'stages': stage_names,
+        'indexes': [stage['indexName'] for stage in stages if 'indexName' in stage],
+        'collscan': 'COLLSCAN' in stage_names,
+        'blocking_sort': 'SORT' in stage_names,
+        'n_returned': stats.get('nReturned'),
+        'total_docs_examined': stats.get('totalDocsExamined'),
+        'total_keys_examined': stats.get('totalKeysExamined'),
+        'execution_time_ms': stats.get('executionTimeMillis'),
+    }
+
+
+def explain_command(collection_name, operation, query, projection=None, sort=None):
+    if operation == 'count_documents':
+        return {'count': collection_name, 'query': query}
+    command = {'find': collection_name, 'filter': query}
+    if projection:
+        command['projection'] = projection
+    if sort:
+        command['sort'] = dict([(sort, 1)] if isinstance(sort, str) else sort)
+    if operation == 'find_one':
+        command['limit'] = 1
+    return command
+
+
+async def explain_query(collection, query, projection=None, sort=None, operation='find') -> dict:
+    # Runs the query with executionStats and adds selectivity against the estimated collection size
+    command = explain_command(collection.name, operation, query, projection, sort)
+    result = await collection.database.command({'explain': command, 'verbosity': 'executionStats'})
+    summary = summarize_explain(result)
+    total = await collection.estimated_document_count()
+    summary['selectivity'] = summary['n_returned'] / total if total and summary['n_returned'] is not None else None
+    return summary
+
+
+def assert_indexed(summary, allow_blocking_sort=False):
+    if summary['collscan']:
+        raise QueryNotIndexedError(f"Query runs a COLLSCAN: {summary['stages']}")
+    if summary['blocking_sort'] and not allow_blocking_sort:
+        raise QueryNotIndexedError(f"Query needs an in-memory sort: {summary['stages']}")
+    return summary
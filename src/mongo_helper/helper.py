@@ -1,3 +1,4 @@
+from typing import List, Tuple, Dict, Any, Union, Optional
 
 def singleton(cls):
     instance = [None]
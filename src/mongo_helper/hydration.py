@@ -0,0 +1,79 @@
+from pydantic import BaseModel
+
+try:
+    from pydantic import TypeAdapter
+except ImportError:
+    # pydantic v1 has no TypeAdapter, results are validated one document at a time
+    TypeAdapter = None
+
+
+_list_adapters = {}
+
+
+def list_adapter(model):
+    # Building the validator is the expensive part, so one is kept per model
+    adapter = _list_adapters.get(model)
+    if adapter is None:
+        adapter = _list_adapters[model] = TypeAdapter(list[model])
+    return adapter
+
+
+def dump(instance) -> dict:
+    # Stored under the field aliases, which is what derive_projection and hydrate read back
+    if hasattr(instance, 'model_dump'):
+        return instance.model_dump(by_alias=True)
+    return instance.dict(by_alias=True)
+
+
+def construct(model, document):
+    # No validation or coercion: nested models stay plain dicts and bad types go through unnoticed
+    if hasattr(model, 'model_construct'):
+        return model.model_construct(**document)
+    return model.construct(**document)
+
+
+# trusted skips validation, see construct for what that leaves unconverted
+def hydrate(model, document, trusted=False):
+    if trusted:
+        return construct(model, document)
+    if hasattr(model, 'model_validate'):
+        return model.model_validate(document)
+    return model.parse_obj(document)
+
+
+def hydrate_many(model, documents, trusted=False) -> list:
+    if trusted:
+        return [construct(model, document) for document in documents]
+    if TypeAdapter is None:
+        return [model.parse_obj(document) for document in documents]
+    return list_adapter(model).validate_python(documents)
+
+
+# Keeps the raw document and only builds the model when an attribute is first read
+class LazyModel:
+    __slots__ = ('_model', '_document', '_trusted', '_instance')
+
+    def __init__(self, model, document, trusted=False):
+        self._model = model
+        self._document = document
+        self._trusted = trusted
+        self._instance = None
+
+    def hydrate(self) -> BaseModel:
+        if self._instance is None:
+            self._instance = hydrate(self._model, self._document, self._trusted)
+            self._document = None
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.hydrate(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyModel):
+            other = other.hydrate()
+        return self.hydrate() == other
+
+    def __repr__(self):
+        if self._instance is None:
+            return f'LazyModel({self._model.__name__}, unhydrated)'
+        return repr(self._instance)
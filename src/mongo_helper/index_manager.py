@@ -0,0 +1,187 @@
+import asyncio
+from collections import Counter
+from pymongo import IndexModel
+from loguru import logger
+
+
+# Options that change how an index behaves; anything else (e.g. background) is ignored when comparing
+COMPARED_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression', 'collation', 'hidden',
+                    'weights', 'default_language', 'wildcardProjection')
+BOOLEAN_OPTIONS = ('unique', 'sparse', 'hidden')
+RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$regex', '$exists', '$not', '$elemMatch'}
+
+
+def normalize_keys(keys):
+    if isinstance(keys, str):
+        return [(keys, 1)]
+    if isinstance(keys, dict):
+        return list(keys.items())
+    return [(key, 1) if isinstance(key, str) else tuple(key) for key in keys]
+
+
+def normalize_spec(indexes) -> list[dict]:
+    # Accepts IndexModel objects or (keys, options) tuples and returns index documents like list_indexes()
+    documents = []
+    for index in indexes:
+        if isinstance(index, IndexModel):
+            document = dict(index.document)
+            document['key'] = list(document['key'].items())
+        else:
+            keys, options = index if isinstance(index, tuple) else (index, {})
+            document = IndexModel(normalize_keys(keys), **(options or {})).document
+            document = {**document, 'key': list(document['key'].items())}
+        documents.append(document)
+    return documents
+
+
+def text_fields(keys) -> list:
+    return [field for field, kind in keys if kind == 'text']
+
+
+def comparable_keys(keys) -> tuple:
+    # The server stores text indexes as _fts/_ftsx at the first text field, with the text fields in weights
+    keys = [tuple(key) for key in keys]
+    fields = text_fields(keys)
+    if not fields or fields == ['_fts']:
+        return tuple(keys)
+    position = next(i for i, (_, kind) in enumerate(keys) if kind == 'text')
+    rest = [key for key in keys if key[1] != 'text']
+    return tuple(rest[:position] + [('_fts', 'text'), ('_ftsx', 1)] + rest[position:])
+
+
+def compared_options(document, spec=None) -> dict:
+    # Fills in the defaults the server reports back; for collation only the keys the spec sets are compared,
+    # since list_indexes() returns the complete collation document
+    is_text = bool(text_fields(document['key']))
+    options = {}
+    for option in COMPARED_OPTIONS:
+        value = document.get(option)
+        if option in BOOLEAN_OPTIONS:
+            value = bool(value)
+        elif option == 'collation' and value is not None and spec is not None and spec.get('collation'):
+            value = {key: value.get(key) for key in spec['collation']}
+        elif option == 'weights' and is_text:
+            value = dict(value) if value is not None else {field: 1 for field in text_fields(document['key'])}
+        elif option == 'default_language' and is_text and value is None:
+            value = 'english'
+        if value is not None:
+            options[option] = value
+    return options
+
+
+def index_matches(current, wanted) -> bool:
+    return (comparable_keys(current['key']) == comparable_keys(wanted['key'])
+            and compared_options(current, wanted) == compared_options(wanted))
+
+
+async def sync_collection_indexes(collection, indexes, drop_unknown=False, dry_run=False) -> dict:
+    report = {'created': [], 'dropped': [], 'rebuilt': [], 'unchanged': []}
+    existing = {}
+    async for index in collection.list_indexes():
+        existing[index['name']] = {**index, 'key': list(index['key'].items())}
+
+    existing_by_key = {comparable_keys(index['key']): index for index in existing.values()}
+    handled = {'_id_'}
+    to_create = []
+    for wanted in normalize_spec(indexes):
+        current = existing.get(wanted['name']) or existing_by_key.get(comparable_keys(wanted['key']))
+        if current is None:
+            report['created'].append(wanted['name'])
+            to_create.append(wanted)
+            continue
+        handled.add(current['name'])
+        if not index_matches(current, wanted):
+            report['rebuilt'].append(wanted['name'])
+            if not dry_run:
+                await collection.drop_index(current['name'])
+            to_create.append(wanted)
+        else:
+            report['unchanged'].append(current['name'])
+
+    if drop_unknown:
+        for name in existing:
+            if name not in handled:
+                report['dropped'].append(name)
+                if not dry_run:
+                    await collection.drop_index(name)
+
+    if to_create and not dry_run:
+        models = [IndexModel(document['key'], **{k: v for k, v in document.items() if k not in ('key', 'v')})
+                  for document in to_create]
+        await collection.create_indexes(models)
+    return report
+
+
+async def ensure_indexes(database, spec, drop_unknown=False, dry_run=False) -> dict:
+    # spec maps collection names to their wanted indexes; collections are synced concurrently
+    names = list(spec)
+    reports = await asyncio.gather(*(sync_collection_indexes(database[name], spec[name], drop_unknown, dry_run)
+                                     for name in names))
+    for name, report in zip(names, reports):
+        if report['created'] or report['dropped'] or report['rebuilt']:
+            logger.info(f"Indexes of {name}: created {report['created']}, dropped {report['dropped']}, "
+                        f"rebuilt {report['rebuilt']}")
+    return dict(zip(names, reports))
+
+
+def classify_filter(query, equality=None, ranges=None):
+    equality = set() if equality is None else equality
+    ranges = set() if ranges is None else ranges
+    for key, value in (query or {}).items():
+        if key == '$and':
+            for condition in value:
+                classify_filter(condition, equality, ranges)
+        elif key.startswith('$'):
+            continue
+        elif isinstance(value, dict) and any(operator in RANGE_OPERATORS for operator in value):
+            ranges.add(key)
+        else:
+            equality.add(key)
+    return equality, ranges
+
+
+# Records query shapes seen by the builders and suggests compound indexes by the equality-sort-range rule
+class IndexAdvisor:
+    def __init__(self):
+        self.shapes = {}
+
+    def record(self, namespace, query, sort=None):
+        equality, ranges = classify_filter(query)
+        sort_keys = tuple(key for key, _ in normalize_keys(sort)) if sort else ()
+        shape = (tuple(sorted(equality)), sort_keys, tuple(sorted(ranges - equality)))
+        self.shapes.setdefault(namespace, Counter())[shape] += 1
+
+    def suggest(self, namespace, existing_indexes=None, min_count=1) -> list[dict]:
+        existing = [[key for key, _ in normalize_keys(keys)] for keys in existing_indexes or []]
+        suggestions = {}
+        for (equality, sort_keys, ranges), count in self.shapes.get(namespace, Counter()).most_common():
+            if count < min_count:
+                continue
+            fields = [*equality, *(key for key in sort_keys if key not in equality),
+                      *(key for key in ranges if key not in sort_keys)]
+            if not fields or fields == ['_id']:
+                continue
+            if any(index[:len(fields)] == fields for index in existing):
+                continue
+            key = tuple(fields)
+            if key not in suggestions:
+                suggestions[key] = {'keys': [(field, 1) for field in fields], 'count': 0}
+            suggestions[key]['count'] += count
+        return sorted(suggestions.values(), key=lambda suggestion: -suggestion['count'])
+
+    @staticmethod
+    async def unused_indexes(collection) -> list[str]:
+        # Access counters reset when mongod restarts, so read this after the workload has run for a while
+        unused = []
+        async for stats in collection.aggregate([{'$indexStats': {}}]):
+            if stats['name'] != '_id_' and stats['accesses']['ops'] == 0:
+                unused.append(stats['name'])
+        return unused
+
+    async def report(self, collection) -> dict:
+        namespace = f'{collection.database.name}.{collection.name}'
+        existing = [index['key'] async for index in collection.list_indexes()]
+        return {
+            'suggested': self.suggest(namespace, existing),
+            'unused': await self.unused_indexes(collection),
+        }
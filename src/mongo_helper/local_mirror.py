@@ -0,0 +1,207 @@
+import asyncio
+import copy
+import datetime
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+from loguru import logger
+
+
+# Server error code when the resume token has fallen off the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+# In-memory copy of a small collection kept current by a change stream, with secondary indexes on chosen fields
+class LocalMirror:
+    def __init__(self, adapter, collection_name, index_fields=(), db_name=None, copy_results=False,
+                 reconnect_delay=1.0):
+        self.adapter = adapter
+        self.collection_name = collection_name
+        self.index_fields = tuple(index_fields)
+        self.db_name = db_name
+        self.copy_results = copy_results
+        self.reconnect_delay = reconnect_delay
+        self.documents = {}
+        self.indexes = {field: {} for field in self.index_fields}
+        self.resume_token = None
+        self.lag_seconds = None
+        self.last_applied_at = None
+        self.ready = asyncio.Event()
+        self.started = None
+        self.consumer = None
+        self.collection = None
+        self.task = None
+        self.stats = {'events': 0, 'reloads': 0, 'reconnects': 0}
+
+    async def start(self):
+        self.consumer = self.adapter.create_consumer(self.db_name)
+        self.collection = self.adapter.get_collection(self.consumer, self.collection_name).collection
+        self.started = asyncio.get_running_loop().create_future()
+        self.task = asyncio.ensure_future(self.run())
+        try:
+            await self.started
+        except BaseException:
+            await self.stop()
+            raise
+        return self
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.consumer is not None:
+            self.adapter.close_consumer(self.consumer)
+            self.consumer = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def run(self):
+        with self.consumer.in_use():
+            try:
+                await self.follow()
+            except Exception as e:
+                # Errors before the first snapshot go to start() instead of leaving it waiting forever
+                if not self.started.done():
+                    self.started.set_exception(e)
+                    return
+                raise
+
+    async def follow(self):
+        while True:
+            try:
+                await self.tail(reload=self.resume_token is None)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if not self.ready.is_set():
+                    raise
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning(f'Change stream history lost for {self.collection_name}, reloading.')
+                    self.resume_token = None
+                else:
+                    logger.warning(e)
+                self.stats['reconnects'] += 1
+                await asyncio.sleep(self.reconnect_delay)
+            except PyMongoError as e:
+                if not self.ready.is_set():
+                    raise
+                logger.warning(e)
+                self.stats['reconnects'] += 1
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def tail(self, reload):
+        options = {'full_document': 'updateLookup'}
+        if not reload:
+            options['resume_after'] = self.resume_token
+        # The stream is opened before the snapshot is read, so no change between the two is missed
+        async with self.collection.watch(**options) as stream:
+            if reload:
+                await self.reload()
+            self.ready.set()
+            if not self.started.done():
+                self.started.set_result(None)
+            async for change in stream:
+                self.apply(change)
+
+    async def reload(self):
+        documents = {}
+        async for document in self.collection.find({}):
+            documents[document['_id']] = document
+        self.documents = {}
+        self.indexes = {field: {} for field in self.index_fields}
+        for document in documents.values():
+            self.put(document)
+        self.stats['reloads'] += 1
+        self.last_applied_at = time.time()
+
+    def apply(self, change):
+        operation = change['operationType']
+        if operation in ('insert', 'replace', 'update'):
+            document = change.get('fullDocument')
+            if document is None:
+                # The document was deleted before updateLookup could read it
+                self.remove(change['documentKey']['_id'])
+            else:
+                self.put(document)
+        elif operation == 'delete':
+            self.remove(change['documentKey']['_id'])
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            # The stream ends after these; run() then reloads and swaps in a fresh snapshot
+            self.resume_token = None
+            return
+
+        self.resume_token = change['_id']
+        self.stats['events'] += 1
+        self.last_applied_at = time.time()
+        wall_time = change.get('wallTime')
+        if wall_time is not None:
+            event_time = wall_time.replace(tzinfo=wall_time.tzinfo or datetime.timezone.utc).timestamp()
+        else:
+            event_time = change['clusterTime'].time
+        self.lag_seconds = max(self.last_applied_at - event_time, 0.0)
+
+    @staticmethod
+    def index_values(value):
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            try:
+                hash(item)
+            except TypeError:
+                continue
+            yield item
+
+    def put(self, document):
+        self.remove(document['_id'])
+        self.documents[document['_id']] = document
+        for field, index in self.indexes.items():
+            for value in self.index_values(document.get(field)):
+                index.setdefault(value, set()).add(document['_id'])
+
+    def remove(self, document_id):
+        document = self.documents.pop(document_id, None)
+        if document is None:
+            return
+        for field, index in self.indexes.items():
+            for value in self.index_values(document.get(field)):
+                ids = index.get(value)
+                if ids is not None:
+                    ids.discard(document_id)
+                    if not ids:
+                        del index[value]
+
+    def result(self, document):
+        return copy.deepcopy(document) if self.copy_results else document
+
+    def get(self, document_id):
+        document = self.documents.get(document_id)
+        return self.result(document) if document is not None else None
+
+    def find(self, field, value) -> list:
+        if field == '_id':
+            return [self.get(value)] if value in self.documents else []
+        if field not in self.indexes:
+            raise ValueError(f'{field} is not an indexed field of the mirror.')
+        return [self.result(self.documents[document_id]) for document_id in self.indexes[field].get(value, ())]
+
+    def find_one(self, field, value):
+        documents = self.find(field, value)
+        return documents[0] if documents else None
+
+    def find_in(self, field, values) -> list:
+        found = {}
+        for value in values:
+            for document in self.find(field, value):
+                found[document['_id']] = document
+        return list(found.values())
+
+    @property
+    def lag(self):
+        # Seconds between the last applied change being written on the server and reaching the mirror
+        return self.lag_seconds
+
+    def __len__(self):
+        return len(self.documents)
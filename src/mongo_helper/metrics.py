@@ -0,0 +1,246 @@
+import threading
+import time
+import bson
+from pymongo import monitoring
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def document_size(document) -> int:
+    raw = getattr(document, 'raw', None)
+    return len(raw) if raw is not None else len(bson.encode(document))
+
+
+def result_size(operation, result, measure_bytes=False) -> tuple[int, int]:
+    # Documents (and their BSON bytes) an operation returned; find yields a list and find_one a document or None
+    if isinstance(result, list):
+        documents = result
+    elif operation == 'find_one' and result is not None:
+        documents = [result]
+    else:
+        return 0, 0
+    return len(documents), sum(document_size(document) for document in documents) if measure_bytes else 0
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def percentile(self, q):
+        # Linear interpolation inside the bucket that holds the q-th observation
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+
+# Operation, command and pool metrics; listener callbacks run on motor's worker threads, hence the lock
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS, measure_bytes=False):
+        self.buckets = buckets
+        self.measure_bytes = measure_bytes
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.commands = {}
+        self.pool_checkout_wait = Histogram(buckets)
+        self.pool_counters = {'connections_created': 0, 'connections_closed': 0, 'checkouts': 0,
+                              'checkout_failures': 0}
+
+    @staticmethod
+    def new_series(buckets):
+        return {'latency': Histogram(buckets), 'errors': 0, 'documents': 0, 'bytes': 0}
+
+    def observe_operation(self, operation, namespace, duration, documents=0, size=0, error=False):
+        with self.lock:
+            series = self.operations.setdefault((operation, namespace), self.new_series(self.buckets))
+            series['latency'].observe(duration)
+            series['documents'] += documents
+            series['bytes'] += size
+            if error:
+                series['errors'] += 1
+
+    def observe_command(self, command_name, database_name, duration, documents=0, size=0, error=False):
+        with self.lock:
+            series = self.commands.setdefault((command_name, database_name), self.new_series(self.buckets))
+            series['latency'].observe(duration)
+            series['documents'] += documents
+            series['bytes'] += size
+            if error:
+                series['errors'] += 1
+
+    def observe_checkout(self, duration=None, failed=False):
+        with self.lock:
+            if failed:
+                self.pool_counters['checkout_failures'] += 1
+                return
+            self.pool_counters['checkouts'] += 1
+            if duration is not None:
+                self.pool_checkout_wait.observe(duration)
+
+    def count_connection(self, counter):
+        with self.lock:
+            self.pool_counters[counter] += 1
+
+    def listeners(self) -> list:
+        # Pass these as event_listeners when the client is created, e.g. MongoClientAdapter(event_listeners=...)
+        return [CommandMetricsListener(self), PoolMetricsListener(self)]
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'operations': {f'{operation} {namespace}': {**series['latency'].snapshot(),
+                                                            'errors': series['errors'],
+                                                            'documents': series['documents'],
+                                                            'bytes': series['bytes']}
+                               for (operation, namespace), series in self.operations.items()},
+                'commands': {f'{command} {database}': {**series['latency'].snapshot(), 'errors': series['errors'],
+                                                       'documents': series['documents'], 'bytes': series['bytes']}
+                             for (command, database), series in self.commands.items()},
+                'pool': {**self.pool_counters, 'checkout_wait': self.pool_checkout_wait.snapshot()},
+            }
+
+    def to_prometheus(self, prefix='mongo_helper') -> str:
+        lines = []
+        with self.lock:
+            self.write_histograms(lines, f'{prefix}_operation_duration_seconds', ('operation', 'namespace'),
+                                  {key: series['latency'] for key, series in self.operations.items()})
+            self.write_counters(lines, f'{prefix}_operation_errors_total', ('operation', 'namespace'),
+                                {key: series['errors'] for key, series in self.operations.items()})
+            self.write_counters(lines, f'{prefix}_operation_documents_returned_total', ('operation', 'namespace'),
+                                {key: series['documents'] for key, series in self.operations.items()})
+            if self.measure_bytes:
+                self.write_counters(lines, f'{prefix}_operation_bytes_returned_total', ('operation', 'namespace'),
+                                    {key: series['bytes'] for key, series in self.operations.items()})
+            self.write_histograms(lines, f'{prefix}_command_duration_seconds', ('command', 'database'),
+                                  {key: series['latency'] for key, series in self.commands.items()})
+            self.write_counters(lines, f'{prefix}_command_errors_total', ('command', 'database'),
+                                {key: series['errors'] for key, series in self.commands.items()})
+            self.write_counters(lines, f'{prefix}_command_documents_returned_total', ('command', 'database'),
+                                {key: series['documents'] for key, series in self.commands.items()})
+            if self.measure_bytes:
+                self.write_counters(lines, f'{prefix}_command_bytes_returned_total', ('command', 'database'),
+                                    {key: series['bytes'] for key, series in self.commands.items()})
+            self.write_histograms(lines, f'{prefix}_pool_checkout_wait_seconds', (), {(): self.pool_checkout_wait})
+            for counter, value in self.pool_counters.items():
+                self.write_counters(lines, f'{prefix}_pool_{counter}_total', (), {(): value})
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def format_labels(names, values, extra=None):
+        pairs = list(zip(names, values)) + list(extra or [])
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def write_histograms(self, lines, name, label_names, histograms):
+        lines.append(f'# TYPE {name} histogram')
+        for label_values, histogram in histograms.items():
+            cumulative = 0
+            for index, bucket_count in enumerate(histogram.counts):
+                cumulative += bucket_count
+                bound = repr(histogram.buckets[index]) if index < len(histogram.buckets) else '+Inf'
+                labels = self.format_labels(label_names, label_values, [('le', bound)])
+                lines.append(f'{name}_bucket{labels} {cumulative}')
+            labels = self.format_labels(label_names, label_values)
+            lines.append(f'{name}_sum{labels} {histogram.sum}')
+            lines.append(f'{name}_count{labels} {histogram.count}')
+
+    def write_counters(self, lines, name, label_names, values):
+        lines.append(f'# TYPE {name} counter')
+        for label_values, value in values.items():
+            lines.append(f'{name}{self.format_labels(label_names, label_values)} {value}')
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        reply = event.reply or {}
+        cursor = reply.get('cursor') or {}
+        documents = len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+        size = len(bson.encode(reply)) if self.registry.measure_bytes and reply else 0
+        self.registry.observe_command(event.command_name, event.database_name, event.duration_micros / 1e6,
+                                      documents, size)
+
+    def failed(self, event):
+        self.registry.observe_command(event.command_name, event.database_name, event.duration_micros / 1e6,
+                                      error=True)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.checkout_started = threading.local()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.registry.count_connection('connections_created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.registry.count_connection('connections_closed')
+
+    def connection_check_out_started(self, event):
+        self.checkout_started.value = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self.registry.observe_checkout(failed=True)
+
+    def connection_checked_out(self, event):
+        # Newer pymongo reports the wait itself; otherwise it is measured from the start event on the same thread
+        duration = getattr(event, 'duration', None)
+        if duration is None and getattr(self.checkout_started, 'value', None) is not None:
+            duration = time.perf_counter() - self.checkout_started.value
+        self.checkout_started.value = None
+        self.registry.observe_checkout(duration)
+
+    def connection_checked_in(self, event):
+        pass
@@ -0,0 +1,72 @@
+from pydantic import BaseModel
+
+
+_projection_cache = {}
+
+
+def model_fields(model):
+    # (stored names, annotation) pairs; names is None when an AliasChoices or AliasPath hides the stored key
+    if hasattr(model, 'model_fields'):
+        populate_by_name = model.model_config.get('populate_by_name', False)
+        fields = []
+        for name, field in model.model_fields.items():
+            alias = field.validation_alias or field.alias
+            if alias is None:
+                names = [name]
+            elif isinstance(alias, str):
+                names = [alias, name] if populate_by_name and alias != name else [alias]
+            else:
+                names = None
+            fields.append((names, field.annotation))
+        return fields
+    return [([field.alias], field.outer_type_) for field in model.__fields__.values()]
+
+
+def stored_name(model, name):
+    # The key a field is stored under, i.e. its alias; names that are not fields (or already aliases) pass through
+    fields = getattr(model, 'model_fields', None) or getattr(model, '__fields__', {})
+    field = fields.get(name)
+    return getattr(field, 'alias', None) or name
+
+
+def allows_extra(model):
+    config = getattr(model, 'model_config', None)
+    if isinstance(config, dict):
+        return config.get('extra') == 'allow'
+    extra = getattr(getattr(model, '__config__', None), 'extra', None)
+    return getattr(extra, 'value', extra) == 'allow'
+
+
+def is_model(annotation):
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def collect_paths(model, prefix='', seen=()):
+    # Only plain submodel fields are projected field by field. A projection on a.b drops a null or scalar a and
+    # non document array items, so Optional, Union and list fields are fetched whole to validate as before
+    if allows_extra(model) or model in seen:
+        return [prefix.rstrip('.')] if prefix else None
+    paths = []
+    for names, annotation in model_fields(model):
+        if names is None:
+            return [prefix.rstrip('.')] if prefix else None
+        for name in names:
+            if is_model(annotation) and model_fields(annotation):
+                paths.extend(collect_paths(annotation, f'{prefix}{name}.', (*seen, model)))
+            else:
+                paths.append(f'{prefix}{name}')
+    return paths
+
+
+def derive_projection(model):
+    # None means the model accepts arbitrary fields, so the whole document has to be fetched
+    if model not in _projection_cache:
+        paths = collect_paths(model)
+        if paths is None:
+            projection = None
+        else:
+            projection = {path: 1 for path in paths}
+            if '_id' not in projection:
+                projection['_id'] = 0
+        _projection_cache[model] = projection
+    return _projection_cache[model]
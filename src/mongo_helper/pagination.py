@@ -0,0 +1,63 @@
+import base64
+import bson
+
+
+class Page:
+    def __init__(self, items, next_token=None, previous_token=None):
+        self.items = items
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_token is not None
+
+
+def get_field(document, field):
+    value = document
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+# Tokens are BSON so ObjectId and datetime sort keys survive the round trip
+def encode_token(document, sort_field, direction) -> str:
+    payload = {'f': sort_field, 'd': direction, 'v': get_field(document, sort_field), 'id': document['_id']}
+    return base64.urlsafe_b64encode(bson.encode(payload)).decode()
+
+
+def decode_token(token, sort_field, direction) -> dict:
+    try:
+        payload = bson.decode(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError('Invalid pagination token.')
+    if payload.get('f') != sort_field or payload.get('d') != direction:
+        raise ValueError('Pagination token does not match the sort order.')
+    return payload
+
+
+def seek_filter(sort_field, value, last_id, direction) -> dict:
+    # Null and missing values sort before everything else but never match $gt / $lt, so they get their own terms
+    operator = '$gt' if direction == 1 else '$lt'
+    if sort_field == '_id':
+        return {'_id': {operator: last_id}}
+    if value is None:
+        if direction == 1:
+            return {'$or': [
+                {sort_field: {'$ne': None}},
+                {sort_field: None, '_id': {operator: last_id}},
+            ]}
+        return {sort_field: None, '_id': {operator: last_id}}
+    conditions = [
+        {sort_field: {operator: value}},
+        {sort_field: value, '_id': {operator: last_id}},
+    ]
+    if direction == -1:
+        conditions.append({sort_field: None})
+    return {'$or': conditions}
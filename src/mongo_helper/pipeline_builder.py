@@ -0,0 +1,198 @@
+import copy
+
+
+# Stages that emit exactly one document per input document
+ONE_TO_ONE_STAGES = {'$project', '$addFields', '$set', '$lookup'}
+
+
+def match_fields(condition):
+    # Root fields a $match filter reads, or None when it can not be known (e.g. $expr, $where, $text)
+    fields = set()
+    for key, value in condition.items():
+        if key in ('$and', '$or', '$nor'):
+            for sub_condition in value:
+                sub_fields = match_fields(sub_condition)
+                if sub_fields is None:
+                    return None
+                fields |= sub_fields
+        elif key.startswith('$'):
+            return None
+        else:
+            fields.add(key.split('.')[0])
+    return fields
+
+
+def is_plain_inclusion(projection):
+    return all(value in (1, True) for key, value in projection.items() if key != '_id')
+
+
+def keeps_field(projection, field):
+    # Whether a plain inclusion keeps a root field; _id is kept unless it is excluded explicitly
+    if field == '_id':
+        return projection.get('_id', 1) not in (0, False)
+    return projection.get(field) in (1, True)
+
+
+def stage_writes(stage):
+    # Root fields a stage creates or changes, or None when the stage reshapes the whole document
+    name, body = next(iter(stage.items()))
+    if name in ('$addFields', '$set'):
+        return {key.split('.')[0] for key in body}
+    if name == '$lookup':
+        return {body['as'].split('.')[0]}
+    if name == '$unwind':
+        path = body if isinstance(body, str) else body['path']
+        written = {path.lstrip('$').split('.')[0]}
+        if isinstance(body, dict) and body.get('includeArrayIndex'):
+            written.add(body['includeArrayIndex'])
+        return written
+    if name == '$sort':
+        return set()
+    return None
+
+
+def can_move_match_before(match_stage, stage):
+    fields = match_fields(match_stage['$match'])
+    if fields is None:
+        return False
+    name, body = next(iter(stage.items()))
+    if name == '$project':
+        if is_plain_inclusion(body):
+            return all(keeps_field(body, field) for field in fields)
+        # Excluding a.b changes what a match on a sees, so excluded paths are compared by their root
+        return all(value in (0, False) for value in body.values()) and not fields & {key.split('.')[0] for key in body}
+    written = stage_writes(stage)
+    return written is not None and not fields & written
+
+
+def merge_matches(first, second):
+    if not set(first) & set(second):
+        return {**first, **second}
+    return {'$and': [first, second]}
+
+
+# Fluent aggregation pipeline builder with a client side stage optimizer
+class Pipeline:
+    def __init__(self, collection=None, stages=None):
+        self.collection = collection
+        self.stages = list(stages or [])
+        self.allow_disk_use = None
+        self.batch_size = None
+
+    def stage(self, stage):
+        self.stages.append(stage)
+        return self
+
+    def match(self, condition):
+        return self.stage({'$match': condition})
+
+    def project(self, projection):
+        return self.stage({'$project': projection})
+
+    def add_fields(self, fields):
+        return self.stage({'$addFields': fields})
+
+    def group(self, id, **accumulators):
+        return self.stage({'$group': {'_id': id, **accumulators}})
+
+    def lookup(self, from_collection, local_field, foreign_field, as_field):
+        return self.stage({'$lookup': {'from': from_collection, 'localField': local_field,
+                                       'foreignField': foreign_field, 'as': as_field}})
+
+    def unwind(self, path, preserve_null_and_empty_arrays=False):
+        path = path if path.startswith('$') else f'${path}'
+        if preserve_null_and_empty_arrays:
+            return self.stage({'$unwind': {'path': path, 'preserveNullAndEmptyArrays': True}})
+        return self.stage({'$unwind': path})
+
+    def sort(self, *keys):
+        # sort('a', ('b', -1)) or sort({'a': 1, 'b': -1})
+        if len(keys) == 1 and isinstance(keys[0], dict):
+            return self.stage({'$sort': dict(keys[0])})
+        spec = {}
+        for key in keys:
+            field, direction = (key, 1) if isinstance(key, str) else key
+            spec[field] = direction
+        return self.stage({'$sort': spec})
+
+    def skip(self, count):
+        return self.stage({'$skip': count})
+
+    def limit(self, count):
+        return self.stage({'$limit': count})
+
+    def facet(self, **pipelines):
+        return self.stage({'$facet': {name: pipeline.build() if isinstance(pipeline, Pipeline) else pipeline
+                                      for name, pipeline in pipelines.items()}})
+
+    def options(self, allow_disk_use=None, batch_size=None):
+        self.allow_disk_use = allow_disk_use
+        self.batch_size = batch_size
+        return self
+
+    def build(self, optimize=True) -> list[dict]:
+        stages = copy.deepcopy(self.stages)
+        return optimize_pipeline(stages) if optimize else stages
+
+    def aggregate_options(self) -> dict:
+        options = {}
+        if self.allow_disk_use is not None:
+            options['allowDiskUse'] = self.allow_disk_use
+        elif any(name in stage for stage in self.stages for name in ('$group', '$sort', '$facet')):
+            options['allowDiskUse'] = True
+        if self.batch_size is not None:
+            options['batchSize'] = self.batch_size
+        return options
+
+    def cursor(self, optimize=True):
+        if self.collection is None:
+            raise ValueError('Pipeline is not bound to a collection.')
+        return self.collection.aggregate(self.build(optimize), **self.aggregate_options())
+
+    async def execute(self, optimize=True) -> list:
+        return await self.cursor(optimize).to_list(length=None)
+
+    async def stream(self, optimize=True):
+        async for document in self.cursor(optimize):
+            yield document
+
+
+def optimize_pipeline(stages) -> list[dict]:
+    changed = True
+    while changed:
+        changed = False
+        index = 0
+        while index < len(stages) - 1:
+            current, following = stages[index], stages[index + 1]
+            current_name, following_name = next(iter(current)), next(iter(following))
+
+            if current_name == following_name == '$match':
+                stages[index:index + 2] = [{'$match': merge_matches(current['$match'], following['$match'])}]
+                changed = True
+            elif current_name == following_name == '$limit':
+                stages[index:index + 2] = [{'$limit': min(current['$limit'], following['$limit'])}]
+                changed = True
+            elif current_name == following_name == '$skip':
+                stages[index:index + 2] = [{'$skip': current['$skip'] + following['$skip']}]
+                changed = True
+            elif following_name == '$match' and current_name in ('$sort', '$project', '$addFields', '$set',
+                                                                 '$lookup', '$unwind'):
+                if can_move_match_before(following, current):
+                    stages[index], stages[index + 1] = following, current
+                    changed = True
+                    index = max(index - 1, 0)
+                    continue
+            elif following_name == '$limit' and current_name in ONE_TO_ONE_STAGES:
+                stages[index], stages[index + 1] = following, current
+                changed = True
+                index = max(index - 1, 0)
+                continue
+            elif following_name == '$project' and current_name == '$sort':
+                # Trimming documents before a blocking sort is safe when every sort key survives the projection
+                projection = following['$project']
+                if is_plain_inclusion(projection) and all(keeps_field(projection, key.split('.')[0])
+                                                          for key in current['$sort']):
+                    stages[index], stages[index + 1] = following, current
+                    changed = True
+            index += 1
+    return stages
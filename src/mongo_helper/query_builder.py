@@ -1,13 +1,42 @@
 from .client_adapter import MongoClientAdapter
 from typing import List, Tuple, Dict, Any, Union, Optional
 from pymongo import IndexModel
+from .pagination import Page, encode_token, decode_token, seek_filter
+from mongohelper.parallel_scan import parallel_scan as merged_scan, scan_partitions
+from .bulk import BulkSummary, build_upserts, chunked_bulk_write
+from .pipeline_builder import Pipeline
+from .index_manager import sync_collection_indexes
+from .raw_bson import write_raw
+from .columns import collect_columns
+from .explain import explain_query, assert_indexed
+
+
+def find_options(batch_size=None, sort=None, limit=0, skip=0, hint=None, max_time_ms=None) -> dict:
+    options = {'limit': limit, 'skip': skip}
+    if batch_size is not None:
+        options['batch_size'] = batch_size
+    if sort is not None:
+        options['sort'] = [(sort, 1)] if isinstance(sort, str) else sort
+    if hint is not None:
+        options['hint'] = hint
+    if max_time_ms is not None:
+        options['max_time_ms'] = max_time_ms
+    return options
+
+
 class AsyncQueryBuilder:
     def __init__(self, adapter: MongoClientAdapter, database_name, collection_name):
         self.adapter = adapter
         self.database_name = database_name
         self.collection_name = collection_name
         self.consumer = self.adapter.create_consumer(self.database_name)
-        self.collection = self.adapter.get_collection(self.consumer, self.collection_name)
+        self.collection_wrapper = self.adapter.get_collection(self.consumer, self.collection_name)
+
+    @property
+    def collection(self):
+        # Wrappers are shared between builders, so the builder touches its own consumer on every operation
+        self.consumer.touch()
+        return self.collection_wrapper
 
     async def __aenter__(self):
         return self
@@ -18,6 +47,12 @@ class AsyncQueryBuilder:
         #    # An exception occurred, handle it here
         #    logger.info(f"An exception of type {exc_type} occurred: {exc}")
 
+    def set_slow_query_threshold(self, threshold_ms):
+        # Overrides the slow query log threshold for this builder's collection
+        if self.collection.slow_query_log is None:
+            raise ValueError('Slow query log is not enabled on the adapter.')
+        self.collection.slow_query_log.set_threshold(self.collection.namespace, threshold_ms)
+
     # New method to select fields
     @staticmethod
     def select_fields(include=None, exclude=None):
@@ -53,27 +88,147 @@ class AsyncQueryBuilder:
         return projection
 
     # Asynchronous methods
-    async def find(self, query=None, projection=None):
+    async def find(self, query=None, projection=None, use_cache=True, raw=False):
         if query is None:
             query = {}
 
         if projection is None:
             projection = {}
+        collection = self.collection.raw() if raw else self.collection
 
+        async def load():
+            cursor = await collection.find(query, projection)
+            return await collection.observe('find', cursor.to_list(length=None), query, projection)
 
-        cursor = await self.collection.find(query, projection)
-        results = await cursor.to_list(length=None)
-        return results
+        if use_cache and not raw:
+            return await self.collection.cached_read('find', query, projection, load)
+        return await load()
 
-    async def find_one(self, query=None, projection=None):
+    async def find_one(self, query=None, projection=None, use_cache=True, raw=False):
         if query is None:
             query = {}
 
         if projection is None:
             projection = {}
+        if raw:
+            return await self.collection.raw().find_one(query, projection)
+        if use_cache:
+            return await self.collection.cached_read('find_one', query, projection,
+                                                     lambda: self.collection.find_one(query, projection))
         result = await self.collection.find_one(query, projection)
         return result
 
+    async def iter_find(self, query=None, projection=None, batch_size=None, sort=None, limit=0, skip=0, hint=None,
+                        max_time_ms=None, chunk_size=None, raw=False):
+        # Streams the cursor instead of loading the whole result set, yielding documents or lists of chunk_size
+        with self.consumer.in_use():
+            options = find_options(batch_size, sort, limit, skip, hint, max_time_ms)
+            collection = self.collection.raw() if raw else self.collection
+            cursor = await collection.find(query or {}, projection or None, **options)
+            if chunk_size is None:
+                async for document in cursor:
+                    yield document
+                return
+
+            chunk = []
+            async for document in cursor:
+                chunk.append(document)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    async def find_columns(self, query=None, fields=None, dtypes=None, batch_size=None, sort=None, limit=0,
+                           capacity=1024) -> dict:
+        # Streams the cursor into one numpy masked array per field, ready for pandas.DataFrame or pyarrow.array
+        with self.consumer.in_use():
+            if not fields:
+                raise ValueError('find_columns needs the fields to export.')
+            projection = {field: 1 for field in fields}
+            if '_id' not in projection:
+                projection['_id'] = 0
+            options = find_options(batch_size, sort, limit)
+            cursor = await self.collection.find(query or {}, projection, **options)
+            return await collect_columns(cursor, fields, dtypes, capacity)
+
+    async def explain(self, query=None, projection=None, sort=None) -> dict:
+        # Winning plan stages, indexes used, keys and docs examined vs returned, blocking sort and selectivity
+        return await explain_query(self.collection.collection, query or {}, projection, sort)
+
+    async def assert_indexed(self, query=None, projection=None, sort=None, allow_blocking_sort=False) -> dict:
+        # Raises QueryNotIndexedError for a COLLSCAN or an in-memory sort, meant for tests
+        return assert_indexed(await self.explain(query, projection, sort), allow_blocking_sort)
+
+    async def export_raw(self, sink, query=None, projection=None, batch_size=None) -> int:
+        # Copies matching documents as BSON bytes to sink without decoding them, returns the bytes written
+        return await write_raw(self.iter_find(query, projection, batch_size=batch_size, raw=True), sink)
+
+    async def paginate(self, query=None, sort_field='_id', direction=1, page_size=50, after=None, before=None,
+                       projection=None) -> Page:
+        # Keyset pagination on sort_field with _id as tie-breaker; pass next_token as after, previous_token as before
+        if after is not None and before is not None:
+            raise ValueError('Cannot paginate after and before a token at the same time.')
+        backward = before is not None
+        token = before if backward else after
+        scan_direction = -direction if backward else direction
+
+        filters = [query] if query else []
+        if token is not None:
+            payload = decode_token(token, sort_field, direction)
+            filters.append(seek_filter(sort_field, payload['v'], payload['id'], scan_direction))
+        if len(filters) > 1:
+            seek_query = {'$and': filters}
+        else:
+            seek_query = filters[0] if filters else {}
+
+        sort = [(sort_field, scan_direction)]
+        if sort_field != '_id':
+            sort.append(('_id', scan_direction))
+        if projection and any(value for value in projection.values()):
+            projection = {**projection, sort_field: 1, '_id': 1}
+
+        cursor = await self.collection.find(seek_query, projection or None, sort=sort, limit=page_size + 1)
+        items = await cursor.to_list(length=page_size + 1)
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if backward:
+            items.reverse()
+        if not items:
+            return Page(items)
+
+        if backward:
+            next_token = encode_token(items[-1], sort_field, direction)
+            previous_token = encode_token(items[0], sort_field, direction) if has_more else None
+        else:
+            next_token = encode_token(items[-1], sort_field, direction) if has_more else None
+            previous_token = encode_token(items[0], sort_field, direction) if token is not None else None
+        return Page(items, next_token, previous_token)
+
+    async def parallel_scan(self, query=None, partitions=4, field='_id', projection=None, batch_size=None,
+                            method='sample'):
+        # Splits field into partitions ranges (sampled or $bucketAuto) and merges the concurrent cursors
+        with self.consumer.in_use():
+            async for document in merged_scan(self.collection.collection, query, partitions, field, projection,
+                                               batch_size, method):
+                yield document
+
+    async def parallel_scan_partitions(self, callback, query=None, partitions=4, field='_id', projection=None,
+                                       batch_size=None, method='sample') -> list[int]:
+        with self.consumer.in_use():
+            return await scan_partitions(self.collection.collection, callback, query, partitions, field, projection,
+                                         batch_size, method)
+
+    def pipeline(self) -> Pipeline:
+        # Stages are reordered by the optimizer when the pipeline is built, see pipeline_builder.optimize_pipeline
+        return Pipeline(self.collection.collection)
+
+    async def aggregate(self, pipeline, optimize=True):
+        with self.consumer.in_use():
+            if not isinstance(pipeline, Pipeline):
+                pipeline = Pipeline(self.collection.collection, pipeline)
+            return await pipeline.execute(optimize)
+
     async def insert_one(self, document):
 
         result = await self.collection.insert_one(document)
@@ -83,6 +238,17 @@ class AsyncQueryBuilder:
         result = await self.collection.insert_many(documents)
         return result
 
+    async def bulk_write(self, requests, chunk_size=1000, max_bytes=8 * 1024 * 1024, concurrency=4,
+                         ordered=False) -> BulkSummary:
+        # Splits requests by count and estimated BSON size and runs the chunks concurrently
+        with self.consumer.in_use():
+            return await chunked_bulk_write(self.collection, requests, chunk_size, max_bytes, concurrency, ordered)
+
+    async def upsert_many(self, documents, key_fields, replace=False, chunk_size=1000, max_bytes=8 * 1024 * 1024,
+                          concurrency=4) -> BulkSummary:
+        requests = build_upserts(documents, key_fields, replace)
+        return await self.bulk_write(requests, chunk_size, max_bytes, concurrency)
+
     async def update_one(self, query, update, upsert=False):
         result = await self.collection.update_one(query, update, upsert=upsert)
         return result
@@ -99,10 +265,25 @@ class AsyncQueryBuilder:
         result = await self.collection.delete_many(query)
         return result
 
-    async def count_documents(self, query):
+    async def count_documents(self, query=None, estimate=False, use_cache=True):
+        # estimate uses collection metadata, which is only exact for an empty filter
+        if estimate and not query:
+            return await self.collection.estimated_document_count()
+        if query is None:
+            query = {}
+        if use_cache:
+            return await self.collection.cached_read('count_documents', query, None,
+                                                     lambda: self.collection.count_documents(query))
         result = await self.collection.count_documents(query)
         return result
 
+    async def count_up_to(self, query, n):
+        # Stops counting at n, which is enough for "has more than n" checks
+        return await self.collection.count_documents(query or {}, limit=n)
+
+    async def has_more_than(self, query, n) -> bool:
+        return await self.count_up_to(query, n + 1) > n
+
     async def create_index(self, keys: Union[str, List[Tuple[str, int]]], options: Optional[Dict[str, Any]] = None) -> str:
         if isinstance(keys, str):
             keys = [(keys, 1)]
@@ -112,5 +293,9 @@ class AsyncQueryBuilder:
 
         return await self.collection.create_index(keys, **options)
 
+    async def ensure_indexes(self, indexes, drop_unknown=False, dry_run=False) -> dict:
+        # Only creates, drops or rebuilds the indexes that differ from list_indexes()
+        return await sync_collection_indexes(self.collection.collection, indexes, drop_unknown, dry_run)
+
     
 
@@ -1,18 +1,49 @@
 from .client_adapter import MongoClientAdapter, Operations
+from .query_builder import find_options
+from .bulk import BulkSummary, build_upserts, chunked_bulk_write
+from .model_projection import derive_projection, stored_name
+from .explain import explain_query, assert_indexed
+from .hydration import LazyModel, dump, hydrate, hydrate_many
+import pymongo
 from pydantic import BaseModel
 from typing import List, Tuple, Dict, Any, Union, Optional, Type, TypeVar, Generic
 
 
+T = TypeVar('T', bound=BaseModel)
+
+
 class AsyncPydanticQueryBuilder:
-    def __init__(self, adapter: MongoClientAdapter, db_name, collection_name, model: Type[T]):
+    def __init__(self, adapter: MongoClientAdapter, db_name, collection_name, model: Type[T], auto_projection=True,
+                 trusted=False):
         self.adapter = adapter
         self.db_name = db_name
         self.collection_name = collection_name
         self.model = model
+        self.auto_projection = auto_projection
+        self.trusted = trusted
+
+    def is_trusted(self, trusted):
+        # trusted builds models without validation, only for collections this application writes itself.
+        # Nothing is coerced either: nested submodels stay plain dicts, so read them as t.sub['x'], not t.sub.x
+        return self.trusted if trusted is None else trusted
+
+    def resolve_projection(self, projection, full_fetch=False):
+        # Without an explicit projection only the fields the model reads are fetched
+        if projection is not None:
+            return projection
+        if self.auto_projection and not full_fetch:
+            return derive_projection(self.model)
+        return None
+
+    @property
+    def collection(self):
+        # Wrappers are shared between builders, so the builder touches its own consumer on every operation
+        self.consumer.touch()
+        return self.collection_wrapper
 
     async def __aenter__(self):
         self.consumer = self.adapter.create_consumer(self.db_name)
-        self.collection = self.adapter.get_collection(self.consumer, self.collection_name)
+        self.collection_wrapper = self.adapter.get_collection(self.consumer, self.collection_name)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -28,17 +59,17 @@ class AsyncPydanticQueryBuilder:
         result = await self.collection.insert_one(document)
         return str(result.inserted_id)
 
-    async def find_one(self, query=None, projection=None) -> Optional[T]:
+    async def find_one(self, query=None, projection=None, full_fetch=False, trusted=None) -> Optional[T]:
         if query is None:
             query = {}
 
-        if projection is None:
-            projection = {}
+        projection = self.resolve_projection(projection, full_fetch)
         result = await self.collection.find_one(query, projection)
-        return self.model.parse_obj(result) if result else None
+        return hydrate(self.model, result, self.is_trusted(trusted)) if result else None
 
     async def update_one(self, query, update, upsert=False) -> int:
-        result = await self.collection.update_one(query, update, upsert=upsert)
+        # Coalesced upserts can not always report their own modified_count, so this one is sent on its own
+        result = await self.collection.update_one(query, update, upsert=upsert, coalesce=False)
         return result.modified_count
 
     async def delete_one(self, query) -> int:
@@ -46,19 +77,60 @@ class AsyncPydanticQueryBuilder:
         return result.deleted_count
 
     async def insert_many(self, documents: List[T]) -> List[str]:
-        result = await self.collection.insert_many([doc.dict() for doc in documents])
+        result = await self.collection.insert_many([dump(doc) for doc in documents])
         return [str(obj_id) for obj_id in result.inserted_ids]
 
-    async def find(self, query=None, projection=None) -> List[T]:
+    async def upsert_many(self, documents: List[T], key_fields, replace=False, chunk_size=1000,
+                          max_bytes=8 * 1024 * 1024, concurrency=4) -> BulkSummary:
+        # key_fields may name model fields; they are matched on the stored (alias) names
+        if isinstance(key_fields, str):
+            key_fields = [key_fields]
+        key_fields = [stored_name(self.model, field) for field in key_fields]
+        with self.consumer.in_use():
+            requests = build_upserts([dump(doc) for doc in documents], key_fields, replace)
+            return await chunked_bulk_write(self.collection, requests, chunk_size, max_bytes, concurrency)
+
+    async def find(self, query=None, projection=None, full_fetch=False, trusted=None) -> List[T]:
         if query is None:
             query = {}
 
-        if projection is None:
-            projection = {}
+        projection = self.resolve_projection(projection, full_fetch)
 
         cursor = await self.collection.find(query, projection)
-        results = await cursor.to_list(length=None)
-        return [self.model.parse_obj(result) for result in results]
+        results = await self.collection.observe('find', cursor.to_list(length=None), query, projection)
+        return hydrate_many(self.model, results, self.is_trusted(trusted))
+
+    async def iter_find(self, query=None, projection=None, batch_size=None, sort=None, limit=0, skip=0, hint=None,
+                        max_time_ms=None, chunk_size=None, full_fetch=False, trusted=None, lazy=False):
+        # lazy yields proxies that validate on first attribute access; chunks are validated as one batch
+        with self.consumer.in_use():
+            trusted = self.is_trusted(trusted)
+            options = find_options(batch_size, sort, limit, skip, hint, max_time_ms)
+            cursor = await self.collection.find(query or {}, self.resolve_projection(projection, full_fetch), **options)
+            if chunk_size is None:
+                async for document in cursor:
+                    yield LazyModel(self.model, document, trusted) if lazy else hydrate(self.model, document, trusted)
+                return
+
+            chunk = []
+            async for document in cursor:
+                chunk.append(document)
+                if len(chunk) >= chunk_size:
+                    yield self.hydrate_chunk(chunk, trusted, lazy)
+                    chunk = []
+            if chunk:
+                yield self.hydrate_chunk(chunk, trusted, lazy)
+
+    def hydrate_chunk(self, documents, trusted, lazy) -> list:
+        if lazy:
+            return [LazyModel(self.model, document, trusted) for document in documents]
+        return hydrate_many(self.model, documents, trusted)
+
+    async def explain(self, query=None, projection=None, sort=None) -> dict:
+        return await explain_query(self.collection.collection, query or {}, self.resolve_projection(projection), sort)
+
+    async def assert_indexed(self, query=None, projection=None, sort=None, allow_blocking_sort=False) -> dict:
+        return assert_indexed(await self.explain(query, projection, sort), allow_blocking_sort)
 
     async def update_many(self, query, update, upsert=False) -> int:
         result = await self.collection.update_many(query, update, upsert=upsert)
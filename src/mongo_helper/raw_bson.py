@@ -0,0 +1,26 @@
+import inspect
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+
+# Documents stay as undecoded BSON bytes and fields are only decoded when accessed
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+async def write_raw(documents, sink) -> int:
+    # Writes each document's BSON bytes straight to sink.write, which may be sync or async
+    written = 0
+    if hasattr(documents, '__aiter__'):
+        async for document in documents:
+            written += await write_document(document, sink)
+    else:
+        for document in documents:
+            written += await write_document(document, sink)
+    return written
+
+
+async def write_document(document, sink) -> int:
+    result = sink.write(document.raw)
+    if inspect.isawaitable(result):
+        await result
+    return len(document.raw)
@@ -0,0 +1,87 @@
+import copy
+import time
+from collections import OrderedDict
+import bson
+
+
+def estimate_size(value) -> int:
+    if isinstance(value, dict):
+        return len(bson.encode(value))
+    if isinstance(value, list):
+        return sum(estimate_size(item) for item in value) + 16
+    return 16
+
+
+# Read-through result cache with per-namespace TTL, LRU eviction by entries and bytes and write invalidation
+class ResultCache:
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, default_ttl=60, ttls=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.entries = OrderedDict()
+        self.namespaces = {}
+        self.generations = {}
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def set_ttl(self, namespace, ttl):
+        self.ttls[namespace] = ttl
+
+    def generation(self, namespace):
+        return self.generations.get(namespace, 0)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return False, None
+        namespace, expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self.stats['expirations'] += 1
+            self.stats['misses'] += 1
+            self.remove(key)
+            return False, None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return True, copy.deepcopy(value)
+
+    def put(self, namespace, key, value, generation):
+        # A write finished while the value was loading, so it may already be stale
+        if generation != self.generation(namespace):
+            return
+        ttl = self.ttls.get(namespace, self.default_ttl)
+        if ttl <= 0:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (namespace, time.monotonic() + ttl, size, copy.deepcopy(value))
+        self.namespaces.setdefault(namespace, set()).add(key)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.stats['evictions'] += 1
+
+    def remove(self, key):
+        namespace, _, size, _ = self.entries.pop(key)
+        self.total_bytes -= size
+        keys = self.namespaces.get(namespace)
+        if keys is not None:
+            keys.discard(key)
+
+    def invalidate(self, namespace):
+        self.generations[namespace] = self.generation(namespace) + 1
+        for key in list(self.namespaces.pop(namespace, ())):
+            if key in self.entries:
+                self.remove(key)
+        self.stats['invalidations'] += 1
+
+    def clear(self):
+        for namespace in list(self.namespaces):
+            self.invalidate(namespace)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'entries': len(self.entries), 'bytes': self.total_bytes}
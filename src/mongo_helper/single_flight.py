@@ -0,0 +1,37 @@
+import asyncio
+import copy
+import hashlib
+import bson
+
+
+def canonical_key(*parts) -> str:
+    # BSON keeps key order, which matters for embedded document equality, so identical queries encode identically
+    return hashlib.sha1(bson.encode({'key': list(parts)})).hexdigest()
+
+
+# Lets concurrent identical reads share one in-flight request
+class SingleFlight:
+    def __init__(self):
+        self.in_flight = {}
+        self.stats = {'calls': 0, 'executed': 0, 'merged': 0}
+
+    async def do(self, key, func):
+        self.stats['calls'] += 1
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.stats['merged'] += 1
+            # Followers get their own copy so one caller mutating the result does not affect the others
+            return copy.deepcopy(await asyncio.shield(task))
+
+        self.stats['executed'] += 1
+        task = asyncio.ensure_future(func())
+        self.in_flight[key] = task
+        task.add_done_callback(lambda _: self.forget(key, task))
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    def get_stats(self) -> dict:
+        return {**self.stats, 'in_flight': len(self.in_flight)}
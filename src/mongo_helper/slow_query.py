@@ -0,0 +1,86 @@
+import asyncio
+import datetime
+import json
+import random
+from loguru import logger
+from .explain import summarize_explain, explain_command
+
+
+EXPLAINABLE_OPERATIONS = {'find', 'find_one', 'count_documents'}
+
+
+def query_shape(value):
+    # Keeps field names and operators but replaces literal values with their type names
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0])] if value and all(isinstance(item, dict) for item in value) else 'array'
+    return type(value).__name__
+
+
+# Logs operations slower than a threshold and samples an executionStats explain for the slow reads
+class SlowQueryLog:
+    def __init__(self, threshold_ms=100, sample_rate=0.1, log_path=None, rotation='10 MB', retention=5,
+                 capped_collection=None, thresholds=None):
+        self.threshold_ms = threshold_ms
+        self.thresholds = dict(thresholds or {})
+        self.sample_rate = sample_rate
+        self.capped_collection = capped_collection
+        self.pending = set()
+        self.logger = logger.bind(slow_query=True)
+        self.sink_id = None
+        if log_path is not None:
+            self.sink_id = logger.add(log_path, rotation=rotation, retention=retention, format='{message}',
+                                      filter=lambda record: record['extra'].get('slow_query', False))
+
+    def set_threshold(self, namespace, threshold_ms):
+        self.thresholds[namespace] = threshold_ms
+
+    def threshold_for(self, namespace):
+        return self.thresholds.get(namespace, self.threshold_ms)
+
+    def check(self, collection, operation, duration, query=None, projection=None):
+        namespace = f'{collection.database.name}.{collection.name}'
+        duration_ms = duration * 1000
+        threshold_ms = self.threshold_for(namespace)
+        if threshold_ms is None or duration_ms < threshold_ms:
+            return
+        record = {
+            'ts': datetime.datetime.now(datetime.timezone.utc),
+            'namespace': namespace,
+            'operation': operation,
+            'shape': query_shape(query) if query is not None else None,
+            'duration_ms': duration_ms,
+        }
+        explain = operation in EXPLAINABLE_OPERATIONS and query is not None and random.random() < self.sample_rate
+        task = asyncio.ensure_future(self.write(collection, record, query, projection, explain))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def write(self, collection, record, query, projection, explain):
+        if explain:
+            try:
+                command = explain_command(collection.name, record['operation'], query, projection)
+                result = await collection.database.command({'explain': command, 'verbosity': 'executionStats'})
+                record['explain'] = summarize_explain(result)
+            except Exception as e:
+                record['explain_error'] = str(e)
+        self.logger.warning(json.dumps(record, default=str))
+        if self.capped_collection is not None:
+            try:
+                await self.capped_collection.insert_one(record)
+            except Exception as e:
+                logger.info(e)
+
+    async def close(self):
+        if self.pending:
+            await asyncio.gather(*self.pending, return_exceptions=True)
+        if self.sink_id is not None:
+            logger.remove(self.sink_id)
+            self.sink_id = None
+
+    @staticmethod
+    async def ensure_capped_collection(db, name='slow_queries', size=16 * 1024 * 1024):
+        if name not in await db.list_collection_names():
+            await db.create_collection(name, capped=True, size=size)
+        return db[name]
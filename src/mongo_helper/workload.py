@@ -0,0 +1,258 @@
+import asyncio
+import concurrent.futures
+import datetime
+import gzip
+import json
+import time
+from collections import Counter
+import bson
+from bson import ObjectId, json_util
+from pymongo import InsertOne
+from loguru import logger
+from .bulk import estimate_request_size
+from .slow_query import query_shape
+
+
+# Rebuilt from placeholders these would hit far more documents than recorded, e.g. {'age': {'$gte': 0}}
+DESTRUCTIVE_FROM_SHAPE = {'delete_one', 'delete_many', 'update_many'}
+
+
+# Values put back into a recorded filter shape when the literal values were not captured
+PLACEHOLDERS = {
+    'int': 0,
+    'float': 0.0,
+    'str': '',
+    'bool': False,
+    'NoneType': None,
+    'ObjectId': ObjectId('000000000000000000000000'),
+    'datetime': datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc),
+    'array': [],
+}
+
+
+def open_log(path, mode):
+    return gzip.open(path, mode + 't') if str(path).endswith('.gz') else open(path, mode)
+
+
+def payload_size(payload) -> int:
+    if payload is None:
+        return 0
+    if isinstance(payload, dict):
+        return len(bson.encode(payload))
+    if isinstance(payload, (list, tuple)):
+        return sum(payload_size(item) for item in payload)
+    return estimate_request_size(payload)
+
+
+# Appends one compact JSON line per operation seen by the Collection wrappers it is attached to.
+# find is recorded when a builder loads the whole result; streamed cursors (iter_find, paginate) are not.
+class WorkloadRecorder:
+    def __init__(self, path, capture_values=False, flush_every=100, flush_interval=1.0):
+        # Filters are stored as shapes only, unless capture_values keeps them verbatim for a faithful replay
+        self.path = path
+        self.capture_values = capture_values
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.flush_handle = None
+        self.file = open_log(path, 'a')
+        # Lines are buffered on the event loop and written (and gzip compressed) by one thread, in order
+        self.buffer = []
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='workload-recorder')
+        self.recorded = 0
+
+    def record(self, name, namespace, started_at, duration=None, query=None, payload=None, error=False):
+        if self.file is None:
+            return
+        entry = {'t': round(started_at, 6), 'op': name, 'ns': namespace}
+        if duration is not None:
+            entry['ms'] = round(duration * 1000, 3)
+        if query is not None:
+            entry['shape'] = query_shape(query)
+            if self.capture_values:
+                entry['q'] = json.loads(json_util.dumps(query))
+        if payload is not None:
+            entry['bytes'] = payload_size(payload)
+            if isinstance(payload, (list, tuple)):
+                entry['n'] = len(payload)
+        if error:
+            entry['err'] = 1
+        self.buffer.append(json.dumps(entry, separators=(',', ':'), default=str) + '\n')
+        self.recorded += 1
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+        elif self.flush_handle is None and self.flush_interval is not None:
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        # A quiet process still gets its entries on disk within flush_interval seconds
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self.flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def write_lines(self, file, lines):
+        try:
+            file.write(''.join(lines))
+            file.flush()
+        except Exception as e:
+            logger.error(f"Could not write workload entries to {self.path}: {e}")
+
+    def flush(self, wait=False):
+        # Hands the buffered lines to the writer thread; wait blocks until they are on disk
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.file is None:
+            return
+        lines, self.buffer = self.buffer, []
+        future = self.writer.submit(self.write_lines, self.file, lines)
+        if wait:
+            future.result()
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.writer.shutdown(wait=True)
+            self.file.close()
+            self.file = None
+
+
+def read_workload(path):
+    with open_log(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def example_filter(shape):
+    if isinstance(shape, dict):
+        return {key: example_filter(value) for key, value in shape.items()}
+    if isinstance(shape, list):
+        return [example_filter(item) for item in shape]
+    return PLACEHOLDERS.get(shape)
+
+
+def entry_filter(entry):
+    if 'q' in entry:
+        return json_util.loads(json.dumps(entry['q']))
+    return example_filter(entry.get('shape', {}))
+
+
+def synthetic_document(size):
+    # Roughly size bytes once encoded; the fixed part accounts for the field names and _id
+    return {'_id': ObjectId(), 'replay': True, 'payload': 'x' * max(size - 48, 0)}
+
+
+async def replay_operation(collection, entry):
+    # Writes carry synthetic documents of the recorded size, since payloads are never captured
+    name = entry['op']
+    count = entry.get('n', 1) or 1
+    size = entry.get('bytes', 0) // count
+    if name == 'find':
+        cursor = await collection.find(entry_filter(entry))
+        return await cursor.to_list(length=None)
+    if name == 'find_one':
+        return await collection.find_one(entry_filter(entry))
+    if name == 'count_documents':
+        return await collection.count_documents(entry_filter(entry))
+    if name == 'estimated_document_count':
+        return await collection.estimated_document_count()
+    if name == 'insert_one':
+        return await collection.insert_one(synthetic_document(size))
+    if name == 'insert_many':
+        return await collection.insert_many([synthetic_document(size) for _ in range(count)])
+    if name in ('update_one', 'update_many'):
+        update = {'$set': {'replay_payload': 'x' * max(size - 40, 0)}}
+        return await getattr(collection, name)(entry_filter(entry), update)
+    if name in ('delete_one', 'delete_many'):
+        return await getattr(collection, name)(entry_filter(entry))
+    if name == 'bulk_write':
+        return await collection.bulk_write([InsertOne(synthetic_document(size)) for _ in range(count)],
+                                           ordered=False)
+    raise ValueError(f'Cannot replay {name} operations.')
+
+
+def percentiles(latencies) -> dict:
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+
+    def at(q):
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000
+
+    return {'count': len(latencies), 'p50_ms': at(0.5), 'p95_ms': at(0.95), 'p99_ms': at(0.99),
+            'max_ms': latencies[-1] * 1000}
+
+
+async def replay_workload(adapter, path, speed=1.0, concurrency=16, db_name=None, allow_destructive=False) -> dict:
+    # speed keeps the recorded spacing scaled by that factor; None replays as fast as concurrency allows.
+    # Deletes and multi-updates recorded without capture_values are skipped unless allow_destructive is set
+    semaphore = asyncio.Semaphore(concurrency)
+    consumers = {}
+    latencies = {}
+    recorded = {}
+    errors = Counter()
+    skipped = Counter()
+    tasks = set()
+    max_lag = 0.0
+    first = None
+
+    def collection_for(namespace):
+        database, collection_name = namespace.split('.', 1)
+        database = db_name or database
+        if database not in consumers:
+            consumers[database] = adapter.create_consumer(database)
+        return adapter.get_collection(consumers[database], collection_name)
+
+    async def run(entry):
+        started = time.perf_counter()
+        try:
+            await replay_operation(collection_for(entry['ns']), entry)
+        except Exception as e:
+            errors[entry['op']] += 1
+            logger.debug(e)
+        finally:
+            latencies.setdefault(entry['op'], []).append(time.perf_counter() - started)
+            semaphore.release()
+
+    started = time.perf_counter()
+    try:
+        for entry in read_workload(path):
+            if first is None:
+                first = entry['t']
+            if entry['op'] in DESTRUCTIVE_FROM_SHAPE and 'q' not in entry and not allow_destructive:
+                skipped[entry['op']] += 1
+                continue
+            if 'ms' in entry:
+                recorded.setdefault(entry['op'], []).append(entry['ms'] / 1000)
+            if speed:
+                due = (entry['t'] - first) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await semaphore.acquire()
+            if speed:
+                max_lag = max(max_lag, time.perf_counter() - started - due)
+            task = asyncio.ensure_future(run(entry))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for consumer in consumers.values():
+            adapter.close_consumer(consumer)
+
+    elapsed = time.perf_counter() - started
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'operations': total,
+        'errors': dict(errors),
+        'skipped': dict(skipped),
+        'elapsed_s': elapsed,
+        'ops_per_sec': total / elapsed if elapsed else None,
+        # How far dispatch fell behind the recorded schedule, e.g. because concurrency was saturated
+        'max_lag_ms': max_lag * 1000 if speed else None,
+        'replayed': {name: percentiles(values) for name, values in latencies.items()},
+        'recorded': {name: percentiles(values) for name, values in recorded.items()},
+    }
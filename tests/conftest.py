@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+# src for the library and the repository root for benchmarks.fake, also when pytest is run without python -m
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), ROOT]
+
+from benchmarks.fake import FakeSpawner  # noqa: E402
+from mongo_helper.client_adapter import MongoClientAdapter  # noqa: E402
+
+
+@pytest.fixture
+def adapter():
+    # The adapter is a singleton, so every feature a test enables is switched off again afterwards
+    adapter = MongoClientAdapter()
+    client_spawner = adapter.client_spawner
+    adapter.client_spawner = FakeSpawner()
+    adapter.collection_cache.clear()
+    yield adapter
+    adapter.client_spawner = client_spawner
+    adapter.collection_cache.clear()
+    adapter.result_cache = adapter.metrics = adapter.slow_query_log = adapter.index_advisor = None
+    adapter.write_coalescing = None
+    adapter.single_flight = False
+    adapter.disable_workload_recorder()
@@ -0,0 +1,218 @@
+import asyncio
+import pytest
+from bson.errors import InvalidDocument
+from pymongo import InsertOne
+from pymongo.common import validate_ok_for_update
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
+from benchmarks.fake import FakeSpawner
+from mongo_helper.bulk import (WriteCoalescer, ChunkedBulkWriteError, build_upserts, chunk_requests,
+                               chunked_bulk_write, estimate_request_size)
+
+
+class BulkCollection:
+    def __init__(self):
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered=True):
+        # pymongo validates and encodes on the client, so one bad request fails the whole call
+        for request in requests:
+            document = getattr(request, '_doc')
+            if type(request).__name__ == 'UpdateOne':
+                validate_ok_for_update(document)
+                continue
+            if any(not isinstance(key, str) for key in document):
+                raise InvalidDocument('documents must have only string keys')
+        self.batches.append(requests)
+        upserts = [{'index': index, '_id': index} for index, request in enumerate(requests)
+                   if type(request).__name__ == 'UpdateOne']
+        return BulkWriteResult({'nInserted': len(requests) - len(upserts), 'nUpserted': len(upserts),
+                                'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': upserts}, True)
+
+
+def run_together(coalescer, *calls):
+    async def run():
+        return await asyncio.gather(*(call(coalescer) for call in calls), return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_invalid_update_fails_only_its_caller():
+    collection = BulkCollection()
+    results = run_together(WriteCoalescer(collection, max_delay_ms=1),
+                           lambda c: c.insert_one({'_id': 1}),
+                           lambda c: c.upsert_one({'_id': 2}, {'name': 'not an operator'}),
+                           lambda c: c.upsert_one({'_id': 3}, {'$set': {'name': 'x'}}))
+    assert results[0].inserted_id == 1
+    assert isinstance(results[1], ValueError)
+    assert results[2].upserted_id == 1
+    assert len(collection.batches) == 1 and len(collection.batches[0]) == 2
+
+
+def test_invalid_document_type_fails_only_its_caller():
+    results = run_together(WriteCoalescer(BulkCollection(), max_delay_ms=1),
+                           lambda c: c.insert_one(['not', 'a', 'document']),
+                           lambda c: c.insert_one({'_id': 1}))
+    assert isinstance(results[0], TypeError)
+    assert results[1].inserted_id == 1
+
+
+def test_unencodable_document_fails_only_its_caller():
+    collection = BulkCollection()
+    coalescer = WriteCoalescer(collection, max_delay_ms=1)
+    results = run_together(coalescer,
+                           lambda c: c.insert_one({'_id': 1, 1: 'integer key'}),
+                           lambda c: c.insert_one({'_id': 2}))
+    assert isinstance(results[0], InvalidDocument)
+    assert results[1].inserted_id == 2
+    assert coalescer.stats['errors'] == 1
+
+
+def test_upsert_one_rejects_a_non_mapping_filter():
+    with pytest.raises(TypeError):
+        asyncio.run(WriteCoalescer(BulkCollection()).upsert_one('id', {'$set': {'a': 1}}))
+
+
+def test_batches_are_capped_at_max_batch_size():
+    collection = BulkCollection()
+    coalescer = WriteCoalescer(collection, max_batch_size=10, max_delay_ms=1)
+    scheduled = []
+    schedule_flush = coalescer.schedule_flush
+
+    def counting_schedule_flush(loop):
+        scheduled.append(len(coalescer.pending))
+        schedule_flush(loop)
+
+    coalescer.schedule_flush = counting_schedule_flush
+    results = run_together(coalescer, *(lambda c, index=index: c.insert_one({'_id': index}) for index in range(25)))
+    assert [result.inserted_id for result in results] == list(range(25))
+    assert [len(batch) for batch in collection.batches] == [10, 10, 5]
+    assert coalescer.stats['batches'] == 3
+    assert len(scheduled) == 3
+
+
+class MatchingCollection:
+    # Every upsert matches an existing document; modified says how many of them changed it
+    def __init__(self, modified):
+        self.modified = modified
+
+    async def bulk_write(self, requests, ordered=True):
+        return BulkWriteResult({'nInserted': 0, 'nUpserted': 0, 'nMatched': len(requests),
+                                'nModified': self.modified, 'upserted': []}, True)
+
+
+@pytest.mark.parametrize('modified, expected', [(0, [0, 0]), (2, [1, 1]), (1, [None, None])])
+def test_matched_upserts_report_modified_count_when_it_can_be_split(modified, expected):
+    results = run_together(WriteCoalescer(MatchingCollection(modified), max_delay_ms=1),
+                           lambda c: c.upsert_one({'_id': 1}, {'$set': {'a': 1}}),
+                           lambda c: c.upsert_one({'_id': 2}, {'$set': {'a': 1}}))
+    assert [result.modified_count for result in results] == expected
+    assert [result.matched_count for result in results] == [1, 1]
+
+
+def test_close_flushes_every_pending_request():
+    collection = BulkCollection()
+    coalescer = WriteCoalescer(collection, max_batch_size=2, max_delay_ms=1000)
+
+    async def run():
+        calls = [asyncio.ensure_future(coalescer.insert_one({'_id': index})) for index in range(5)]
+        await asyncio.sleep(0)
+        await coalescer.close()
+        return await asyncio.gather(*calls)
+
+    assert [result.inserted_id for result in asyncio.run(run())] == list(range(5))
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+
+
+def test_update_one_can_skip_coalescing(adapter):
+    collection = adapter.get_collection(adapter.create_consumer('db'), 'items')
+    collection.enable_write_coalescing(max_delay_ms=1)
+
+    async def run():
+        coalesced = await collection.update_one({'_id': 1}, {'$set': {'a': 1}}, upsert=True)
+        direct = await collection.update_one({'_id': 1}, {'$set': {'a': 2}}, upsert=True, coalesce=False)
+        await collection.disable_write_coalescing()
+        return coalesced, direct
+
+    coalesced, direct = asyncio.run(run())
+    assert coalesced.upserted_id == 1 and collection.coalescer is None
+    assert direct.modified_count == 1
+
+
+def test_coalescing_survives_a_rebuilt_collection_wrapper(adapter):
+    consumer = adapter.create_consumer('db')
+    adapter.enable_write_coalescing(max_batch_size=10, max_delay_ms=1)
+    assert adapter.get_collection(consumer, 'items').coalescer is not None
+
+    # A new pooled client, e.g. after the reaper closed the idle one, rebuilds the wrapper
+    adapter.client_spawner = FakeSpawner()
+    rebuilt = adapter.get_collection(adapter.create_consumer('db'), 'items')
+    assert rebuilt.coalescer is not None and rebuilt.coalescer.max_batch_size == 10
+
+    asyncio.run(adapter.disable_write_coalescing())
+    assert rebuilt.coalescer is None
+    assert adapter.get_collection(adapter.create_consumer('db'), 'items').coalescer is None
+
+
+def test_chunks_split_by_count_and_bytes():
+    requests = [InsertOne({'_id': index, 'payload': 'x' * 100}) for index in range(7)]
+    assert [(offset, len(chunk)) for offset, chunk in chunk_requests(requests, max_count=3)] == [
+        (0, 3), (3, 3), (6, 1)]
+    size = estimate_request_size(requests[0])
+    assert [(offset, len(chunk)) for offset, chunk in chunk_requests(requests, max_bytes=size * 2)] == [
+        (0, 2), (2, 2), (4, 2), (6, 1)]
+    # A request larger than max_bytes still goes out, alone
+    assert [len(chunk) for _, chunk in chunk_requests(requests[:2], max_bytes=1)] == [1, 1]
+
+
+class ChunkCollection:
+    # Upserts every request and fails the ones whose _id is in failing, like the server does for duplicate keys
+    def __init__(self, failing=(), broken=()):
+        self.failing = failing
+        self.broken = broken
+        self.chunks = []
+
+    async def bulk_write(self, requests, ordered=True):
+        ids = [request._filter['_id'] for request in requests]
+        self.chunks.append(ids)
+        if any(document_id in self.broken for document_id in ids):
+            await asyncio.sleep(0)
+            raise ConnectionError('connection reset')
+        details = {'nInserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0,
+                   'nUpserted': len(ids), 'upserted': [{'index': index, '_id': document_id}
+                                                       for index, document_id in enumerate(ids)
+                                                       if document_id not in self.failing],
+                   'writeErrors': [{'index': index, 'code': 11000, 'errmsg': 'duplicate key'}
+                                   for index, document_id in enumerate(ids) if document_id in self.failing]}
+        if details['writeErrors']:
+            details['nUpserted'] -= len(details['writeErrors'])
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+
+def upserts(count):
+    return build_upserts([{'_id': index, 'a': index} for index in range(count)], '_id')
+
+
+def test_summary_remaps_indexes_to_the_request_list():
+    summary = asyncio.run(chunked_bulk_write(ChunkCollection(failing={4}), upserts(7), max_count=3))
+    assert summary.chunks == 3
+    assert summary.upserted_count == 6
+    assert summary.upserted_ids == {index: index for index in range(7) if index != 4}
+    assert [(error['index'], error['code']) for error in summary.errors] == [(4, 11000)]
+
+
+def test_ordered_write_stops_at_the_failing_chunk():
+    collection = ChunkCollection(failing={4})
+    with pytest.raises(BulkWriteError):
+        asyncio.run(chunked_bulk_write(collection, upserts(7), max_count=3, ordered=True))
+    assert collection.chunks == [[0, 1, 2], [3, 4, 5]]
+
+
+@pytest.mark.parametrize('ordered', [False, True])
+def test_failed_chunk_stops_unsent_chunks_and_keeps_the_summary(ordered):
+    collection = ChunkCollection(broken={3})
+    with pytest.raises(ChunkedBulkWriteError) as raised:
+        asyncio.run(chunked_bulk_write(collection, upserts(9), max_count=3, concurrency=1, ordered=ordered))
+    assert collection.chunks == [[0, 1, 2], [3, 4, 5]]
+    assert raised.value.summary.upserted_ids == {0: 0, 1: 1, 2: 2}
+    assert isinstance(raised.value.error, ConnectionError)
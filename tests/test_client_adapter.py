@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+from pymongo.results import BulkWriteResult
+from mongo_helper.client_adapter import MongoClientAdapter, Operations
+
+
+def operation(adapter, kind, collection_name='items'):
+    return adapter.TransactionObject(collection_name, kind, None, query={'_id': 1}, update={'$set': {'a': 1}},
+                                     documents={'_id': 1})
+
+
+def test_batches_hold_one_update_and_one_delete():
+    adapter = MongoClientAdapter()
+    kinds = [Operations.UPDATE_ONE, Operations.UPDATE_MANY, Operations.DELETE_ONE, Operations.INSERT_ONE,
+             Operations.DELETE_MANY, Operations.FIND_ONE, Operations.INSERT_ONE, Operations.INSERT_ONE]
+    batches = adapter.group_operations([operation(adapter, kind) for kind in kinds])
+    assert [[op.operation for op in batch] for batch in batches] == [
+        [Operations.UPDATE_ONE],
+        [Operations.UPDATE_MANY, Operations.DELETE_ONE, Operations.INSERT_ONE],
+        [Operations.DELETE_MANY],
+        [Operations.FIND_ONE],
+        [Operations.INSERT_ONE, Operations.INSERT_ONE],
+    ]
+
+
+def test_collections_and_opt_out_still_split_batches():
+    adapter = MongoClientAdapter()
+    operations = [operation(adapter, Operations.INSERT_ONE), operation(adapter, Operations.INSERT_ONE, 'other')]
+    assert len(adapter.group_operations(operations)) == 2
+    same_collection = [operation(adapter, Operations.INSERT_ONE), operation(adapter, Operations.INSERT_ONE)]
+    assert len(adapter.group_operations(same_collection, batch_writes=False)) == 2
+
+
+def test_every_operation_in_a_batch_gets_exact_counts():
+    adapter = MongoClientAdapter()
+    batch = [operation(adapter, Operations.INSERT_ONE), operation(adapter, Operations.UPDATE_ONE),
+             operation(adapter, Operations.DELETE_MANY)]
+    bulk_result = BulkWriteResult({'nInserted': 1, 'nUpserted': 0, 'nMatched': 1, 'nModified': 1, 'nRemoved': 4,
+                                   'upserted': []}, True)
+    results = [result.result for result in adapter.split_bulk_result(batch, [0, 1, 2], bulk_result)]
+    assert results[0].inserted_id == 1
+    assert (results[1].matched_count, results[1].modified_count) == (1, 1)
+    assert results[2].deleted_count == 4
+
+
+def slow_inserts(consumer, collection_name, delay, log):
+    # Every insert into the collection waits delay seconds and then logs the document _id
+    collection = consumer.consume()[collection_name]
+    insert_one = collection.insert_one
+
+    async def insert_one_slowly(document, session=None):
+        await asyncio.sleep(delay)
+        log.append(document['_id'])
+        return await insert_one(document, session)
+
+    collection.insert_one = insert_one_slowly
+    return collection
+
+
+def insert(adapter, consumer, collection_name, document_id, depends_on=None):
+    return adapter.get_transaction_object(consumer, collection_name, Operations.INSERT_ONE,
+                                          documents={'_id': document_id}, depends_on=depends_on)
+
+
+def test_bad_dependency_schedules_nothing(adapter):
+    consumer = adapter.create_consumer('db')
+    later = insert(adapter, consumer, 'z', 'z')
+    operations = [insert(adapter, consumer, 'x', 'x'), insert(adapter, consumer, 'y', 'y'),
+                  insert(adapter, consumer, 'w', 'w', depends_on=[later]), later]
+
+    async def run():
+        with pytest.raises(ValueError):
+            await adapter.begin_transaction(consumer, 'x', operations, concurrency=4)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    database = consumer.consume()
+    assert all(not database[name].documents for name in 'xyzw')
+
+
+def test_dependencies_wait_for_their_operations(adapter):
+    consumer = adapter.create_consumer('db')
+    log = []
+    slow_inserts(consumer, 'slow', 0.02, log)
+    slow_inserts(consumer, 'fast', 0, log)
+    first = insert(adapter, consumer, 'slow', 'first')
+    operations = [first, insert(adapter, consumer, 'fast', 'free'),
+                  insert(adapter, consumer, 'fast', 'dependent', depends_on=[first])]
+    results = asyncio.run(adapter.begin_transaction(consumer, 'slow', operations, batch_writes=False,
+                                                    concurrency=4, keep_collection_order=False))
+    assert log == ['free', 'first', 'dependent']
+    assert [result.id for result in results] == [operation.id for operation in operations]
+
+
+@pytest.mark.parametrize('keep_collection_order, expected', [(True, ['a', 'b']), (False, ['b', 'a'])])
+def test_keep_collection_order(adapter, keep_collection_order, expected):
+    consumer = adapter.create_consumer('db')
+    log = []
+    collection = slow_inserts(consumer, 'items', 0, log)
+    insert_one = collection.insert_one
+
+    async def first_is_slow(document, session=None):
+        if document['_id'] == 'a':
+            await asyncio.sleep(0.02)
+        return await insert_one(document, session)
+
+    collection.insert_one = first_is_slow
+    operations = [insert(adapter, consumer, 'items', 'a'), insert(adapter, consumer, 'items', 'b')]
+    asyncio.run(adapter.begin_transaction(consumer, 'items', operations, batch_writes=False, concurrency=4,
+                                          keep_collection_order=keep_collection_order))
+    assert log == expected
+
+
+def test_concurrency_limits_batches_in_flight(adapter):
+    consumer = adapter.create_consumer('db')
+    in_flight = []
+    peak = []
+    for name in 'abcdef':
+        collection = consumer.consume()[name]
+
+        async def insert_one(document, session=None, collection=collection, insert_one=collection.insert_one):
+            in_flight.append(document['_id'])
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(document['_id'])
+            return await insert_one(document, session)
+
+        collection.insert_one = insert_one
+    operations = [insert(adapter, consumer, name, name) for name in 'abcdef']
+    asyncio.run(adapter.begin_transaction(consumer, 'a', operations, concurrency=2))
+    assert max(peak) == 2
+
+
+def test_without_exact_counts_every_run_of_writes_is_one_batch(adapter):
+    kinds = [Operations.INSERT_ONE, Operations.UPDATE_ONE] * 250
+    operations = [operation(adapter, kind) for kind in kinds]
+    assert len(adapter.group_operations(operations)) == 250
+    assert len(adapter.group_operations(operations, exact_counts=False)) == 1
+
+
+def test_without_exact_counts_results_carry_batch_counts(adapter):
+    consumer = adapter.create_consumer('db')
+    database = consumer.consume()
+    for index in range(3):
+        database['items'].store({'_id': index, 'a': 0})
+    operations = [adapter.get_transaction_object(consumer, 'items', Operations.UPDATE_ONE, query={'_id': index},
+                                                 update={'$set': {'a': 1}}) for index in range(3)]
+    operations.append(adapter.get_transaction_object(consumer, 'items', Operations.INSERT_ONE,
+                                                     documents={'_id': 3}))
+    results = asyncio.run(adapter.begin_transaction(consumer, 'items', operations, exact_counts=False))
+    assert [result.result.modified_count for result in results[:3]] == [None, None, None]
+    assert results[0].result.bulk_result.modified_count == 3
+    assert results[3].result.inserted_id == 3
@@ -0,0 +1,67 @@
+import gc
+import time
+import pytest
+from mongo_helper.client_spawner import MongoClientSpawner
+
+
+@pytest.fixture
+def spawner():
+    spawner = MongoClientSpawner()
+    spawner.consumer_ttl = 10
+    spawner.pool_ttl = 10
+    yield spawner
+    spawner.remove_all_spawned_clients()
+    spawner.consumer_ttl = spawner.pool_ttl = None
+
+
+def test_touched_consumer_is_not_reaped(spawner):
+    consumer = spawner.spawn_consumer('db')
+    consumer.last_used_at -= 60
+    consumer.touch()
+    assert spawner.reap_idle_consumers() == []
+
+
+def test_consumer_in_use_is_not_reaped(spawner):
+    consumer = spawner.spawn_consumer('db')
+    with consumer.in_use():
+        assert spawner.reap_idle_consumers(time.monotonic() + 60) == []
+    assert spawner.reap_idle_consumers(time.monotonic() + 60) == [consumer.get_id()]
+
+
+def test_pool_stays_open_while_a_reaped_consumer_is_alive(spawner):
+    consumer = spawner.spawn_consumer('db')
+    assert spawner.reap_idle_consumers(time.monotonic() + 60) == [consumer.get_id()]
+    spawner.reap_idle_consumers(time.monotonic() + 120)
+    assert spawner.pool_count() == 1
+
+    del consumer
+    gc.collect()
+    spawner.reap_idle_consumers(time.monotonic() + 120)
+    assert spawner.pool_count() == 0
+
+
+def test_closed_consumer_releases_the_pool(spawner):
+    consumer = spawner.spawn_consumer('db')
+    spawner.remove_spawned_client(consumer)
+    spawner.reap_idle_consumers(time.monotonic() + 60)
+    assert spawner.pool_count() == 0
+
+
+def test_consumers_with_the_same_uri_and_options_share_a_pool(spawner):
+    first = spawner.spawn_consumer('db')
+    second = spawner.spawn_consumer('other_db')
+    other = spawner.spawn_consumer('db', maxPoolSize=5)
+    assert spawner.pool_count() == 2
+    pooled_client = spawner.pooled_clients[first.pool_key]
+    assert second.pool_key == first.pool_key != other.pool_key
+    assert first.get_async_motor_object() is second.get_async_motor_object() is pooled_client.client
+    assert other.get_async_motor_object() is not pooled_client.client
+    assert pooled_client.ref_count == 2
+
+    spawner.remove_spawned_client(first)
+    assert pooled_client.ref_count == 1
+    spawner.remove_spawned_client(first)
+    assert pooled_client.ref_count == 1
+    spawner.release_consumer(second)
+    assert pooled_client.ref_count == 0
+    assert spawner.pooled_clients[first.pool_key] is pooled_client
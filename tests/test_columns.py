@@ -0,0 +1,29 @@
+import datetime
+import pytest
+from mongo_helper.columns import ColumnBuilder
+
+
+def column(dtype, values):
+    builder = ColumnBuilder(dtype, capacity=1)
+    for value in values:
+        builder.append(value)
+    return builder.finish()
+
+
+@pytest.mark.parametrize('dtype, values, mask', [
+    ('int64', [1.9, 2.0, True, None], [True, False, False, True]),
+    ('int8', [300, -5], [True, False]),
+    ('bool', [2, 1, False], [True, False, False]),
+    ('U3', ['abcd', 'ab'], [True, False]),
+    ('float64', [2 ** 60 + 1, 3, float('nan')], [True, False, False]),
+    ('float32', [0.1, 1e300, float('inf')], [False, True, False]),
+    ('datetime64[ms]', [datetime.datetime(2020, 1, 1, 0, 0, 0, 4), datetime.datetime(2020, 1, 1)], [True, False]),
+    ('datetime64[ns]', [datetime.datetime(2020, 1, 1, 0, 0, 0, 4)], [False]),
+    (object, [{'a': 1}, 'x'], [False, False]),
+])
+def test_lossy_values_are_masked(dtype, values, mask):
+    assert list(column(dtype, values).mask) == mask
+
+
+def test_kept_values_are_unchanged():
+    assert column('int64', [1, 2.0, 3]).tolist() == [1, 2, 3]
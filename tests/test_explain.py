@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from mongo_helper.explain import QueryNotIndexedError, assert_indexed, explain_command, summarize_explain
+from mongo_helper.query_builder import AsyncQueryBuilder
+
+
+STATS = {'nReturned': 2, 'totalDocsExamined': 2, 'totalKeysExamined': 3, 'executionTimeMillis': 4}
+
+INDEXED = {
+    'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'name_1'}}},
+    'executionStats': STATS,
+}
+
+COLLSCAN = {
+    'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN', 'direction': 'forward'}},
+    'executionStats': {'nReturned': 2, 'totalDocsExamined': 1000, 'totalKeysExamined': 0, 'executionTimeMillis': 9},
+}
+
+BLOCKING_SORT = {
+    'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {
+        'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'name_1'}}}},
+    'executionStats': STATS,
+}
+
+# Slot based engine plans nest the classic shaped plan under queryPlan
+SLOT_BASED = {
+    'queryPlanner': {'winningPlan': {'queryPlan': {'stage': 'FETCH', 'inputStage': {
+        'stage': 'IXSCAN', 'indexName': 'age_1'}}, 'slotBasedPlan': {'stages': '...'}}},
+    'executionStats': STATS,
+}
+
+OR_PLAN = {
+    'queryPlanner': {'winningPlan': {'stage': 'SUBPLAN', 'inputStage': {'stage': 'FETCH', 'inputStage': {
+        'stage': 'OR', 'inputStages': [{'stage': 'IXSCAN', 'indexName': 'a_1'},
+                                       {'stage': 'IXSCAN', 'indexName': 'b_1'}]}}}},
+    'executionStats': STATS,
+}
+
+
+@pytest.mark.parametrize('explain, stages, indexes, collscan, blocking_sort', [
+    (INDEXED, ['FETCH', 'IXSCAN'], ['name_1'], False, False),
+    (COLLSCAN, ['COLLSCAN'], [], True, False),
+    (BLOCKING_SORT, ['SORT', 'FETCH', 'IXSCAN'], ['name_1'], False, True),
+    (SLOT_BASED, ['FETCH', 'IXSCAN'], ['age_1'], False, False),
+    (OR_PLAN, ['SUBPLAN', 'FETCH', 'OR', 'IXSCAN', 'IXSCAN'], ['a_1', 'b_1'], False, False),
+])
+def test_summarize_explain(explain, stages, indexes, collscan, blocking_sort):
+    summary = summarize_explain(explain)
+    assert (summary['stages'], summary['indexes']) == (stages, indexes)
+    assert (summary['collscan'], summary['blocking_sort']) == (collscan, blocking_sort)
+    assert summary['winning_plan'] == explain['queryPlanner']['winningPlan']
+    stats = explain['executionStats']
+    assert (summary['n_returned'], summary['total_docs_examined'], summary['total_keys_examined'],
+            summary['execution_time_ms']) == (stats['nReturned'], stats['totalDocsExamined'],
+                                              stats['totalKeysExamined'], stats['executionTimeMillis'])
+
+
+def test_summarize_explain_without_execution_stats():
+    summary = summarize_explain({'queryPlanner': INDEXED['queryPlanner']})
+    assert summary['n_returned'] is None and summary['execution_time_ms'] is None
+    assert summarize_explain({})['stages'] == []
+
+
+def test_assert_indexed():
+    summary = summarize_explain(INDEXED)
+    assert assert_indexed(summary) is summary
+    with pytest.raises(QueryNotIndexedError, match='COLLSCAN'):
+        assert_indexed(summarize_explain(COLLSCAN))
+    with pytest.raises(QueryNotIndexedError, match='in-memory sort'):
+        assert_indexed(summarize_explain(BLOCKING_SORT))
+    assert assert_indexed(summarize_explain(BLOCKING_SORT), allow_blocking_sort=True)['blocking_sort']
+    with pytest.raises(QueryNotIndexedError):
+        assert_indexed(summarize_explain(COLLSCAN), allow_blocking_sort=True)
+
+
+@pytest.mark.parametrize('operation, projection, sort, command', [
+    ('find', None, None, {'find': 'items', 'filter': {'a': 1}}),
+    ('find', {'a': 1}, 'a', {'find': 'items', 'filter': {'a': 1}, 'projection': {'a': 1}, 'sort': {'a': 1}}),
+    ('find', None, [('a', -1), ('b', 1)], {'find': 'items', 'filter': {'a': 1}, 'sort': {'a': -1, 'b': 1}}),
+    ('find_one', None, None, {'find': 'items', 'filter': {'a': 1}, 'limit': 1}),
+    ('count_documents', {'a': 1}, None, {'count': 'items', 'query': {'a': 1}}),
+])
+def test_explain_command(operation, projection, sort, command):
+    assert explain_command('items', operation, {'a': 1}, projection, sort) == command
+
+
+@pytest.mark.parametrize('explain, error', [(INDEXED, None), (COLLSCAN, 'COLLSCAN'), (BLOCKING_SORT, 'sort')])
+def test_builder_explain_and_assert_indexed(adapter, explain, error):
+    builder = AsyncQueryBuilder(adapter, 'db', 'items')
+    for index in range(8):
+        builder.collection.collection.store({'_id': index})
+    commands = []
+
+    async def command(document):
+        commands.append(document)
+        return explain
+
+    builder.collection.collection.database.command = command
+
+    async def run():
+        return await builder.explain({'name': 'Ada'}, sort='name'), await builder.assert_indexed({'name': 'Ada'})
+
+    if error is not None:
+        with pytest.raises(QueryNotIndexedError, match=error):
+            asyncio.run(run())
+        return
+    summary, indexed = asyncio.run(run())
+    assert summary['selectivity'] == 2 / 8
+    assert indexed['indexes'] == ['name_1']
+    assert commands[0] == {'explain': {'find': 'items', 'filter': {'name': 'Ada'}, 'sort': {'name': 1}},
+                           'verbosity': 'executionStats'}
@@ -0,0 +1,65 @@
+import pytest
+from pydantic import BaseModel, Field, ValidationError
+from mongo_helper import hydration
+from mongo_helper.hydration import LazyModel, hydrate, hydrate_many
+
+
+class Sub(BaseModel):
+    x: int
+
+
+class Item(BaseModel):
+    id: str = Field(alias='_id')
+    count: int
+    sub: Sub
+
+
+DOCUMENTS = [{'_id': 'a', 'count': '1', 'sub': {'x': '2'}}, {'_id': 'b', 'count': 3, 'sub': {'x': 4}}]
+
+
+def test_hydrate_many_validates_through_one_type_adapter():
+    hydration._list_adapters.pop(Item, None)
+    items = hydrate_many(Item, DOCUMENTS)
+    assert [(item.id, item.count, item.sub.x) for item in items] == [('a', 1, 2), ('b', 3, 4)]
+    adapter = hydration._list_adapters[Item]
+    hydrate_many(Item, DOCUMENTS)
+    assert hydration._list_adapters[Item] is adapter
+
+
+def test_hydrate_many_raises_on_invalid_documents():
+    with pytest.raises(ValidationError):
+        hydrate_many(Item, [{'_id': 'a', 'count': 'many', 'sub': {'x': 1}}])
+
+
+def test_trusted_skips_validation_and_leaves_submodels_as_dicts():
+    items = hydrate_many(Item, DOCUMENTS, trusted=True)
+    assert [item.id for item in items] == ['a', 'b']
+    # Nothing is coerced or converted
+    assert items[0].count == '1'
+    assert items[0].sub == {'x': '2'}
+    with pytest.raises(AttributeError):
+        items[0].sub.x
+    assert hydrate(Item, {'_id': 'c', 'count': 'many', 'sub': {}}, trusted=True).count == 'many'
+
+
+def test_lazy_model_hydrates_on_first_attribute_read():
+    lazy = LazyModel(Item, dict(DOCUMENTS[0]))
+    assert repr(lazy) == 'LazyModel(Item, unhydrated)'
+    assert lazy.sub.x == 2
+    instance = lazy.hydrate()
+    assert lazy.hydrate() is instance
+    assert lazy._document is None
+    assert lazy == hydrate(Item, DOCUMENTS[0])
+    assert lazy == LazyModel(Item, dict(DOCUMENTS[0]))
+
+
+def test_lazy_model_defers_validation_errors():
+    lazy = LazyModel(Item, {'_id': 'a', 'count': 'many', 'sub': {'x': 1}})
+    with pytest.raises(ValidationError):
+        lazy.count
+
+
+def test_lazy_model_trusted_constructs_without_validation():
+    lazy = LazyModel(Item, dict(DOCUMENTS[0]), trusted=True)
+    assert lazy.count == '1'
+    assert lazy.sub == {'x': '2'}
@@ -0,0 +1,91 @@
+import asyncio
+from pymongo import IndexModel, TEXT
+from mongo_helper.index_manager import sync_collection_indexes
+
+
+# What list_indexes() returns on MongoDB 7 for the indexes below
+COLLATION_INDEX = {
+    'v': 2, 'key': {'name': 1}, 'name': 'name_1',
+    'collation': {'locale': 'en', 'caseLevel': False, 'caseFirst': 'off', 'strength': 3, 'numericOrdering': False,
+                  'alternate': 'non-ignorable', 'maxVariable': 'punct', 'normalization': False, 'backwards': False,
+                  'version': '57.1'},
+}
+TEXT_INDEX = {
+    'v': 2, 'key': {'_fts': 'text', '_ftsx': 1}, 'name': 'title_text', 'weights': {'title': 1},
+    'default_language': 'english', 'language_override': 'language', 'textIndexVersion': 3,
+}
+COMPOUND_TEXT_INDEX = {
+    'v': 2, 'key': {'shop': 1, '_fts': 'text', '_ftsx': 1}, 'name': 'shop_1_title_text_body_text',
+    'weights': {'title': 10, 'body': 1}, 'default_language': 'english', 'language_override': 'language',
+    'textIndexVersion': 3,
+}
+ID_INDEX = {'v': 2, 'key': {'_id': 1}, 'name': '_id_'}
+
+
+class IndexCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+        self.dropped = []
+        self.created = []
+
+    async def list_indexes(self):
+        for index in self.indexes:
+            yield index
+
+    async def drop_index(self, name):
+        self.dropped.append(name)
+
+    async def create_indexes(self, models):
+        self.created.extend(model.document['name'] for model in models)
+
+
+def sync(indexes, spec):
+    collection = IndexCollection([ID_INDEX, *indexes])
+    report = asyncio.run(sync_collection_indexes(collection, spec))
+    return collection, report
+
+
+def test_collation_index_is_unchanged():
+    collection, report = sync([COLLATION_INDEX], [('name', {'collation': {'locale': 'en'}})])
+    assert report['unchanged'] == ['name_1']
+    assert collection.dropped == [] and collection.created == []
+
+
+def test_collation_change_is_rebuilt():
+    collection, report = sync([COLLATION_INDEX], [('name', {'collation': {'locale': 'en', 'strength': 2}})])
+    assert report['rebuilt'] == ['name_1']
+    assert collection.dropped == ['name_1']
+
+
+def test_missing_collation_is_rebuilt():
+    _, report = sync([COLLATION_INDEX], ['name'])
+    assert report['rebuilt'] == ['name_1']
+
+
+def test_text_index_is_unchanged():
+    collection, report = sync([TEXT_INDEX], [IndexModel([('title', TEXT)])])
+    assert report['unchanged'] == ['title_text']
+    assert collection.dropped == [] and collection.created == []
+
+
+def test_compound_text_index_with_weights_is_unchanged():
+    spec = [([('shop', 1), ('title', TEXT), ('body', TEXT)], {'weights': {'title': 10, 'body': 1}})]
+    _, report = sync([COMPOUND_TEXT_INDEX], spec)
+    assert report['unchanged'] == ['shop_1_title_text_body_text']
+
+
+def test_text_weight_change_is_rebuilt():
+    spec = [([('shop', 1), ('title', TEXT), ('body', TEXT)], {'weights': {'title': 5, 'body': 1}})]
+    _, report = sync([COMPOUND_TEXT_INDEX], spec)
+    assert report['rebuilt'] == ['shop_1_title_text_body_text']
+
+
+def test_unique_change_is_rebuilt():
+    _, report = sync([{'v': 2, 'key': {'email': 1}, 'name': 'email_1'}], [('email', {'unique': True})])
+    assert report['rebuilt'] == ['email_1']
+
+
+def test_second_sync_is_a_no_op():
+    spec = [('name', {'collation': {'locale': 'en'}}), IndexModel([('title', TEXT)])]
+    _, report = sync([COLLATION_INDEX, TEXT_INDEX], spec)
+    assert report['created'] == [] and report['rebuilt'] == []
@@ -0,0 +1,85 @@
+import asyncio
+import contextlib
+import pytest
+from pymongo.errors import OperationFailure
+from mongo_helper.local_mirror import LocalMirror
+
+
+class Consumer:
+    def in_use(self):
+        return contextlib.nullcontext(self)
+
+
+class Stream:
+    def __init__(self, events):
+        self.events = events
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.events:
+            return self.events.pop(0)
+        await asyncio.Event().wait()
+
+
+class Collection:
+    def __init__(self, documents=(), watch_error=None):
+        self.documents = list(documents)
+        self.watch_error = watch_error
+        self.watch_calls = 0
+
+    def watch(self, **options):
+        self.watch_calls += 1
+        if self.watch_error is not None:
+            raise self.watch_error
+        return Stream([])
+
+    async def find(self, query):
+        for document in self.documents:
+            yield document
+
+
+class Adapter:
+    def __init__(self, collection):
+        self.collection = collection
+        self.closed = []
+
+    def create_consumer(self, db_name):
+        return Consumer()
+
+    def get_collection(self, consumer, name):
+        return type('Wrapper', (), {'collection': self.collection})()
+
+    def close_consumer(self, consumer):
+        self.closed.append(consumer)
+
+
+def test_start_raises_when_change_streams_are_unsupported():
+    error = OperationFailure('The $changeStream stage is only supported on replica sets', code=40573)
+    adapter = Adapter(Collection(watch_error=error))
+
+    async def start():
+        return await asyncio.wait_for(LocalMirror(adapter, 'items', reconnect_delay=0).start(), timeout=1)
+
+    with pytest.raises(OperationFailure):
+        asyncio.run(start())
+    assert adapter.collection.watch_calls == 1
+    assert len(adapter.closed) == 1
+
+
+def test_start_loads_the_snapshot():
+    adapter = Adapter(Collection([{'_id': 1, 'kind': 'a'}, {'_id': 2, 'kind': 'b'}]))
+
+    async def start():
+        async with LocalMirror(adapter, 'items', index_fields=['kind']) as mirror:
+            return len(mirror), mirror.find_one('kind', 'b')
+
+    assert asyncio.run(start()) == (2, {'_id': 2, 'kind': 'b'})
+    assert len(adapter.closed) == 1
@@ -0,0 +1,77 @@
+import asyncio
+import bson
+import pytest
+from mongo_helper.metrics import Histogram, MetricsRegistry
+from mongo_helper.query_builder import AsyncQueryBuilder
+
+
+def histogram(*values, buckets=(1.0, 2.0, 4.0)):
+    histogram = Histogram(buckets)
+    for value in values:
+        histogram.observe(value)
+    return histogram
+
+
+@pytest.mark.parametrize('values, q, expected', [
+    ((0.5, 0.5, 1.5, 1.5), 0.5, 1.0),
+    ((0.5, 0.5, 1.5, 1.5), 0.95, 1.9),
+    ((0.5, 0.5, 1.5, 1.5), 0.25, 0.5),
+    ((3.0,), 0.5, 3.0),
+    ((10.0, 20.0), 0.99, 4.0),
+])
+def test_percentile_interpolates_inside_the_bucket(values, q, expected):
+    assert histogram(*values).percentile(q) == pytest.approx(expected)
+
+
+def test_empty_histogram_has_no_percentiles():
+    assert histogram().snapshot() == {'count': 0, 'sum': 0.0, 'p50': None, 'p95': None, 'p99': None}
+
+
+def test_bucket_bounds_are_inclusive():
+    assert histogram(1.0, 2.0, 4.0, 4.5).counts == [1, 1, 1, 1]
+
+
+def test_prometheus_output():
+    registry = MetricsRegistry(buckets=(0.01, 0.1), measure_bytes=True)
+    registry.observe_operation('find', 'db."items"', 0.05, documents=3, size=120)
+    registry.observe_operation('find', 'db."items"', 0.5, error=True)
+    lines = registry.to_prometheus().splitlines()
+    labels = 'operation="find",namespace="db.\\"items\\""'
+    assert '# TYPE mongo_helper_operation_duration_seconds histogram' in lines
+    assert [line for line in lines if line.startswith('mongo_helper_operation_duration_seconds')] == [
+        f'mongo_helper_operation_duration_seconds_bucket{{{labels},le="0.01"}} 0',
+        f'mongo_helper_operation_duration_seconds_bucket{{{labels},le="0.1"}} 1',
+        f'mongo_helper_operation_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+        f'mongo_helper_operation_duration_seconds_sum{{{labels}}} 0.55',
+        f'mongo_helper_operation_duration_seconds_count{{{labels}}} 2',
+    ]
+    assert f'mongo_helper_operation_errors_total{{{labels}}} 1' in lines
+    assert f'mongo_helper_operation_documents_returned_total{{{labels}}} 3' in lines
+    assert f'mongo_helper_operation_bytes_returned_total{{{labels}}} 120' in lines
+    assert 'mongo_helper_pool_checkouts_total 0' in lines
+
+
+def test_bytes_are_only_exported_when_measured():
+    registry = MetricsRegistry()
+    registry.observe_operation('find', 'db.items', 0.05, documents=3)
+    assert 'bytes_returned' not in registry.to_prometheus()
+
+
+@pytest.mark.parametrize('measure_bytes', [False, True])
+def test_find_records_documents_and_bytes(adapter, measure_bytes):
+    metrics = adapter.enable_metrics(MetricsRegistry(measure_bytes=measure_bytes))
+    documents = [{'_id': index, 'name': 'x' * index} for index in range(3)]
+
+    async def run():
+        async with AsyncQueryBuilder(adapter, 'db', 'items') as builder:
+            await builder.insert_many([dict(document) for document in documents])
+            await builder.find({}, use_cache=False)
+            await builder.find_one({'_id': 1}, use_cache=False)
+
+    asyncio.run(run())
+    operations = metrics.snapshot()['operations']
+    assert operations['find db.items']['documents'] == 3
+    assert operations['find_one db.items']['documents'] == 1
+    expected_bytes = sum(len(bson.encode(document)) for document in documents) if measure_bytes else 0
+    assert operations['find db.items']['bytes'] == expected_bytes
+    assert operations['insert_many db.items']['documents'] == 0
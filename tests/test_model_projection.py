@@ -0,0 +1,92 @@
+import asyncio
+from typing import List, Optional
+import pytest
+from pydantic import AliasChoices, BaseModel, ConfigDict, Field
+from mongo_helper.model_projection import derive_projection
+from mongo_helper.query_builder_pydantic import AsyncPydanticQueryBuilder
+
+
+class Address(BaseModel):
+    city: str
+    postal_code: str = Field(alias='zip')
+
+
+class Tag(BaseModel):
+    name: str
+
+
+class Person(BaseModel):
+    id: str = Field(alias='_id')
+    name: str
+    address: Address
+    previous_address: Optional[Address] = None
+    tags: List[Tag] = []
+
+
+class Node(BaseModel):
+    value: int
+    child: Optional['Node'] = None
+    parent: 'Node' = None
+
+
+class Loose(BaseModel):
+    model_config = ConfigDict(extra='allow')
+    name: str
+
+
+class WithLooseSubmodel(BaseModel):
+    name: str
+    loose: Loose
+
+
+class Renamed(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    score: int = Field(alias='s')
+    rank: int = Field(validation_alias='r')
+
+
+class Choices(BaseModel):
+    name: str = Field(validation_alias=AliasChoices('name', 'full_name'))
+
+
+@pytest.mark.parametrize('model, projection', [
+    (Person, {'_id': 1, 'name': 1, 'address.city': 1, 'address.zip': 1, 'previous_address': 1, 'tags': 1}),
+    (Node, {'value': 1, 'child': 1, 'parent': 1, '_id': 0}),
+    (Loose, None),
+    (WithLooseSubmodel, {'name': 1, 'loose': 1, '_id': 0}),
+    (Renamed, {'s': 1, 'score': 1, 'r': 1, 'rank': 1, '_id': 0}),
+    (Choices, None),
+])
+def test_derive_projection(model, projection):
+    assert derive_projection(model) == projection
+
+
+class Flat(BaseModel):
+    name: str
+    age: int = 0
+
+
+@pytest.mark.parametrize('builder_options, find_options, projection', [
+    ({}, {}, {'name': 1, 'age': 1, '_id': 0}),
+    ({}, {'full_fetch': True}, None),
+    ({}, {'projection': {'name': 1, 'age': 1}}, {'name': 1, 'age': 1}),
+    ({'auto_projection': False}, {}, None),
+])
+def test_find_sends_the_resolved_projection(adapter, builder_options, find_options, projection):
+    collection = adapter.get_collection(adapter.create_consumer('db'), 'people')
+    collection.collection.store({'_id': 1, 'name': 'Ada', 'age': 36, 'large': 'x' * 1000})
+    sent = []
+    find = collection.collection.find
+
+    def recording_find(query=None, projection=None, **kwargs):
+        sent.append(projection)
+        return find(query, projection, **kwargs)
+
+    collection.collection.find = recording_find
+
+    async def run():
+        async with AsyncPydanticQueryBuilder(adapter, 'db', 'people', Flat, **builder_options) as builder:
+            return await builder.find({}, **find_options)
+
+    assert [(person.name, person.age) for person in asyncio.run(run())] == [('Ada', 36)]
+    assert sent == [projection]
@@ -0,0 +1,70 @@
+import pytest
+from mongo_helper.pagination import seek_filter
+
+
+MISSING = object()
+
+
+def value_of(document, field):
+    return document.get(field, MISSING)
+
+
+def condition_matches(value, condition):
+    is_null = value is None or value is MISSING
+    if isinstance(condition, dict):
+        for operator, operand in condition.items():
+            if operator == '$ne' and (is_null if operand is None else value == operand):
+                return False
+            # Range operators bracket by type, so null and missing never match them
+            if operator == '$gt' and (is_null or not value > operand):
+                return False
+            if operator == '$lt' and (is_null or not value < operand):
+                return False
+        return True
+    return is_null if condition is None else value == condition
+
+
+def matches(document, query):
+    if '$or' in query:
+        return any(matches(document, branch) for branch in query['$or'])
+    return all(condition_matches(value_of(document, field), condition) for field, condition in query.items())
+
+
+def sort_key(document, field):
+    value = value_of(document, field)
+    is_null = value is None or value is MISSING
+    return (0, 0) if is_null else (1, value), document['_id']
+
+
+def scan(documents, field, direction, page_size):
+    # Keyset pagination the way AsyncQueryBuilder.paginate drives seek_filter
+    ordered = sorted(documents, key=lambda document: sort_key(document, field), reverse=direction == -1)
+    seen, last = [], None
+    while True:
+        candidates = ordered if last is None else [
+            document for document in ordered
+            if matches(document, seek_filter(field, value_of(last, field) if field in last else None,
+                                             last['_id'], direction))]
+        page = candidates[:page_size]
+        if not page:
+            return seen
+        seen.extend(document['_id'] for document in page)
+        last = page[-1]
+
+
+DOCUMENTS = [
+    {'_id': 1, 'rank': 3}, {'_id': 2, 'rank': None}, {'_id': 3}, {'_id': 4, 'rank': 1}, {'_id': 5, 'rank': 3},
+    {'_id': 6, 'rank': None}, {'_id': 7, 'rank': 2}, {'_id': 8},
+]
+
+
+@pytest.mark.parametrize('direction', [1, -1])
+@pytest.mark.parametrize('page_size', [1, 2, 3])
+def test_every_document_is_reached_once(direction, page_size):
+    expected = [document['_id'] for document in sorted(DOCUMENTS, key=lambda document: sort_key(document, 'rank'),
+                                                       reverse=direction == -1)]
+    assert scan(DOCUMENTS, 'rank', direction, page_size) == expected
+
+
+def test_id_sort_seeks_on_id_only():
+    assert seek_filter('_id', 5, 5, 1) == {'_id': {'$gt': 5}}
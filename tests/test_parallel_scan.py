@@ -0,0 +1,72 @@
+import asyncio
+from mongohelper.parallel_scan import split_points, partition_queries, type_alias
+
+
+class SampleCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class SampleCollection:
+    def __init__(self, values):
+        self.values = values
+
+    def aggregate(self, pipeline):
+        return SampleCursor([{'value': value} for value in self.values] + [{}])
+
+
+def matches(document, condition, field):
+    # Range operators only match values of the operand's type, the way the server brackets comparisons
+    if '$not' in condition:
+        return field not in document or type_alias(document[field]) != condition['$not']['$type']
+    value = document.get(field)
+    if value is None or type_alias(value) != type_alias(next(iter(condition.values()))):
+        return False
+    return ('$gte' not in condition or value >= condition['$gte']) and (
+        '$lt' not in condition or value < condition['$lt'])
+
+
+def test_mixed_type_sample_splits_on_the_most_common_type():
+    values = [*range(100), 'a', 'b', None, {'nested': 1}]
+    points = asyncio.run(split_points(SampleCollection(values), {}, 'rank', partitions=4))
+    assert len(points) == 3
+    assert all(isinstance(point, int) for point in points)
+
+
+def test_every_document_lands_in_exactly_one_partition():
+    documents = [{'rank': rank} for rank in range(20)] + [{'rank': None}, {}, {'rank': 'x'}, {'rank': 2.5}]
+    queries = partition_queries({}, 'rank', [5, 10, 15])
+    assert len(queries) == 5
+    for document in documents:
+        assert sum(matches(document, query['rank'], 'rank') for query in queries) == 1
+
+
+def test_partition_queries_keep_the_base_query():
+    queries = partition_queries({'shop': 1}, 'rank', [5])
+    assert queries[0] == {'$and': [{'shop': 1}, {'rank': {'$lt': 5}}]}
+    assert queries[-1] == {'$and': [{'shop': 1}, {'rank': {'$not': {'$type': 'number'}}}]}
+    assert partition_queries({'shop': 1}, 'rank', []) == [{'shop': 1}]
+
+
+def test_builder_and_mongoom_share_one_implementation(adapter):
+    from mongohelper import parallel_scan
+    from mongohelper.mongom import mongoo_instance
+    from mongo_helper.query_builder import AsyncQueryBuilder
+
+    assert mongoo_instance.scan_partitions is parallel_scan.scan_partitions
+    assert mongoo_instance.parallel_scan is parallel_scan.parallel_scan
+    seen = []
+
+    async def run():
+        async with AsyncQueryBuilder(adapter, 'db', 'items') as builder:
+            await builder.insert_many([{'_id': index} for index in range(5)])
+            counts = await builder.parallel_scan_partitions(lambda partition, document: seen.append(document['_id']),
+                                                            partitions=1)
+            merged = [document['_id'] async for document in builder.parallel_scan(partitions=1)]
+            return counts, merged
+
+    counts, merged = asyncio.run(run())
+    assert counts == [5] and sorted(seen) == sorted(merged) == list(range(5))
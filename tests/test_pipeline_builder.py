@@ -0,0 +1,81 @@
+import pytest
+from mongo_helper.pipeline_builder import Pipeline, optimize_pipeline
+
+
+CASES = [
+    # Adjacent stages of the same kind are folded
+    ('merge disjoint matches', [{'$match': {'a': 1}}, {'$match': {'b': 2}}], [{'$match': {'a': 1, 'b': 2}}]),
+    ('merge overlapping matches', [{'$match': {'a': 1}}, {'$match': {'a': 2}}],
+     [{'$match': {'$and': [{'a': 1}, {'a': 2}]}}]),
+    ('merge limits', [{'$limit': 10}, {'$limit': 5}], [{'$limit': 5}]),
+    ('merge skips', [{'$skip': 10}, {'$skip': 5}], [{'$skip': 15}]),
+
+    # $match moves ahead of stages that do not touch the fields it reads
+    ('match before sort', [{'$sort': {'a': 1}}, {'$match': {'a': 1}}], [{'$match': {'a': 1}}, {'$sort': {'a': 1}}]),
+    ('match before inclusion', [{'$project': {'a': 1}}, {'$match': {'a.b': 1}}],
+     [{'$match': {'a.b': 1}}, {'$project': {'a': 1}}]),
+    ('match on _id before inclusion', [{'$project': {'a': 1}}, {'$match': {'_id': 1}}],
+     [{'$match': {'_id': 1}}, {'$project': {'a': 1}}]),
+    ('match on excluded _id stays', [{'$project': {'_id': 0, 'a': 1}}, {'$match': {'_id': 1}}],
+     [{'$project': {'_id': 0, 'a': 1}}, {'$match': {'_id': 1}}]),
+    ('match on field outside inclusion stays', [{'$project': {'a.b': 1}}, {'$match': {'a': 1}}],
+     [{'$project': {'a.b': 1}}, {'$match': {'a': 1}}]),
+    ('match before unrelated exclusion', [{'$project': {'b': 0}}, {'$match': {'a': 1}}],
+     [{'$match': {'a': 1}}, {'$project': {'b': 0}}]),
+    ('match on excluded field stays', [{'$project': {'a': 0}}, {'$match': {'a': 1}}],
+     [{'$project': {'a': 0}}, {'$match': {'a': 1}}]),
+    ('match on root of excluded sub path stays', [{'$project': {'a.b': 0}}, {'$match': {'a': {'c': 1}}}],
+     [{'$project': {'a.b': 0}}, {'$match': {'a': {'c': 1}}}]),
+    ('match before computed projection stays', [{'$project': {'a': '$b'}}, {'$match': {'a': 1}}],
+     [{'$project': {'a': '$b'}}, {'$match': {'a': 1}}]),
+    ('match before unrelated addFields', [{'$addFields': {'b': 1}}, {'$match': {'a': 1}}],
+     [{'$match': {'a': 1}}, {'$addFields': {'b': 1}}]),
+    ('match on added field stays', [{'$set': {'a.b': 1}}, {'$match': {'a': 1}}],
+     [{'$set': {'a.b': 1}}, {'$match': {'a': 1}}]),
+    ('match before unrelated lookup', [{'$lookup': {'from': 'c', 'localField': 'x', 'foreignField': 'y',
+                                                    'as': 'j'}}, {'$match': {'a': 1}}],
+     [{'$match': {'a': 1}}, {'$lookup': {'from': 'c', 'localField': 'x', 'foreignField': 'y', 'as': 'j'}}]),
+    ('match on lookup output stays', [{'$lookup': {'from': 'c', 'localField': 'x', 'foreignField': 'y',
+                                                   'as': 'j'}}, {'$match': {'j.k': 1}}],
+     [{'$lookup': {'from': 'c', 'localField': 'x', 'foreignField': 'y', 'as': 'j'}}, {'$match': {'j.k': 1}}]),
+    ('match before unrelated unwind', [{'$unwind': '$tags'}, {'$match': {'a': 1}}],
+     [{'$match': {'a': 1}}, {'$unwind': '$tags'}]),
+    ('match on unwound path stays', [{'$unwind': '$tags'}, {'$match': {'tags': 'x'}}],
+     [{'$unwind': '$tags'}, {'$match': {'tags': 'x'}}]),
+    ('match on array index stays', [{'$unwind': {'path': '$tags', 'includeArrayIndex': 'i'}}, {'$match': {'i': 0}}],
+     [{'$unwind': {'path': '$tags', 'includeArrayIndex': 'i'}}, {'$match': {'i': 0}}]),
+    ('match with $expr stays', [{'$sort': {'a': 1}}, {'$match': {'$expr': {'$gt': ['$a', 1]}}}],
+     [{'$sort': {'a': 1}}, {'$match': {'$expr': {'$gt': ['$a', 1]}}}]),
+    ('match with $or moves', [{'$addFields': {'c': 1}}, {'$match': {'$or': [{'a': 1}, {'b': 1}]}}],
+     [{'$match': {'$or': [{'a': 1}, {'b': 1}]}}, {'$addFields': {'c': 1}}]),
+    ('match after group stays', [{'$group': {'_id': '$a'}}, {'$match': {'_id': 1}}],
+     [{'$group': {'_id': '$a'}}, {'$match': {'_id': 1}}]),
+
+    # $limit moves ahead of one to one stages
+    ('limit before project', [{'$project': {'a': 1}}, {'$limit': 5}], [{'$limit': 5}, {'$project': {'a': 1}}]),
+    ('limit after unwind stays', [{'$unwind': '$tags'}, {'$limit': 5}], [{'$unwind': '$tags'}, {'$limit': 5}]),
+    ('limit after match stays', [{'$match': {'a': 1}}, {'$limit': 5}], [{'$match': {'a': 1}}, {'$limit': 5}]),
+
+    # An inclusion projection moves ahead of a sort when the sort keys survive it
+    ('project before sort', [{'$sort': {'a': 1}}, {'$project': {'a': 1}}],
+     [{'$project': {'a': 1}}, {'$sort': {'a': 1}}]),
+    ('project dropping sort key stays', [{'$sort': {'a': 1}}, {'$project': {'b': 1}}],
+     [{'$sort': {'a': 1}}, {'$project': {'b': 1}}]),
+    ('project excluding sorted _id stays', [{'$sort': {'_id': 1}}, {'$project': {'_id': 0, 'a': 1}}],
+     [{'$sort': {'_id': 1}}, {'$project': {'_id': 0, 'a': 1}}]),
+
+    # Rules compose until nothing changes
+    ('chained rewrites', [{'$addFields': {'b': 1}}, {'$match': {'a': 1}}, {'$match': {'c': 2}}, {'$limit': 3}],
+     [{'$match': {'a': 1, 'c': 2}}, {'$limit': 3}, {'$addFields': {'b': 1}}]),
+]
+
+
+@pytest.mark.parametrize('stages, expected', [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_optimize_pipeline(stages, expected):
+    assert optimize_pipeline(stages) == expected
+
+
+def test_build_leaves_the_stages_untouched():
+    pipeline = Pipeline().add_fields({'b': 1}).match({'a': 1})
+    assert pipeline.build() == [{'$match': {'a': 1}}, {'$addFields': {'b': 1}}]
+    assert pipeline.build(optimize=False) == [{'$addFields': {'b': 1}}, {'$match': {'a': 1}}]
@@ -0,0 +1,186 @@
+import asyncio
+import io
+import bson
+import pytest
+from bson.raw_bson import RawBSONDocument
+from benchmarks.fake import FakeCursor
+from mongo_helper.query_builder import AsyncQueryBuilder
+
+
+class StreamingCursor(FakeCursor):
+    # Counts the documents pulled from the server and refuses to load the whole result set
+    def __init__(self, documents):
+        super().__init__(documents)
+        self.fetched = 0
+
+    async def to_list(self, length=None):
+        raise AssertionError('the cursor was loaded into a list')
+
+    async def __anext__(self):
+        document = await super().__anext__()
+        self.fetched += 1
+        return document
+
+
+def streaming_find(collection, cursors, calls):
+    find = collection.collection.find
+
+    def recording_find(query=None, projection=None, **kwargs):
+        calls.append((query, projection, kwargs))
+        cursors.append(StreamingCursor(find(query, projection).documents))
+        return cursors[-1]
+
+    collection.collection.find = recording_find
+
+
+def builder_with(adapter, count):
+    builder = AsyncQueryBuilder(adapter, 'db', 'items')
+    for index in range(count):
+        builder.collection.collection.store({'_id': index, 'name': f'item {index}'})
+    return builder
+
+
+def test_iter_find_streams_the_cursor(adapter):
+    builder = builder_with(adapter, 10)
+    cursors, calls = [], []
+    streaming_find(builder.collection, cursors, calls)
+
+    async def run():
+        seen = []
+        async for document in builder.iter_find({}):
+            seen.append(document['_id'])
+            if len(seen) == 3:
+                break
+        return seen
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert cursors[0].fetched == 3
+
+
+@pytest.mark.parametrize('count, chunk_size, sizes', [
+    (10, 4, [4, 4, 2]),
+    (8, 4, [4, 4]),
+    (3, 10, [3]),
+    (0, 4, []),
+])
+def test_iter_find_yields_chunks(adapter, count, chunk_size, sizes):
+    builder = builder_with(adapter, count)
+    cursors, calls = [], []
+    streaming_find(builder.collection, cursors, calls)
+
+    async def run():
+        return [chunk async for chunk in builder.iter_find({}, chunk_size=chunk_size)]
+
+    chunks = asyncio.run(run())
+    assert [len(chunk) for chunk in chunks] == sizes
+    assert [document['_id'] for chunk in chunks for document in chunk] == list(range(count))
+
+
+def test_iter_find_passes_the_cursor_options(adapter):
+    builder = builder_with(adapter, 1)
+    cursors, calls = [], []
+    streaming_find(builder.collection, cursors, calls)
+
+    async def run():
+        return [document async for document in builder.iter_find({'name': 'item 0'}, {'name': 1}, batch_size=2,
+                                                                 sort='name', limit=5, skip=1, hint='name_1',
+                                                                 max_time_ms=100)]
+
+    assert asyncio.run(run()) == [{'_id': 0, 'name': 'item 0'}]
+    assert calls == [({'name': 'item 0'}, {'name': 1}, {'session': None, 'limit': 5, 'skip': 1, 'batch_size': 2,
+                                                        'sort': [('name', 1)], 'hint': 'name_1', 'max_time_ms': 100})]
+
+
+def test_raw_find_returns_undecoded_documents_and_skips_the_cache(adapter):
+    cache = adapter.enable_result_cache()
+    builder = builder_with(adapter, 3)
+
+    async def run():
+        decoded = await builder.find({})
+        return decoded, await builder.find({}, raw=True), await builder.find({}, {'name': 1}, raw=True)
+
+    decoded, raw, projected = asyncio.run(run())
+    assert all(isinstance(document, RawBSONDocument) for document in raw + projected)
+    assert [document.raw for document in raw] == [bson.encode(document) for document in decoded]
+    assert [dict(document) for document in projected] == [{'_id': index, 'name': f'item {index}'} for index in range(3)]
+    assert cache.get_stats()['entries'] == 1
+
+
+def test_raw_find_one(adapter):
+    builder = builder_with(adapter, 2)
+
+    async def run():
+        return await builder.find_one({'_id': 1}, raw=True), await builder.find_one({'_id': 5}, raw=True)
+
+    found, missing = asyncio.run(run())
+    assert isinstance(found, RawBSONDocument)
+    assert found.raw == bson.encode({'_id': 1, 'name': 'item 1'})
+    assert missing is None
+
+
+class AsyncSink:
+    def __init__(self):
+        self.parts = []
+
+    async def write(self, data):
+        self.parts.append(data)
+
+
+@pytest.mark.parametrize('sink_class', [io.BytesIO, AsyncSink])
+def test_export_raw_writes_bson_bytes(adapter, sink_class):
+    sink = sink_class()
+    builder = builder_with(adapter, 3)
+    expected = [{'_id': index, 'name': f'item {index}'} for index in (1, 2)]
+
+    async def run():
+        return await builder.export_raw(sink, {'_id': {'$gt': 0}}, batch_size=1)
+
+    written = asyncio.run(run())
+    data = sink.getvalue() if isinstance(sink, io.BytesIO) else b''.join(sink.parts)
+    assert written == len(data) == sum(len(bson.encode(document)) for document in expected)
+    assert bson.decode_all(data) == expected
+
+
+def counted(collection, name, calls):
+    method = getattr(collection.collection, name)
+
+    async def counting(*args, **kwargs):
+        calls.append((name, args, kwargs))
+        return await method(*args, **kwargs)
+
+    setattr(collection.collection, name, counting)
+
+
+def test_count_documents(adapter):
+    adapter.enable_result_cache()
+    builder = builder_with(adapter, 5)
+    calls = []
+    counted(builder.collection, 'count_documents', calls)
+    counted(builder.collection, 'estimated_document_count', calls)
+
+    async def run():
+        return [await builder.count_documents(), await builder.count_documents({'_id': {'$gt': 2}}),
+                await builder.count_documents({'_id': {'$gt': 2}}), await builder.count_documents(use_cache=False),
+                await builder.count_documents(estimate=True), await builder.count_documents({'_id': 1}, estimate=True)]
+
+    assert asyncio.run(run()) == [5, 2, 2, 5, 5, 1]
+    assert [(name, args) for name, args, kwargs in calls] == [
+        ('count_documents', ({},)),
+        ('count_documents', ({'_id': {'$gt': 2}},)),
+        ('count_documents', ({},)),
+        ('estimated_document_count', ()),
+        ('count_documents', ({'_id': 1},)),
+    ]
+
+
+@pytest.mark.parametrize('n, count, more', [(3, 3, True), (5, 5, False), (10, 5, False), (4, 4, True)])
+def test_count_up_to_stops_at_n(adapter, n, count, more):
+    builder = builder_with(adapter, 5)
+    calls = []
+    counted(builder.collection, 'count_documents', calls)
+
+    async def run():
+        return await builder.count_up_to({}, n), await builder.has_more_than(None, n)
+
+    assert asyncio.run(run()) == (count, more)
+    assert [kwargs['limit'] for name, args, kwargs in calls] == [n, n + 1]
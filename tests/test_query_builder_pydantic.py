@@ -0,0 +1,40 @@
+import asyncio
+from typing import Optional
+import pytest
+from pydantic import BaseModel, Field
+from mongo_helper.query_builder_pydantic import AsyncPydanticQueryBuilder
+
+
+class Person(BaseModel):
+    id: str = Field(alias='_id')
+    name: str
+    email: Optional[str] = None
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize('key_fields', ['id', '_id', ['id']])
+def test_upsert_many_stores_aliases_and_round_trips(adapter, key_fields):
+    people = [Person(_id='a', name='Ada'), Person(_id='b', name='Bob', email='bob@example.com')]
+
+    async def run():
+        async with AsyncPydanticQueryBuilder(adapter, 'db', 'people', Person) as builder:
+            first = await builder.upsert_many(people, key_fields)
+            second = await builder.upsert_many([Person(_id='a', name='Ada Lovelace')], key_fields)
+            return first, second, await builder.find({})
+
+    first, second, found = asyncio.run(run())
+    assert first.upserted_ids == {0: 'a', 1: 'b'}
+    assert (second.upserted_count, second.matched_count) == (0, 1)
+    stored = adapter.create_consumer('db').consume()['people'].documents
+    assert stored['a'] == {'_id': 'a', 'name': 'Ada Lovelace', 'email': None}
+    assert [(person.id, person.name) for person in found] == [('a', 'Ada Lovelace'), ('b', 'Bob')]
+
+
+@pytest.mark.filterwarnings('error')
+def test_insert_many_stores_aliases(adapter):
+    async def run():
+        async with AsyncPydanticQueryBuilder(adapter, 'db', 'people', Person) as builder:
+            return await builder.insert_many([Person(_id='a', name='Ada')])
+
+    assert asyncio.run(run()) == ['a']
+    assert adapter.create_consumer('db').consume()['people'].documents['a']['_id'] == 'a'
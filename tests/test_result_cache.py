@@ -0,0 +1,121 @@
+import asyncio
+import bson
+import pytest
+from mongo_helper import result_cache
+from mongo_helper.query_builder import AsyncQueryBuilder
+from mongo_helper.result_cache import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_the_namespace_ttl(clock):
+    cache = ResultCache(default_ttl=10, ttls={'db.hot': 1})
+    cache.put('db.items', 'a', {'v': 1}, 0)
+    cache.put('db.hot', 'b', {'v': 2}, 0)
+    clock[0] += 5
+    assert cache.get('a') == (True, {'v': 1})
+    assert cache.get('b') == (False, None)
+    clock[0] += 5
+    assert cache.get('a') == (False, None)
+    assert cache.get_stats()['expirations'] == 2 and cache.get_stats()['entries'] == 0
+
+
+def test_zero_ttl_is_not_cached():
+    cache = ResultCache(ttls={'db.live': 0})
+    cache.put('db.live', 'a', {'v': 1}, 0)
+    assert cache.get('a') == (False, None)
+
+
+def test_least_recently_used_entry_is_evicted_by_count():
+    cache = ResultCache(max_entries=2)
+    cache.put('db.items', 'a', {'v': 1}, 0)
+    cache.put('db.items', 'b', {'v': 2}, 0)
+    cache.get('a')
+    cache.put('db.items', 'c', {'v': 3}, 0)
+    assert [cache.get(key)[0] for key in 'abc'] == [True, False, True]
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_entries_are_evicted_by_bytes():
+    value = {'payload': 'x' * 100}
+    size = len(bson.encode(value))
+    cache = ResultCache(max_bytes=size * 2)
+    for key in 'abc':
+        cache.put('db.items', key, value, 0)
+    assert [cache.get(key)[0] for key in 'abc'] == [False, True, True]
+    assert cache.get_stats()['bytes'] == size * 2
+
+
+def test_value_larger_than_the_cache_is_not_stored():
+    cache = ResultCache(max_bytes=10)
+    cache.put('db.items', 'a', {'payload': 'x' * 100}, 0)
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_value_loaded_across_a_write_is_dropped():
+    cache = ResultCache()
+    generation = cache.generation('db.items')
+    cache.invalidate('db.items')
+    cache.put('db.items', 'a', {'v': 1}, generation)
+    assert cache.get('a') == (False, None)
+
+
+def test_reads_get_their_own_copy():
+    cache = ResultCache()
+    value = {'tags': ['a']}
+    cache.put('db.items', 'a', value, 0)
+    value['tags'].append('mutated after put')
+    found = cache.get('a')[1]
+    found['tags'].append('mutated after get')
+    assert cache.get('a') == (True, {'tags': ['a']})
+
+
+def test_builder_reads_are_cached_copied_and_invalidated_by_writes(adapter):
+    cache = adapter.enable_result_cache()
+
+    async def run():
+        async with AsyncQueryBuilder(adapter, 'db', 'items') as builder:
+            await builder.insert_one({'_id': 1, 'tags': ['a']})
+            first = await builder.find_one({'_id': 1})
+            first['tags'].append('mutated')
+            second = await builder.find_one({'_id': 1})
+            await builder.update_one({'_id': 1}, {'$set': {'tags': ['b']}})
+            third = await builder.find_one({'_id': 1})
+            return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert second == {'_id': 1, 'tags': ['a']}
+    assert third == {'_id': 1, 'tags': ['b']}
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 2
+
+
+def test_write_during_a_cached_load_keeps_the_stale_value_out(adapter):
+    cache = adapter.enable_result_cache()
+    collection = adapter.get_collection(adapter.create_consumer('db'), 'items')
+    collection.collection.store({'_id': 1, 'v': 'old'})
+    find_one = collection.collection.find_one
+
+    async def slow_find_one(query=None, projection=None, session=None, **kwargs):
+        result = await find_one(query, projection)
+        await asyncio.sleep(0.01)
+        return result
+
+    collection.collection.find_one = slow_find_one
+
+    async def run():
+        load = asyncio.ensure_future(collection.cached_read('find_one', {'_id': 1}, None,
+                                                            lambda: collection.find_one({'_id': 1})))
+        await asyncio.sleep(0)
+        await collection.update_one({'_id': 1}, {'$set': {'v': 'new'}})
+        stale = await load
+        fresh = await collection.cached_read('find_one', {'_id': 1}, None, lambda: collection.find_one({'_id': 1}))
+        return stale, fresh
+
+    stale, fresh = asyncio.run(run())
+    assert stale['v'] == 'old' and fresh['v'] == 'new'
+    assert cache.get_stats()['hits'] == 0
@@ -0,0 +1,72 @@
+import asyncio
+from benchmarks.fake import FakeSpawner
+from mongo_helper.single_flight import SingleFlight, canonical_key
+
+
+def slow_find_one(collection, calls):
+    # Counts the reads that reach the fake server and keeps them in flight long enough to overlap
+    find_one = collection.collection.find_one
+
+    async def counted_find_one(query=None, projection=None, session=None, **kwargs):
+        calls.append(query)
+        await asyncio.sleep(0.01)
+        return await find_one(query, projection)
+
+    collection.collection.find_one = counted_find_one
+
+
+def test_identical_reads_share_one_request(adapter):
+    adapter.enable_single_flight()
+    collection = adapter.get_collection(adapter.create_consumer('db'), 'items')
+    collection.collection.store({'_id': 1, 'tags': ['a']})
+    calls = []
+    slow_find_one(collection, calls)
+
+    async def run():
+        return await asyncio.gather(collection.find_one({'_id': 1}), collection.find_one({'_id': 1}),
+                                    collection.find_one({'_id': 2}))
+
+    leader, follower, other = asyncio.run(run())
+    assert calls == [{'_id': 1}, {'_id': 2}]
+    assert leader == follower == {'_id': 1, 'tags': ['a']} and other is None
+    follower['tags'].append('b')
+    assert leader['tags'] == ['a']
+    assert adapter.single_flight_stats() == {'db.items': {'calls': 3, 'executed': 2, 'merged': 1, 'in_flight': 0}}
+
+
+def test_sequential_reads_are_not_merged():
+    single_flight = SingleFlight()
+
+    async def run():
+        for _ in range(2):
+            await single_flight.do('key', lambda: asyncio.sleep(0, result=1))
+
+    asyncio.run(run())
+    assert single_flight.get_stats() == {'calls': 2, 'executed': 2, 'merged': 0, 'in_flight': 0}
+
+
+def test_followers_see_the_leader_error():
+    single_flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def run():
+        return await asyncio.gather(single_flight.do('key', fail), single_flight.do('key', fail),
+                                    return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(run())] == [ValueError, ValueError]
+    assert single_flight.get_stats()['executed'] == 1
+
+
+def test_key_order_matters():
+    assert canonical_key('db', {'a': 1, 'b': 2}) != canonical_key('db', {'b': 2, 'a': 1})
+    assert canonical_key('db', {'a': 1}) == canonical_key('db', {'a': 1})
+
+
+def test_single_flight_survives_a_rebuilt_collection_wrapper(adapter):
+    adapter.enable_single_flight()
+    adapter.get_collection(adapter.create_consumer('db'), 'items')
+    adapter.client_spawner = FakeSpawner()
+    assert adapter.get_collection(adapter.create_consumer('db'), 'items').single_flight is not None
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import pytest
+from loguru import logger
+from mongo_helper import slow_query
+from mongo_helper.query_builder import AsyncQueryBuilder
+from mongo_helper.slow_query import SlowQueryLog, query_shape
+
+
+EXPLAIN = {
+    'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'name_1'}}},
+    'executionStats': {'nReturned': 2, 'totalDocsExamined': 2, 'totalKeysExamined': 2, 'executionTimeMillis': 150},
+}
+
+
+class Database:
+    def __init__(self, name, explain=EXPLAIN):
+        self.name = name
+        self.explain = explain
+        self.commands = []
+
+    async def command(self, command):
+        self.commands.append(command)
+        if isinstance(self.explain, Exception):
+            raise self.explain
+        return self.explain
+
+
+class Collection:
+    def __init__(self, db_name='db', name='items', explain=EXPLAIN):
+        self.database = Database(db_name, explain)
+        self.name = name
+
+
+class CappedCollection:
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(document)
+
+
+@pytest.fixture
+def records():
+    records = []
+    sink_id = logger.add(lambda message: records.append(json.loads(message.record['message'])), format='{message}',
+                         filter=lambda record: record['extra'].get('slow_query', False))
+    yield records
+    logger.remove(sink_id)
+
+
+def check(log, *calls):
+    async def run():
+        for collection, operation, duration, query in calls:
+            log.check(collection, operation, duration, query)
+        await log.close()
+
+    asyncio.run(run())
+
+
+def test_query_shape_drops_literal_values():
+    query = {'name': 'Ada', 'age': {'$gt': 30}, '$or': [{'a': 1}, {'b': 'x'}], 'tags': ['x', 'y']}
+    assert query_shape(query) == {'name': 'str', 'age': {'$gt': 'int'}, '$or': [{'a': 'int'}], 'tags': 'array'}
+
+
+def test_only_operations_over_the_threshold_are_logged(records):
+    log = SlowQueryLog(threshold_ms=100, sample_rate=0)
+    collection = Collection()
+    check(log, (collection, 'find', 0.099, {'name': 'Ada'}), (collection, 'find', 0.1, {'name': 'Ada'}),
+          (collection, 'update_one', 0.25, None))
+    assert [(record['operation'], record['duration_ms']) for record in records] == [('find', 100.0),
+                                                                                    ('update_one', 250.0)]
+    assert records[0]['namespace'] == 'db.items'
+    assert records[0]['shape'] == {'name': 'str'}
+    assert records[1]['shape'] is None
+    assert collection.database.commands == []
+
+
+def test_per_namespace_thresholds_override_the_default(records):
+    log = SlowQueryLog(threshold_ms=100, sample_rate=0, thresholds={'db.hot': 10})
+    log.set_threshold('db.quiet', None)
+    items, hot, quiet = Collection(), Collection(name='hot'), Collection(name='quiet')
+    assert [log.threshold_for(namespace) for namespace in ('db.items', 'db.hot', 'db.quiet')] == [100, 10, None]
+    check(log, (items, 'find', 0.05, {}), (hot, 'find', 0.05, {}), (quiet, 'find', 10.0, {}))
+    assert [record['namespace'] for record in records] == ['db.hot']
+
+
+def test_sampled_reads_carry_an_explain_summary(records, monkeypatch):
+    monkeypatch.setattr(slow_query.random, 'random', iter([0.05, 0.5]).__next__)
+    log = SlowQueryLog(threshold_ms=100, sample_rate=0.1)
+    collection = Collection()
+    check(log, (collection, 'find', 0.2, {'name': 'Ada'}), (collection, 'find', 0.2, {'name': 'Bob'}))
+    assert collection.database.commands == [
+        {'explain': {'find': 'items', 'filter': {'name': 'Ada'}}, 'verbosity': 'executionStats'}]
+    summary = records[0]['explain']
+    assert (summary['stages'], summary['indexes'], summary['collscan']) == (['FETCH', 'IXSCAN'], ['name_1'], False)
+    assert (summary['n_returned'], summary['execution_time_ms']) == (2, 150)
+    assert 'explain' not in records[1]
+
+
+def test_writes_are_never_explained(records, monkeypatch):
+    monkeypatch.setattr(slow_query.random, 'random', lambda: 0.0)
+    log = SlowQueryLog(threshold_ms=0, sample_rate=1)
+    collection = Collection()
+    check(log, (collection, 'delete_many', 0.2, {'name': 'Ada'}))
+    assert collection.database.commands == []
+    assert 'explain' not in records[0]
+
+
+def test_explain_errors_are_recorded(records):
+    log = SlowQueryLog(threshold_ms=0, sample_rate=1)
+    check(log, (Collection(explain=RuntimeError('not authorized')), 'count_documents', 0.2, {}))
+    assert records[0]['explain_error'] == 'not authorized'
+    assert 'explain' not in records[0]
+
+
+def test_records_are_written_to_the_capped_collection(records):
+    capped = CappedCollection()
+    log = SlowQueryLog(threshold_ms=0, sample_rate=0, capped_collection=capped)
+    check(log, (Collection(), 'find', 0.2, {'name': 'Ada'}))
+    assert [document['operation'] for document in capped.documents] == ['find']
+    assert capped.documents[0]['shape'] == {'name': 'str'}
+
+
+def test_builder_threshold_applies_to_its_collection(adapter, records):
+    adapter.enable_slow_query_log(threshold_ms=None, sample_rate=0)
+
+    async def run():
+        async with AsyncQueryBuilder(adapter, 'db', 'items') as builder:
+            builder.set_slow_query_threshold(0)
+            await builder.find({'name': 'Ada'}, use_cache=False)
+        async with AsyncQueryBuilder(adapter, 'db', 'other') as builder:
+            await builder.find({'name': 'Ada'}, use_cache=False)
+        await adapter.slow_query_log.close()
+
+    asyncio.run(run())
+    assert [(record['namespace'], record['operation']) for record in records] == [('db.items', 'find')]
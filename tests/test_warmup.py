@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from benchmarks.fake import FakeClient
+from mongohelper import mongom
+from mongohelper.mongom import Mongoom
+
+
+class Admin:
+    # Counts pings and how many of them were in flight at once
+    def __init__(self, error=None):
+        self.error = error
+        self.commands = []
+        self.running = self.peak = 0
+
+    async def command(self, name):
+        self.commands.append(name)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0)
+        self.running -= 1
+        if self.error is not None:
+            raise self.error
+        return {'ok': 1}
+
+
+class WarmupClient(FakeClient):
+    def __init__(self, connection_string=None):
+        super().__init__()
+        self.connection_string = connection_string
+        self.admin = Admin()
+
+    async def server_info(self):
+        return {'version': '7.0.0'}
+
+
+def check_report(report, n_connections, collections):
+    assert report['connections'] == n_connections
+    assert sorted(report['collections']) == sorted(collections)
+    for key in ('server_selection_ms', 'pool_ms', 'total_ms'):
+        assert report[key] >= 0
+    assert report['total_ms'] >= report['pool_ms']
+
+
+def test_adapter_warmup_pings_concurrently_and_touches_collections(adapter):
+    admin = adapter.client_spawner.client.admin = Admin()
+    report = asyncio.run(adapter.warmup(4, ['items', 'users'], db_name='db'))
+    check_report(report, 4, ['items', 'users'])
+    assert admin.commands == ['ping'] * 5
+    assert admin.peak == 4
+    assert sorted(adapter.client_spawner.client['db'].collections) == ['items', 'users']
+    assert adapter.client_spawner.clients == {}
+
+
+def test_adapter_warmup_releases_its_consumer_on_failure(adapter):
+    adapter.client_spawner.client.admin = Admin(ConnectionError('no server'))
+    with pytest.raises(ConnectionError):
+        asyncio.run(adapter.warmup(2, db_name='db'))
+    assert adapter.client_spawner.clients == {}
+
+
+@pytest.fixture
+def mongoom(monkeypatch):
+    # Mongoom is a singleton, so every attribute the tests set is restored afterwards
+    mongoom = Mongoom()
+    for name in ('initialized', 'connection_string', 'motor_client', 'warmup_report'):
+        monkeypatch.setattr(mongoom, name, getattr(mongoom, name, None), raising=False)
+    monkeypatch.setattr(mongom, 'AsyncIOMotorClient', WarmupClient)
+    return mongoom
+
+
+def test_mongoom_warmup(mongoom):
+    mongoom.motor_client = WarmupClient()
+    report = asyncio.run(mongoom.warmup(3, [('db', 'items'), ('other', 'users')]))
+    check_report(report, 3, ['db.items', 'other.users'])
+    assert mongoom.motor_client.admin.commands == ['ping'] * 4
+    assert mongoom.motor_client.admin.peak == 3
+
+
+@pytest.mark.parametrize('warmup', [0, 2])
+def test_init_mongoo_warms_up_when_asked(mongoom, warmup):
+    assert asyncio.run(mongoom.init_mongoo('mongodb://example:27017', warmup, [('db', 'items')]))
+    assert mongoom.motor_client.connection_string == 'mongodb://example:27017'
+    if warmup:
+        check_report(mongoom.warmup_report, 2, ['db.items'])
+    else:
+        assert mongoom.warmup_report is None
+        assert mongoom.motor_client.admin.commands == []
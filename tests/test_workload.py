@@ -0,0 +1,81 @@
+import asyncio
+import json
+import threading
+import pytest
+from mongo_helper.workload import WorkloadRecorder, read_workload, replay_workload
+
+
+@pytest.mark.parametrize('name', ['workload.jsonl', 'workload.jsonl.gz'])
+def test_entries_are_written_off_the_calling_thread_in_order(tmp_path, name):
+    path = tmp_path / name
+    recorder = WorkloadRecorder(path, flush_every=3)
+    writer_threads = set()
+    write_lines = recorder.write_lines
+
+    def tracked_write_lines(file, lines):
+        writer_threads.add(threading.current_thread())
+        write_lines(file, lines)
+
+    recorder.write_lines = tracked_write_lines
+    for index in range(10):
+        recorder.record('find_one', 'db.items', index, 0.001, query={'k': index})
+    assert len(recorder.buffer) == 1
+    recorder.close()
+
+    assert writer_threads and threading.current_thread() not in writer_threads
+    assert [entry['t'] for entry in read_workload(path)] == list(range(10))
+
+
+def test_flush_wait_puts_buffered_entries_on_disk(tmp_path):
+    path = tmp_path / 'workload.jsonl'
+    recorder = WorkloadRecorder(path)
+    recorder.record('insert_one', 'db.items', 1.0, payload={'_id': 1})
+    assert path.read_text() == ''
+    recorder.flush(wait=True)
+    assert [entry['op'] for entry in read_workload(path)] == ['insert_one']
+    recorder.close()
+    recorder.record('insert_one', 'db.items', 2.0)
+    assert len(list(read_workload(path))) == 1
+
+
+def test_quiet_recorder_flushes_on_a_timer(tmp_path):
+    path = tmp_path / 'workload.jsonl'
+    recorder = WorkloadRecorder(path, flush_interval=0.01)
+
+    async def run():
+        recorder.record('find_one', 'db.items', 1.0, query={'k': 1})
+        await asyncio.sleep(0.05)
+        recorder.writer.submit(lambda: None).result()
+
+    asyncio.run(run())
+    assert [entry['op'] for entry in read_workload(path)] == ['find_one']
+    recorder.close()
+
+
+def write_log(path, entries):
+    path.write_text(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+
+@pytest.mark.parametrize('allow_destructive, remaining', [(False, 3), (True, 0)])
+def test_deletes_rebuilt_from_shapes_need_allow_destructive(adapter, tmp_path, allow_destructive, remaining):
+    # The fake collection has no range operators, so the documents match the placeholder filter {'age': 0} itself
+    collection = adapter.create_consumer('db').consume()['people']
+    for _ in range(3):
+        collection.store({'age': 0})
+    path = tmp_path / 'workload.jsonl'
+    write_log(path, [{'t': 0, 'op': 'delete_many', 'ns': 'db.people', 'shape': {'age': 'int'}},
+                     {'t': 0, 'op': 'find_one', 'ns': 'db.people', 'shape': {'age': 'int'}}])
+    report = asyncio.run(replay_workload(adapter, path, speed=None, allow_destructive=allow_destructive))
+    assert len(collection.documents) == remaining
+    assert report['skipped'] == ({} if allow_destructive else {'delete_many': 1})
+    assert report['operations'] == (2 if allow_destructive else 1)
+
+
+def test_deletes_with_captured_values_are_replayed(adapter, tmp_path):
+    collection = adapter.create_consumer('db').consume()['people']
+    collection.store({'_id': 1})
+    collection.store({'_id': 2})
+    path = tmp_path / 'workload.jsonl'
+    write_log(path, [{'t': 0, 'op': 'delete_one', 'ns': 'db.people', 'shape': {'_id': 'int'}, 'q': {'_id': 1}}])
+    report = asyncio.run(replay_workload(adapter, path, speed=None))
+    assert list(collection.documents) == [2] and report['skipped'] == {}